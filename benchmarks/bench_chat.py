@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark chat decoding over the recorded chat corpus.
+
+Compares the old double ``json.loads`` path of ``Trashbag.is_whisper`` and
+``Trashbag.get_msg_sender`` with :func:`trashbags.chat.decode_chat`, both
+with a cold and a warm cache.
+
+    python benchmarks/bench_chat.py [-n ROUNDS] [-c CORPUS]
+"""
+
+import json
+import os
+import timeit
+from optparse import OptionParser
+
+from trashbags import chat
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS = os.path.join(HERE, "data", "chat_corpus.jsonl")
+
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as corpus:
+        return [line.rstrip("\n") for line in corpus if line.strip()]
+
+
+def legacy(payloads):
+    for payload in payloads:
+        if "color" in json.loads(payload):
+            json_data = json.loads(payload)
+            for component in json_data.get("extra", ()):
+                if component.get("color") == "light_purple":
+                    break
+
+
+def decode_cold(payloads):
+    chat.decode_chat.cache_clear()
+    for payload in payloads:
+        message = chat.decode_chat(payload)
+        if message.kind == chat.WHISPER:
+            message.sender
+
+
+def decode_warm(payloads):
+    for payload in payloads:
+        message = chat.decode_chat(payload)
+        if message.kind == chat.WHISPER:
+            message.sender
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--rounds", dest="rounds", type="int", default=2000)
+    parser.add_option("-c", "--corpus", dest="corpus", default=DEFAULT_CORPUS)
+    (options, args) = parser.parse_args()
+
+    payloads = load_corpus(options.corpus)
+    total = len(payloads) * options.rounds
+    print(f"corpus: {len(payloads)} packets, backend: {chat.JSON_BACKEND}")
+
+    for name, func in (
+        ("legacy", legacy),
+        ("decode_chat (cold)", decode_cold),
+        ("decode_chat (warm)", decode_warm),
+    ):
+        elapsed = timeit.timeit(lambda: func(payloads), number=options.rounds)
+        print(
+            f"{name:<20} {total / elapsed:>12,.0f} packets/s "
+            f"{elapsed / total * 1e6:>8.2f} us/packet"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Read throughput of recorded traffic, decoding everything or on demand.
+
+Feeds the clientbound play packets of a ``--capture`` file through pyCraft's
+packet classes twice: decoding every packet on read, as pyCraft does, then
+with the lazy classes a :class:`~trashbags.decoding.DecodingPolicy` installs
+for packets the bot has no listener for. ``--dump`` also formats every
+packet, as ``--dump-packets`` does. Needs pyCraft.
+
+    python benchmarks/bench_decoding.py bot.cap [-r ROUNDS] [--dump]
+"""
+
+import sys
+import time
+from optparse import OptionParser
+
+from trashbags.capture import INCOMING, play_packets, read_capture
+from trashbags.decoding import DecodingPolicy
+
+
+class Listener:
+    def __init__(self, *packets):
+        self.packets_to_listen = list(packets)
+
+
+class BotListeners:
+    """The packet types a bot with default options listens to."""
+
+    def __init__(self):
+        from minecraft.networking.packets import clientbound
+
+        play = clientbound.play
+        self.packet_listeners = [
+            Listener(
+                play.JoinGamePacket,
+                play.ChatMessagePacket,
+                play.PlayerPositionAndLookPacket,
+                play.PlayerListItemPacket,
+                play.RespawnPacket,
+                play.DisconnectPacket,
+            )
+        ]
+
+
+def read_all(frames, classes, context, dump):
+    from minecraft.networking.packets import PacketBuffer
+
+    began = time.perf_counter()
+    for packet_id, payload in frames:
+        buffer = PacketBuffer()
+        buffer.send(payload)
+        buffer.reset_cursor()
+        packet = classes[packet_id]()
+        packet.context = context
+        packet.read(buffer)
+        if dump:
+            str(packet)
+    return time.perf_counter() - began
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] CAPTURE")
+    parser.add_option("-r", "--rounds", dest="rounds", type="int", default=5)
+    parser.add_option("--dump", dest="dump", action="store_true")
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("expected one capture file")
+
+    context, known = play_packets()
+    if context is None:
+        sys.exit("pyCraft is needed to decode packets")
+    eager = {
+        packet_id: packet_class
+        for (direction, packet_id), packet_class in known.items()
+        if direction == INCOMING
+    }
+    lazy = dict(eager)
+    DecodingPolicy(BotListeners(), catch_all=(), eager=()).apply(lazy)
+
+    frames = [
+        (record.packet_id, record.payload)
+        for record in read_capture(args[0])
+        if record.incoming and record.play and record.packet_id in eager
+    ]
+    size = sum(len(payload) for _, payload in frames)
+    deferred = sum(lazy[packet_id] is not eager[packet_id] for packet_id, _ in frames)
+    print(
+        f"{len(frames):,} packets, {size / 2**20:.1f} MiB, "
+        f"{deferred:,} without a listener"
+    )
+
+    for label, classes in (("decode all", eager), ("on demand", lazy)):
+        elapsed = min(
+            read_all(frames, classes, context, options.dump)
+            for _ in range(options.rounds)
+        )
+        print(
+            f"{label}: {len(frames) / elapsed:,.0f} packets/s, "
+            f"{size / elapsed / 2**20:,.1f} MiB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
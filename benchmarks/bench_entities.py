@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Entity tracker cost with thousands of entities in view.
+
+Spawns ``--entities`` mobs scattered around the bot, then replays ticks of
+relative moves, each followed by a range and a nearest query, as a crowded
+server would. Reports the tick cost and the memory held per entity, which
+should both stay flat as the crowd grows.
+
+    python benchmarks/bench_entities.py [-e ENTITIES] [-t TICKS] [-r RADIUS]
+"""
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from trashbags.entities import MOB, EntityTracker
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-e", "--entities", dest="entities", type="int", default=5000)
+    parser.add_option("-t", "--ticks", dest="ticks", type="int", default=200)
+    parser.add_option("-r", "--radius", dest="radius", type="float", default=16.0)
+    (options, args) = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    count = options.entities
+    positions = rng.uniform(-160, 160, (count, 3))
+    positions[:, 1] = 64
+    tracker = EntityTracker()
+    began = time.perf_counter()
+    for entity_id, (x, y, z) in enumerate(positions):
+        tracker.spawn(entity_id, MOB, 54, x, y, z)
+    spawned = time.perf_counter() - began
+
+    # Every entity moves every tick, up to a quarter block per axis
+    deltas = rng.integers(-1024, 1024, (options.ticks, count, 3)).tolist()
+    center = (0.0, 64.0, 0.0)
+    moving = querying = 0.0
+    found = 0
+    for tick in deltas:
+        began = time.perf_counter()
+        for entity_id, (dx, dy, dz) in enumerate(tick):
+            tracker.move(entity_id, dx, dy, dz)
+        tracker.flush()
+        moving += time.perf_counter() - began
+        began = time.perf_counter()
+        found += len(tracker.within(center, options.radius)[0])
+        tracker.nearest(center, count=5)
+        querying += time.perf_counter() - began
+
+    arrays = (tracker.ids, tracker.kinds, tracker.types, tracker.positions)
+    held = sum(array.nbytes for array in arrays)
+    ticks = options.ticks
+    print(
+        f"{count:,} entities: spawned in {spawned * 1e3:.1f} ms, "
+        f"{held / count:.0f} bytes each in arrays"
+    )
+    print(
+        f"{ticks} ticks: moves {moving / ticks * 1e3:.2f} ms/tick "
+        f"({tracker.moves / moving:,.0f} moves/s), queries "
+        f"{querying / ticks * 1e3:.3f} ms/tick, "
+        f"{found / ticks:.1f} within {options.radius:g} blocks"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Chat ingest and search through :class:`trashbags.events.EventStore`.
+
+Records ``--messages`` chat lines from ``--players`` senders as fast as a
+listener could, while the background writer commits them, and reports the
+cost of one ``record`` call, the sustained ingest rate and how long a few
+searches take on the result. The same lines committed one by one, as a
+listener writing straight to SQLite would, are timed for comparison.
+
+    python benchmarks/bench_events.py [-m MESSAGES] [-p PLAYERS] [-d DIR]
+"""
+
+import os
+import random
+import tempfile
+import time
+import uuid
+from optparse import OptionParser
+
+from trashbags.chat import CHAT
+from trashbags.events import _INSERT, EventStore, connect
+
+WORDS = (
+    "anyone selling diamonds iron gold trade spawn base shop emeralds wood "
+    "stone farm nether portal coords lag restart hello thanks"
+).split()
+
+
+def make_messages(count, players):
+    people = [(f"player{i}", str(uuid.uuid4())) for i in range(players)]
+    rng = random.Random(1)
+    return [
+        (*rng.choice(people), " ".join(rng.choices(WORDS, k=rng.randint(2, 12))))
+        for _ in range(count)
+    ]
+
+
+def batched(path, messages):
+    # Large enough to hold everything, a listener never records this fast
+    store = EventStore(path, buffer=len(messages)).start()
+    record = store.record
+    began = time.perf_counter()
+    for sender, sender_uuid, text in messages:
+        record(CHAT, "bench", text, sender, sender_uuid)
+    recorded = time.perf_counter() - began
+    while store.committed < len(messages):
+        time.sleep(0.001)
+    committed = time.perf_counter() - began
+    commits = store.commits
+    store.close()
+    return recorded, committed, commits
+
+
+def one_by_one(path, messages):
+    connection, _ = connect(path)
+    began = time.perf_counter()
+    for sender, sender_uuid, text in messages:
+        with connection:
+            connection.execute(
+                _INSERT, (time.time(), None, "bench", CHAT, sender, sender_uuid, text)
+            )
+    elapsed = time.perf_counter() - began
+    connection.close()
+    return elapsed
+
+
+def timed(func, rounds=20):
+    began = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return (time.perf_counter() - began) / rounds, len(result)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-m", "--messages", dest="messages", type="int", default=200000)
+    parser.add_option("-p", "--players", dest="players", type="int", default=500)
+    parser.add_option("-d", "--dir", dest="dir", default=None)
+    (options, args) = parser.parse_args()
+
+    messages = make_messages(options.messages, options.players)
+    with tempfile.TemporaryDirectory(dir=options.dir) as directory:
+        path = os.path.join(directory, "events.db")
+        recorded, committed, commits = batched(path, messages)
+        count = len(messages)
+        print(f"{count} messages from {options.players} players")
+        print(f"record()           {recorded / count * 1e6:>9.2f} us/message")
+        print(
+            f"batched commits    {count / committed:>12,.0f} messages/s "
+            f"in {commits} commits"
+        )
+
+        sample = messages[: min(count, 2000)]
+        elapsed = one_by_one(os.path.join(directory, "single.db"), sample)
+        print(f"one commit each    {len(sample) / elapsed:>12,.0f} messages/s")
+
+        store = EventStore(path)
+        sender, sender_uuid, _ = messages[0]
+        now = time.time()
+        for name, func in (
+            ("by uuid", lambda: store.query(uuid=sender_uuid)),
+            ("by sender", lambda: store.query(sender=sender.upper())),
+            ("last minute", lambda: store.query(since=now - 60, limit=1000)),
+            ("text", lambda: store.query(text="diamonds emeralds")),
+            ("text, by uuid", lambda: store.query(text="trade", uuid=sender_uuid)),
+        ):
+            elapsed, rows = timed(func)
+            print(f"query {name:<14} {elapsed * 1e3:>7.2f} ms  {rows} rows")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+End-to-end load test of Trashbag bots against the fake 1.12.2 server.
+
+Starts a :class:`trashbags.fakeserver.FakeServer` on a background loop,
+connects ``--bots`` offline bots to it, then reports connection setup time,
+sustained packet throughput and resident memory per connected bot.
+Requires pyCraft.
+
+    python benchmarks/bench_fakeserver.py [-b BOTS] [--chat-rate N] [-t SECONDS]
+"""
+
+import asyncio
+import threading
+import time
+from optparse import OptionParser
+
+from trashbags.fakeserver import FakeServer
+from trashbags.fleet import resident_memory
+from trashbags.replay import replay_options
+from trashbags.trashbag import Trashbag
+
+
+def start_server(**kwargs):
+    loop = asyncio.new_event_loop()
+    server = FakeServer(port=0, **kwargs)
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--bots", dest="bots", type="int", default=100)
+    parser.add_option("--chat-rate", dest="chat_rate", type="float", default=20)
+    parser.add_option("--churn-rate", dest="churn_rate", type="float", default=5)
+    parser.add_option(
+        "--correction-rate", dest="correction_rate", type="float", default=1
+    )
+    parser.add_option("-t", "--time", dest="seconds", type="float", default=10)
+    (options, args) = parser.parse_args()
+
+    server = start_server(
+        chat_rate=options.chat_rate,
+        churn_rate=options.churn_rate,
+        correction_rate=options.correction_rate,
+    )
+    baseline = resident_memory()
+
+    start = time.perf_counter()
+    bots = []
+    for i in range(options.bots):
+        bot = Trashbag(
+            replay_options(username=f"bot{i}", address="127.0.0.1", port=server.port)
+        )
+        bot.login()
+        bot.connect()
+        bot.register_packet_listeners()
+        bots.append(bot)
+    while server.stats.logins < options.bots:
+        time.sleep(0.01)
+    connected = time.perf_counter() - start
+
+    sent = server.stats.packets_sent
+    time.sleep(options.seconds)
+    throughput = (server.stats.packets_sent - sent) / options.seconds
+    memory = resident_memory() - baseline
+    alive = sum(1 for bot in bots if bot.connection.connected)
+
+    stats = server.stats.as_dict()
+    print(f"bots connected:        {alive}/{options.bots} in {connected:.2f}s")
+    print(f"mean setup time:       {stats['mean_setup_time'] * 1e3:.2f} ms")
+    print(f"sustained throughput:  {throughput:,.0f} packets/s")
+    print(f"memory per bot:        {memory / options.bots / 1024:,.0f} KiB")
+
+    for bot in bots:
+        bot.connection.disconnect(immediate=True)
+
+
+if __name__ == "__main__":
+    main()
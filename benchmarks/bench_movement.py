@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Packets and bytes sent per metre travelled.
+
+A caller steers the bot along a zig-zag course, retargeting it
+``--updates`` times per game tick. The old path writes one packet per
+call; :class:`trashbags.movement.MovementQueue` coalesces them into at most
+one packet per tick. Ticks are simulated, so the run takes no wall time.
+
+    python benchmarks/bench_movement.py [-m METRES] [-u UPDATES]
+"""
+
+import math
+import time
+from optparse import OptionParser
+
+from trashbags.movement import POSITION_AND_LOOK_BYTES, MovementQueue, plan_steps
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+class CountingBot:
+    def __init__(self):
+        self.connection = object()
+        self.position = (0.0, 64.0, 0.0)
+        self.rotation = (0.0, 0.0)
+        self.packets = 0
+
+    def player_move(self, destination, rotation, on_ground=True):
+        self.packets += 1
+
+
+def course(metres, updates_per_tick, step):
+    """Targets a steering caller would emit, one list per tick."""
+    ticks = math.ceil(metres / step)
+    for tick in range(ticks):
+        yield [
+            (
+                (tick + (i + 1) / updates_per_tick) * step,
+                64.0,
+                math.sin((tick * updates_per_tick + i) / 50.0),
+            )
+            for i in range(updates_per_tick)
+        ]
+
+
+def travelled(points):
+    total = 0.0
+    for a, b in zip(points, points[1:]):
+        total += math.dist(a, b)
+    return total
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-m", "--metres", dest="metres", type="float", default=1000)
+    parser.add_option("-u", "--updates", dest="updates", type="int", default=10)
+    (options, args) = parser.parse_args()
+
+    legacy_bot = CountingBot()
+    queued_bot = CountingBot()
+    queue = MovementQueue(queued_bot, scheduler=None)
+    path = [legacy_bot.position]
+    for targets in course(options.metres, options.updates, queue.step):
+        for target in targets:
+            legacy_bot.player_move(target, legacy_bot.rotation)
+            queue.move_to(target)
+        queue.flush()
+        path.append(targets[-1])
+    while queue.flush():
+        pass
+
+    metres = travelled(path)
+    for name, bot in (("player_move", legacy_bot), ("MovementQueue", queued_bot)):
+        print(
+            f"{name:<14} {bot.packets:>8} packets "
+            f"{bot.packets / metres:>7.2f} packets/m "
+            f"{bot.packets * POSITION_AND_LOOK_BYTES / metres:>8.1f} bytes/m"
+        )
+
+    if np is not None:
+        waypoints = np.cumsum(np.random.default_rng(0).normal(size=(10000, 3)), axis=0)
+        for name, value in (("list", waypoints.tolist()), ("ndarray", waypoints)):
+            start = time.perf_counter()
+            steps = plan_steps((0.0, 0.0, 0.0), value, queue.step)
+            elapsed = time.perf_counter() - start
+            print(f"plan_steps({name}): {len(steps)} steps in {elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+A* throughput over a large synthetic map.
+
+Builds a ``--size`` x ``--size`` chunk world of rolling terrain strewn with
+two-block pillars, then searches corner to corner paths, first with cold
+walkability grids and then warm, and reports nodes expanded per second.
+
+    python benchmarks/bench_pathfinding.py [-s CHUNKS] [-d DENSITY] [-n SEARCHES]
+"""
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from trashbags.pathfinding import Pathfinder
+from trashbags.world import Chunk, ChunkSection, WorldCache
+
+STONE, GRASS, LOG = 1 << 4, 2 << 4, 17 << 4
+
+
+def build_world(size, density, seed=0):
+    rng = np.random.default_rng(seed)
+    blocks = size * 16
+    xs, zs = np.meshgrid(np.arange(blocks), np.arange(blocks), indexing="xy")
+    # Gentle hills between y = 60 and 66
+    heights = (63 + 3 * np.sin(xs / 23.0) * np.cos(zs / 31.0)).astype(int)
+    pillars = rng.random((blocks, blocks)) < density
+    world = WorldCache(max_bytes=2**40)
+    ys = np.arange(64, 80)[:, None, None]
+    low = np.arange(48, 64)[:, None, None]
+    for chunk_x in range(size):
+        for chunk_z in range(size):
+            area = (slice(chunk_z * 16, chunk_z * 16 + 16),) + (
+                slice(chunk_x * 16, chunk_x * 16 + 16),
+            )
+            top = heights[area][None]
+            pillar = pillars[area][None]
+            sections = {}
+            for section_y, y in ((3, low), (4, ys)):
+                states = np.where(y < top, STONE, 0)
+                states = np.where(y == top, GRASS, states)
+                states = np.where(pillar & (y > top) & (y <= top + 2), LOG, states)
+                sections[section_y] = ChunkSection.from_states(states)
+            world.chunks[chunk_x, chunk_z] = Chunk(chunk_x, chunk_z, sections)
+    return world, heights
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-s", "--size", dest="size", type="int", default=32)
+    parser.add_option("-d", "--density", dest="density", type="float", default=0.2)
+    parser.add_option("-n", "--searches", dest="searches", type="int", default=5)
+    parser.add_option("-b", "--budget", dest="budget", type="float", default=10.0)
+    (options, args) = parser.parse_args()
+
+    world, heights = build_world(options.size, options.density)
+    edge = options.size * 16 - 2
+    start = (1, int(heights[1, 1]) + 1, 1)
+    goal = (edge, int(heights[edge, edge]) + 1, edge)
+    print(
+        f"{options.size}x{options.size} chunks, {options.density:.0%} pillars, "
+        f"{start} -> {goal}"
+    )
+
+    for label in ("cold", "warm"):
+        pathfinder = Pathfinder(world, budget=options.budget)
+        if label == "warm":
+            pathfinder.find(start, goal)
+            pathfinder.expanded = pathfinder.elapsed = 0
+        runs = 1 if label == "cold" else options.searches
+        for _ in range(runs):
+            path = pathfinder.find(start, goal)
+        print(
+            f"{label}: {pathfinder.expanded / runs:,.0f} nodes in "
+            f"{pathfinder.elapsed / runs * 1e3:,.0f} ms per search, "
+            f"{pathfinder.nodes_per_sec:,.0f} nodes/s, "
+            f"{len(path.nodes)} nodes, {len(path.waypoints)} waypoints, "
+            f"complete={path.complete}"
+        )
+    began = time.perf_counter()
+    pathfinder.find(start, goal, budget=0.05)
+    print(f"50 ms budget: returned after {(time.perf_counter() - began) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Physics tick cost for many bots stepped in one batch.
+
+Drops ``--bots`` bots from random heights over a flat world and walks them
+to random points once they land, stepping them all each tick as one
+:class:`~trashbags.physics.PhysicsEngine` batch. Reports the tick cost,
+total and per bot, against stepping each bot alone.
+
+    python benchmarks/bench_physics.py [-b BOTS] [-t TICKS] [-c CHUNKS]
+"""
+
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from trashbags.movement import MovementQueue
+from trashbags.pathfinding import Walkability
+from trashbags.physics import PhysicsEngine
+from trashbags.world import Chunk, ChunkSection, WorldCache
+
+STONE = 1 << 4
+
+
+class Bot:
+    class options:
+        username = "bench"
+
+    def __init__(self, position):
+        self.connection = object()
+        self.spawned = True
+        self.position = position
+        self.rotation = (0.0, 0.0)
+        self.movement = MovementQueue(self, scheduler=None)
+
+    def player_move(self, destination, rotation, on_ground=True):
+        pass
+
+
+def flat_world(chunks):
+    world = WorldCache()
+    states = np.zeros((16, 16, 16), dtype=np.uint32)
+    states[:4] = STONE
+    for chunk_x in range(chunks):
+        for chunk_z in range(chunks):
+            section = ChunkSection.from_states(states)
+            world.chunks[chunk_x, chunk_z] = Chunk(chunk_x, chunk_z, {0: section})
+    return world
+
+
+def simulate(world, starts, targets, ticks, batch):
+    bots = [Bot(start) for start in starts]
+    engines = [PhysicsEngine()] if batch else [PhysicsEngine() for _ in bots]
+    walkability = Walkability(world)
+    for index, bot in enumerate(bots):
+        engines[0 if batch else index].add(bot, walkability)
+    for bot, target in zip(bots, targets):
+        bot.movement.move_to(target)
+    began = time.perf_counter()
+    for _ in range(ticks):
+        for engine in engines:
+            engine.tick()
+    return time.perf_counter() - began
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-b", "--bots", dest="bots", type="int", default=200)
+    parser.add_option("-t", "--ticks", dest="ticks", type="int", default=200)
+    parser.add_option("-c", "--chunks", dest="chunks", type="int", default=8)
+    (options, args) = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    size = options.chunks * 16 - 2
+    count = options.bots
+    starts = [
+        (float(x), float(y), float(z))
+        for x, y, z in zip(
+            rng.uniform(1, size, count),
+            rng.uniform(4, 20, count),
+            rng.uniform(1, size, count),
+        )
+    ]
+    targets = [(float(x), 4.0, float(z)) for x, z in rng.uniform(1, size, (count, 2))]
+    world = flat_world(options.chunks)
+
+    for label, batch in (("one batch", True), ("bot by bot", False)):
+        elapsed = simulate(world, starts, targets, options.ticks, batch)
+        per_tick = elapsed / options.ticks
+        print(
+            f"{count} bots, {label}: {per_tick * 1e3:.2f} ms/tick, "
+            f"{per_tick / count * 1e6:.1f} us per bot"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Replay join/leave storms through :class:`trashbags.players.PlayerRegistry`.
+
+Each round adds ``--players`` players in batched ``PlayerListItemPacket``
+lookalikes, churns latency updates, then removes them one packet per
+player, and compares against the old ``user_list`` dict rebuild.
+
+    python benchmarks/bench_players.py [-p PLAYERS] [-b BATCH] [-n ROUNDS]
+"""
+
+import time
+import uuid
+from optparse import OptionParser
+from types import SimpleNamespace
+
+from trashbags.players import PlayerRegistry
+
+
+def action_type(name):
+    return type(name, (), {})
+
+
+AddPlayerAction = action_type("AddPlayerAction")
+RemovePlayerAction = action_type("RemovePlayerAction")
+UpdateLatencyAction = action_type("UpdateLatencyAction")
+
+
+def make_storm(players, batch):
+    people = [
+        SimpleNamespace(uuid=str(uuid.uuid4()), name=f"player{i}", gamemode=0, ping=50)
+        for i in range(players)
+    ]
+    packets = []
+    for start in range(0, players, batch):
+        packets.append(
+            SimpleNamespace(action_type=AddPlayerAction, actions=people[start:][:batch])
+        )
+    packets.append(SimpleNamespace(action_type=UpdateLatencyAction, actions=people))
+    for person in people:
+        packets.append(
+            SimpleNamespace(action_type=RemovePlayerAction, actions=[person])
+        )
+    return packets
+
+
+def legacy(packets):
+    user_list = {}
+    for packet in packets:
+        if packet.action_type.__name__ == "AddPlayerAction":
+            user_list[packet.actions[0].name] = packet.actions[0].uuid
+        if packet.action_type.__name__ == "RemovePlayerAction":
+            user_list = {
+                k: v for k, v in user_list.items() if v != packet.actions[0].uuid
+            }
+
+
+def registry(packets):
+    players = PlayerRegistry()
+    for packet in packets:
+        players.apply(packet)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-p", "--players", dest="players", type="int", default=1000)
+    parser.add_option("-b", "--batch", dest="batch", type="int", default=1)
+    parser.add_option("-n", "--rounds", dest="rounds", type="int", default=5)
+    (options, args) = parser.parse_args()
+
+    packets = make_storm(options.players, options.batch)
+    print(f"{options.players} players, {len(packets)} packets per round")
+    for name, func in (("legacy user_list", legacy), ("PlayerRegistry", registry)):
+        start = time.perf_counter()
+        for _ in range(options.rounds):
+            func(packets)
+        elapsed = time.perf_counter() - start
+        total = len(packets) * options.rounds
+        print(
+            f"{name:<18} {total / elapsed:>12,.0f} packets/s "
+            f"{elapsed / options.rounds * 1e3:>9.2f} ms/storm"
+        )
+
+
+if __name__ == "__main__":
+    main()
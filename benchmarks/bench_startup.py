@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Start-up cost of a bot process, checked against a tracked budget.
+
+Measures, each in fresh interpreters:
+
+* import: the ``python -X importtime`` cumulative time of ``import main``,
+  with the modules that cost the most by themselves
+* connected: from spawning a process to its bot joining a local
+  :class:`trashbags.fakeserver.FakeServer`, skipped without pyCraft
+
+Both are compared with the budget in ``benchmarks/data/startup.json`` and the
+run fails when one is exceeded. ``--record`` appends the results to the
+file's history under the current version, so they can be followed across
+releases.
+
+    python benchmarks/bench_startup.py [-n RUNS] [--record]
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from optparse import OptionParser
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(os.path.dirname(HERE), "src")
+BUDGET = os.path.join(HERE, "data", "startup.json")
+
+# The connection is built and listened to before it connects, the local
+# server may send the join before connect() returns
+CONNECT = """
+import sys, threading
+from trashbags.connection import TrashbagConnection
+from trashbags.protocol import VERSION, registry
+from trashbags.replay import replay_options
+from trashbags.trashbag import Trashbag
+
+options = replay_options(address="127.0.0.1", port=int(sys.argv[1]))
+bot = Trashbag(options)
+joined = threading.Event()
+bot.connection = TrashbagConnection(
+    options.address, options.port, None, options.username, VERSION
+)
+bot.connection.register_packet_listener(
+    lambda packet: joined.set(), registry().clientbound.JoinGamePacket
+)
+bot.register_packet_listeners()
+bot.connection.connect()
+print("joined" if joined.wait(10) else "timeout", flush=True)
+bot.connection.disconnect(immediate=True)
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (SOURCE, env.get("PYTHONPATH"))))
+    return env
+
+
+def parse_importtime(output):
+    """Self and cumulative microseconds per module of ``-X importtime`` output.
+
+    Returns:
+      list: (module, self_us, cumulative_us, depth) in import order
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(own), int(cumulative), depth))
+    return modules
+
+
+def measure_import(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = parse_importtime(result.stderr)
+    total = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+    return total / 1e3, modules
+
+
+def measure_connected(env):
+    try:
+        import minecraft  # noqa: F401
+    except ImportError:
+        return None
+    from trashbags.fakeserver import FakeServer
+
+    loop = asyncio.new_event_loop()
+    server = FakeServer(port=0)
+    loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    try:
+        began = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-c", CONNECT, str(server.port)],
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        line = process.stdout.readline().strip()
+        elapsed = time.perf_counter() - began
+        process.wait()
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+    if line != "joined":
+        raise RuntimeError(f"bot did not join the fake server: {line!r}")
+    return elapsed * 1e3
+
+
+def load_budget():
+    with open(BUDGET) as budget:
+        return json.load(budget)
+
+
+def record(tracked, results):
+    sys.path.insert(0, SOURCE)
+    from trashbags import __version__
+
+    tracked["history"].append(
+        dict(results, version=__version__, python=sys.version.split()[0])
+    )
+    with open(BUDGET, "w") as budget:
+        json.dump(tracked, budget, indent=2)
+        budget.write("\n")
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--runs", dest="runs", type="int", default=5)
+    parser.add_option("-t", "--top", dest="top", type="int", default=10)
+    parser.add_option(
+        "--record",
+        dest="record",
+        action="store_true",
+        help="append the results to the tracked history",
+    )
+    (options, args) = parser.parse_args()
+
+    env = environment()
+    runs = [measure_import(env) for _ in range(options.runs)]
+    import_ms, modules = min(runs, key=lambda run: run[0])
+    print(f"import main: {import_ms:.1f} ms (best of {options.runs})")
+    for name, own, cumulative, depth in sorted(modules, key=lambda m: -m[1])[
+        : options.top
+    ]:
+        print(f"  {own / 1e3:7.1f} ms self {cumulative / 1e3:7.1f} ms total  {name}")
+
+    results = {"import_ms": round(import_ms, 1)}
+    connected = [measure_connected(env) for _ in range(options.runs)]
+    if connected[0] is None:
+        print("connected: skipped, pyCraft is not installed")
+    else:
+        results["connected_ms"] = round(min(connected), 1)
+        print(f"connected: {results['connected_ms']:.1f} ms (best of {options.runs})")
+
+    tracked = load_budget()
+    over = [
+        f"{key} {value} > {tracked['budget'][key]}"
+        for key, value in results.items()
+        if value > tracked["budget"][key]
+    ]
+    if options.record:
+        record(tracked, results)
+    if over:
+        sys.exit("over budget: " + ", ".join(over))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Chunk decode throughput and memory per loaded chunk.
+
+Builds ``--chunks`` synthetic 1.12.2 chunk payloads (layered terrain with
+scattered ores, plus a share of noisy sections that need the global
+palette), loads them into a :class:`trashbags.world.WorldCache`, then times
+column heights and an ore search around the centre.
+
+    python benchmarks/bench_world.py [-c CHUNKS] [-s SECTIONS] [-n NOISY]
+"""
+
+import time
+import tracemalloc
+from optparse import OptionParser
+
+import numpy as np
+
+from trashbags.fleet import resident_memory
+from trashbags.world import WorldCache, encode_chunk
+
+STONE, DIRT, GRASS, COAL_ORE, DIAMOND_ORE = 1 << 4, 3 << 4, 2 << 4, 16 << 4, 56 << 4
+
+
+def make_sections(rng, count, noisy):
+    sections = {}
+    for section_y in range(count):
+        states = np.full(4096, STONE, dtype=np.uint32)
+        states[rng.random(4096) < 0.01] = COAL_ORE
+        states[rng.random(4096) < 0.001] = DIAMOND_ORE
+        if section_y == count - 1:
+            states = states.reshape(16, 16, 16)
+            states[12:15], states[15] = DIRT, GRASS
+        if noisy:
+            states = rng.integers(0, 400, 4096, dtype=np.uint32) << 4
+        sections[section_y] = states
+    return sections
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-c", "--chunks", dest="chunks", type="int", default=1024)
+    parser.add_option("-s", "--sections", dest="sections", type="int", default=4)
+    parser.add_option(
+        "-n",
+        "--noisy",
+        dest="noisy",
+        type="float",
+        default=0.1,
+        help="share of chunks using the global palette",
+    )
+    (options, args) = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    side = int(options.chunks**0.5)
+    payloads = [
+        encode_chunk(
+            x - side // 2,
+            z - side // 2,
+            make_sections(rng, options.sections, rng.random() < options.noisy),
+        )
+        for x in range(side)
+        for z in range(side)
+    ]
+    wire = sum(len(payload) for payload in payloads)
+
+    world = WorldCache(max_bytes=2**40)
+    tracemalloc.start()
+    rss = resident_memory()
+    start = time.perf_counter()
+    for payload in payloads:
+        world.load(payload)
+    elapsed = time.perf_counter() - start
+    rss = resident_memory() - rss
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    count = len(payloads)
+    print(
+        f"decode: {count} chunks of {options.sections} sections in {elapsed:.3f}s, "
+        f"{count / elapsed:,.0f} chunks/s, {wire / elapsed / 2**20:,.1f} MiB/s"
+    )
+    print(
+        f"memory: {traced / count / 1024:.1f} KiB/chunk traced, "
+        f"{rss / count / 1024:.1f} KiB/chunk resident, "
+        f"{world.nbytes / count / 1024:.1f} KiB/chunk accounted, "
+        f"raw states {options.sections * 4096 * 2 / 1024:.1f} KiB/chunk"
+    )
+
+    start = time.perf_counter()
+    for x, z in world.chunks:
+        world.column_heights(x, z)
+    elapsed = time.perf_counter() - start
+    print(f"heights: {count / elapsed:,.0f} chunks/s")
+
+    start = time.perf_counter()
+    ores = world.find_blocks([56], (0, 32, 0), 64)
+    elapsed = time.perf_counter() - start
+    print(f"find diamond ore within 64: {len(ores)} found in {elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""
+Benchmarks for trashbags, run with::
+
+    pytest benchmarks --benchmark-only -o addopts=""
+
+They need pyCraft and pytest-benchmark (``pip install trashbags[benchmark]``).
+"""
+
+import pytest
+
+pytest.importorskip("minecraft")
+pytest.importorskip("pytest_benchmark")
@@ -1,15 +1,29 @@
 #!/usr/bin/env python
 
+import asyncio
 import getpass
 import logging
 import os
-import re
 import sys
+from functools import partial
 from optparse import OptionParser
 
 from dotenv import load_dotenv
 
 # from minecraft.networking.packets import serverbound
+from trashbags.acl import AccessList
+from trashbags.auth import DEFAULT_CACHE, LoginError, TokenCache, TokenManager
+from trashbags.commands import CONSOLE, CommandContext, default_router
+from trashbags.events import EventStore
+from trashbags.fleet import Fleet, load_roster, parse_address
+from trashbags.metrics import Metrics
+from trashbags.profiling import Profiler
+from trashbags.protocol import prebuild
+from trashbags.runtime import Runtime
+from trashbags.scheduler import Scheduler
+from trashbags.shards import ShardPool, ShardWorker
+from trashbags.supervisor import ConnectionSupervisor
+from trashbags.ticks import TickLoop
 from trashbags.trashbag import Trashbag
 
 __author__ = "Targeted Entropy"
@@ -80,6 +94,30 @@ def get_options():
         help="include unknown packets in --dump-packets output",
     )
 
+    parser.add_option(
+        "--decode-all",
+        dest="decode_all",
+        action="store_true",
+        help="decode every packet on read, not only those a listener "
+        "asks for by type",
+    )
+
+    parser.add_option(
+        "-c",
+        "--capture",
+        dest="capture",
+        default=None,
+        help="record packets to this capture file, {name} is replaced by the "
+        "account name (read it with python -m trashbags.capture)",
+    )
+
+    parser.add_option(
+        "--capture-gzip",
+        dest="capture_gzip",
+        action="store_true",
+        help="gzip the --capture file",
+    )
+
     parser.add_option(
         "-m",
         "--microsoft",
@@ -88,6 +126,106 @@ def get_options():
         help="Enable Microsoft Auth",
     )
 
+    parser.add_option(
+        "-r",
+        "--roster",
+        dest="roster",
+        default=None,
+        help="run every account of this roster file in one process",
+    )
+
+    parser.add_option(
+        "--stagger",
+        dest="stagger",
+        type="float",
+        default=2.0,
+        help="seconds between bot start-ups in roster mode",
+    )
+
+    parser.add_option(
+        "--shards",
+        dest="shards",
+        type="int",
+        default=None,
+        help="run the roster's accounts in this many worker processes, 0 for "
+        "one per CPU; console commands go to every worker",
+    )
+
+    parser.add_option(
+        "--token-cache",
+        dest="token_cache",
+        default=DEFAULT_CACHE,
+        help="file caching session tokens between runs (default: %default)",
+    )
+
+    parser.add_option(
+        "--no-token-cache",
+        dest="token_cache",
+        action="store_const",
+        const=None,
+        help="always log in over the network",
+    )
+
+    parser.add_option(
+        "-a",
+        "--acl",
+        dest="acl",
+        default=None,
+        help="file listing the players allowed to command the bots, by role; "
+        "reloaded when it changes",
+    )
+
+    parser.add_option(
+        "--snapshots",
+        dest="snapshots",
+        default=None,
+        metavar="DIR",
+        help="save each bot's position, players and chunks under DIR and "
+        "start from them on the next run",
+    )
+
+    parser.add_option(
+        "--events",
+        dest="events",
+        default=None,
+        metavar="DB",
+        help="log chat, whispers, joins and leaves to the SQLite database DB; "
+        "search it with trashbags-events",
+    )
+
+    parser.add_option(
+        "--world-memory",
+        dest="world_memory",
+        type="int",
+        default=64,
+        help="MiB of chunks kept per bot, 0 to ignore the world and its "
+        "entities (needs NumPy, default: %default)",
+    )
+
+    parser.add_option(
+        "--workers",
+        dest="workers",
+        type="int",
+        default=4,
+        help="threads for blocking packet handlers and console commands",
+    )
+
+    parser.add_option(
+        "--metrics-port",
+        dest="metrics_port",
+        type="int",
+        default=None,
+        help="serve Prometheus metrics on this local port",
+    )
+
+    parser.add_option(
+        "--metrics-log",
+        dest="metrics_log",
+        type="float",
+        default=None,
+        help="log a metrics snapshot every this many seconds",
+    )
+
     parser.add_option(
         "-x",
         "--verbose",
@@ -97,9 +235,18 @@ def get_options():
         const=logging.DEBUG,
     )
 
+    parser.add_option(
+        "--profile",
+        dest="profile",
+        default=None,
+        metavar="FILE",
+        help="sample the bot's threads and write flamegraph stacks to FILE "
+        "on exit, with a report of the slowest packet handlers",
+    )
+
     (options, args) = parser.parse_args()
 
-    if not options.microsoft:
+    if not options.microsoft and not options.roster:
         if not options.username:
             options.username = input("Enter your username: ")
 
@@ -109,28 +256,21 @@ def get_options():
             )
             options.offline = options.offline or (options.password == "")
 
-    if not options.server:
+    if not options.server and not options.roster:
         options.server = input(
             "Enter server host or host:port "
             "(enclose IPv6 addresses in square brackets): "
         )
-    # Try to split out port and address
-    match = re.match(
-        r"((?P<host>[^\[\]:]+)|\[(?P<addr>[^\[\]]+)\])" r"(:(?P<port>\d+))?$",
-        options.server,
-    )
-    if match is None:
-        raise ValueError("Invalid server address: '%s'." % options.server)
-    options.address = match.group("host") or match.group("addr")
-    options.port = int(match.group("port") or 25565)
+    # Try to split out port and address, roster accounts may set their own
+    if options.server:
+        options.address, options.port = parse_address(options.server)
 
     # Load Env Options
     load_dotenv()
     auth_list = os.getenv("AUTH_LIST")
-    if auth_list:
-        options.auth_list = auth_list.split(",")
+    options.auth_list = auth_list.split(",") if auth_list else []
 
-    print(options.auth_list)
+    _logger.debug("Authorized players: %s", options.auth_list)
     return options
 
 
@@ -146,43 +286,284 @@ def setup_logging(loglevel):
     )
 
 
-def main():
-    options = get_options()
+def test_move(trash):
+    print("Testing...")
+    print(f"Old: {trash.position}")
+    new_pos = (trash.position[0] + 1, trash.position[1], trash.position[2])
+    print(f"new_pos: {new_pos}")
 
-    trash = Trashbag(options)
+    trash.walk_to(new_pos)
 
-    # Perform login
-    trash.login()
+    new_pos = (new_pos[0] + 1, new_pos[1], new_pos[2])
+    print(f"new_pos: {new_pos}")
 
-    # Connec to the server
-    trash.connect()
+    # Supersedes the first move, the queue walks straight to the last target
+    trash.walk_to(new_pos)
 
-    # Register the packet listeners for events
-    trash.register_packet_listeners()
 
-    while True:
+def print_memory(fleet, out=print):
+    report = fleet.memory_report()
+    out(
+        f"{len(fleet.bots)} bots, {report['total'] / 2**20:.1f} MiB total, "
+        f"{report['per_bot'] / 2**20:.1f} MiB per bot"
+    )
+    for name, used in report["startup"].items():
+        out(f"  {name}: +{used / 2**20:.1f} MiB at start-up")
+
+
+def close_bots(bots):
+    # Captures and snapshots are written in the background until closed
+    for bot in bots:
+        bot.close()
+
+
+def add_console_commands(router, fleet, supervisors, runtime, ticks):
+    """Add the commands about the whole process to ``router``."""
+
+    @router.command("test")
+    def test(context):
+        """Walk two blocks along x."""
+        for trash in context.bots:
+            test_move(trash)
+
+    @router.command("reconnects")
+    def reconnects(context):
+        """Report reconnection statistics."""
+        for name, supervisor in supervisors.items():
+            context.reply(f"{name}: {supervisor.stats.as_dict()}")
+
+    @router.command("runtime")
+    def runtime_stats(context):
+        """Report listener dispatch statistics."""
+        context.reply(str(runtime.stats()))
+
+    @router.command("ticks")
+    def tick_stats(context):
+        """Report tick loop overruns and run time."""
+        context.reply(str(ticks.stats.as_dict()))
+
+    @router.command("commands")
+    def command_stats(context):
+        """Report command latencies."""
+        for name, stats in router.stats().items():
+            context.reply(f"{name}: {stats}")
+
+    if fleet is not None:
+
+        @router.command("memory")
+        def memory(context):
+            """Report fleet memory use."""
+            print_memory(fleet, context.reply)
+
+
+async def run_sharded(options):
+    """Run the roster in a :class:`ShardPool`, from the console of the parent."""
+    runtime = await Runtime(workers=options.workers).start()
+    scheduler = Scheduler()
+    pool = ShardPool(
+        load_roster(options.roster, options),
+        partial(run_shard, options),
+        processes=options.shards,
+    ).start(scheduler)
+    print(f"{len(pool.roster)} bots in {len(pool.shards)} processes")
+    metrics = None
+    if options.metrics_port is not None or options.metrics_log:
+        metrics = Metrics().watch_scheduler(scheduler).gather(pool.export)
+        if options.metrics_port is not None:
+            metrics.serve(options.metrics_port)
+        if options.metrics_log:
+            metrics.start_logging(scheduler, options.metrics_log)
+
+    try:
+        async for text in runtime.lines():
+            if text.strip() == "shards":
+                for index, names in pool.status().items():
+                    print(f"[{index}] {', '.join(names)}")
+                continue
+            await runtime.run_blocking(pool.dispatch, text, print)
+    finally:
+        if metrics is not None:
+            metrics.close()
+        pool.stop()
+        scheduler.stop()
+        runtime.close()
+
+
+def run_shard(options, index, accounts, channel):
+    """Entry point of a ``--shards`` worker process."""
+    setup_logging(options.loglevel or logging.INFO)
+    if options.profile:
+        options.profile = f"{options.profile}.{index}"
+    try:
+        asyncio.run(serve_shard(options, accounts, channel))
+    except KeyboardInterrupt:
+        pass
+
+
+async def serve_shard(options, accounts, channel):
+    runtime = await Runtime(workers=options.workers).start()
+    scheduler = Scheduler()
+    # Ticks run on their own thread, logins and connects block the scheduler
+    ticks = TickLoop().start()
+    tokens = None
+    if options.token_cache:
+        tokens = TokenManager(TokenCache(options.token_cache), scheduler=scheduler)
+    commands = default_router()
+    acl = AccessList(options.acl, uuids=options.auth_list).start(scheduler)
+    # The parent serves and logs what this worker's registry exports
+    metrics = None
+    if options.metrics_port is not None or options.metrics_log:
+        metrics = Metrics().watch_scheduler(scheduler).watch_runtime(runtime)
+        metrics.watch_ticks(ticks)
+    profiler = Profiler().start() if options.profile else None
+    # Every worker writes its own batches to the shared database
+    events = EventStore(options.events).start() if options.events else None
+    fleet = Fleet(
+        accounts,
+        stagger=options.stagger,
+        scheduler=scheduler,
+        bot_factory=partial(
+            Trashbag,
+            tokens=tokens,
+            scheduler=scheduler,
+            runtime=runtime,
+            commands=commands,
+            acl=acl,
+            metrics=metrics,
+            profiler=profiler,
+            ticks=ticks,
+            events=events,
+        ),
+    )
+    fleet.start()
+    add_console_commands(commands, fleet, fleet.supervisors, runtime, ticks)
+    if metrics is not None:
+        metrics.watch_bots(fleet.bots).watch_supervisors(fleet.supervisors)
+
+    try:
+        await runtime.run_blocking(ShardWorker(channel, fleet, commands, metrics).serve)
+    finally:
+        fleet.stop()
+        ticks.stop()
+        close_bots(fleet.bots)
+        if events is not None:
+            events.close()
+        acl.stop()
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(options.profile)
+            # Logged, the console prints of the workers would interleave
+            _logger.info(
+                "Slowest handlers of %s:\n%s", options.profile, profiler.report()
+            )
+        runtime.close()
+
+
+async def run(options):
+    if options.roster and options.shards is not None:
+        return await run_sharded(options)
+    runtime = await Runtime(workers=options.workers).start()
+    scheduler = Scheduler()
+    # Ticks run on their own thread, logins and connects block the scheduler
+    ticks = TickLoop().start()
+    tokens = None
+    if options.token_cache:
+        tokens = TokenManager(TokenCache(options.token_cache), scheduler=scheduler)
+    # Commands about the whole process are added once the bots exist
+    commands = default_router()
+    acl = AccessList(options.acl, uuids=options.auth_list).start(scheduler)
+    # Without either option no bot is instrumented at all
+    metrics = None
+    if options.metrics_port is not None or options.metrics_log:
+        metrics = Metrics().watch_scheduler(scheduler).watch_runtime(runtime)
+        metrics.watch_ticks(ticks)
+        if options.metrics_port is not None:
+            metrics.serve(options.metrics_port)
+        if options.metrics_log:
+            metrics.start_logging(scheduler, options.metrics_log)
+    profiler = Profiler().start() if options.profile else None
+    events = EventStore(options.events).start() if options.events else None
+    bot_factory = partial(
+        Trashbag,
+        tokens=tokens,
+        scheduler=scheduler,
+        runtime=runtime,
+        commands=commands,
+        acl=acl,
+        metrics=metrics,
+        profiler=profiler,
+        ticks=ticks,
+        events=events,
+    )
+
+    if options.roster:
+        fleet = Fleet(
+            load_roster(options.roster, options),
+            stagger=options.stagger,
+            scheduler=scheduler,
+            bot_factory=bot_factory,
+        )
+        fleet.start()
+        bots = fleet.bots
+        supervisors = fleet.supervisors
+    else:
+        fleet = None
+        trash = bot_factory(options)
+
+        # Perform login
         try:
-            text = input()
-            if text == "test":
-                print("Testing...")
-                print(f"Old: {trash.position}")
-                new_pos = (trash.position[0] + 1, trash.position[1], trash.position[2])
-                print(f"new_pos: {new_pos}")
-
-                trash.player_move(new_pos, trash.rotation)
-
-                new_pos = (new_pos[0] + 1, new_pos[1], new_pos[2])
-                print(f"new_pos: {new_pos}")
-
-                trash.player_move(new_pos, trash.rotation)
-
-            # else:
-            #     packet = serverbound.play.ChatPacket()
-            #     packet.message = text
-            #     trash.connection.write_packet(packet)
-        except KeyboardInterrupt:
-            _logger.info("Bye!")
-            sys.exit()
+            await runtime.run_blocking(trash.login)
+        except LoginError as e:
+            print(e)
+            sys.exit(1)
+
+        # Connect to the server, register the packet listeners for events
+        # and reconnect whenever the connection drops
+        supervisor = ConnectionSupervisor(trash, scheduler)
+        if not await runtime.run_blocking(supervisor.start):
+            print("Unable to connect, retrying in the background...")
+        bots = [trash]
+        supervisors = {"trashbag": supervisor}
+
+    # Whispers and the console share one table, in game only authorized
+    # players reach it
+    add_console_commands(commands, fleet, supervisors, runtime, ticks)
+    context = CommandContext(bots, CONSOLE, print)
+    if metrics is not None:
+        metrics.watch_bots(bots).watch_supervisors(supervisors)
+
+    # Commands run on the worker pool, packet handlers keep running meanwhile
+    try:
+        async for text in runtime.lines():
+            await runtime.run_blocking(commands.dispatch, text, context)
+    finally:
+        for supervisor in supervisors.values():
+            supervisor.stop()
+        ticks.stop()
+        close_bots(bots)
+        if events is not None:
+            events.close()
+        acl.stop()
+        if metrics is not None:
+            metrics.close()
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(options.profile)
+            print(profiler.report())
+        runtime.close()
+
+
+def main():
+    # Import pyCraft while the options are read and the account logs in
+    prebuild()
+    options = get_options()
+    setup_logging(options.loglevel or logging.INFO)
+
+    try:
+        asyncio.run(run(options))
+    except KeyboardInterrupt:
+        _logger.info("Bye!")
+    sys.exit()
 
 
 if __name__ == "__main__":
@@ -1,16 +1,23 @@
 import sys
 
-if sys.version_info[:2] >= (3, 8):
-    # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
-    from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
-else:
-    from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
 
-try:
-    # Change here if project is renamed and does not equal the package name
-    dist_name = __name__
-    __version__ = version(dist_name)
-except PackageNotFoundError:  # pragma: no cover
-    __version__ = "unknown"
-finally:
-    del version, PackageNotFoundError
+def __getattr__(name):
+    # Looking the version up costs more than importing the bot, only do it
+    # when someone asks
+    if name != "__version__":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if sys.version_info[:2] >= (3, 8):
+        # TODO: Import directly (no need for conditional) when
+        # `python_requires = >= 3.8`
+        from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
+    else:
+        from importlib_metadata import PackageNotFoundError, version  # pragma: no cover
+
+    try:
+        # Change here if project is renamed and does not equal the package name
+        dist_name = __name__
+        value = version(dist_name)
+    except PackageNotFoundError:  # pragma: no cover
+        value = "unknown"
+    globals()["__version__"] = value
+    return value
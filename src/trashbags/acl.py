@@ -0,0 +1,194 @@
+"""
+Who may command the bots.
+
+An ACL file is an INI file with one section per role, listing player UUIDs;
+anything after ``=`` is a free-form note::
+
+    [admin]
+    069a79f4-44e9-4726-a5be-fca90e38aaf5 = Notch
+
+    [user]
+    853c80ef-3c37-49fd-aa49-938b674adae6
+
+Roles are tiers, each allowed what the ones below it are. Lookups are set
+and dict hits on the UUID. :class:`AccessList` re-reads the file on the
+shared :class:`~trashbags.scheduler.Scheduler` when it changes, so access
+can be granted or revoked without reconnecting, and remembers recently
+refused whisper senders so that spam costs one dict lookup.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from configparser import ConfigParser
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+# Tiers, higher ones include the lower ones
+NOBODY = 0
+USER = 1
+OPERATOR = 2
+ADMIN = 3
+
+ROLES = {"user": USER, "operator": OPERATOR, "admin": ADMIN}
+
+
+def normalize_uuid(value):
+    """Dashed lowercase form of a UUID, with or without dashes.
+
+    Raises:
+      ValueError: if ``value`` is not a UUID
+    """
+    return str(uuid.UUID(value.strip()))
+
+
+def read_acl(path):
+    """Read an ACL file into a UUID to tier mapping.
+
+    Raises:
+      ValueError: on an unknown role or a malformed UUID
+      OSError: if the file cannot be read
+    """
+    parser = ConfigParser(allow_no_value=True, delimiters=("=",))
+    with open(path, encoding="utf-8") as acl:
+        parser.read_file(acl)
+    tiers = {}
+    for role in parser.sections():
+        tier = ROLES.get(role.lower())
+        if tier is None:
+            raise ValueError(f"{path}: unknown role [{role}]")
+        for key in parser[role]:
+            player = normalize_uuid(key)
+            tiers[player] = max(tier, tiers.get(player, NOBODY))
+    return tiers
+
+
+class AccessList:
+    """Tiers of the players allowed to command the bots.
+
+    Args:
+      path (str): ACL file, optional
+      uuids: UUIDs granted every right, e.g. from the ``AUTH_LIST``
+        environment variable
+      negative_ttl (float): seconds a refused sender is remembered
+      clock: monotonic clock, ``time.monotonic`` by default
+    """
+
+    NEGATIVE_CACHE_SIZE = 4096
+
+    def __init__(self, path=None, uuids=(), negative_ttl=30.0, clock=time.monotonic):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.refused = 0
+        self._extra = {}
+        for value in uuids:
+            try:
+                self._extra[normalize_uuid(value)] = ADMIN
+            except ValueError:
+                _logger.warning("Ignoring invalid UUID %r in the auth list", value)
+        self._tiers = dict(self._extra)
+        self.members = frozenset(self._tiers)
+        self._denied = OrderedDict()
+        self._stamp = None
+        self._task = None
+        self._lock = threading.Lock()
+        if path is not None:
+            self.reload()
+
+    def __len__(self):
+        return len(self._tiers)
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self):
+        """Read the ACL file again.
+
+        Raises:
+          ValueError: if the file is malformed, the current ACL is kept
+          OSError: if the file cannot be read
+        """
+        stamp = self._file_stamp()
+        tiers = dict(self._extra)
+        for player, tier in read_acl(self.path).items():
+            tiers[player] = max(tier, tiers.get(player, NOBODY))
+        with self._lock:
+            self._tiers = tiers
+            self.members = frozenset(tiers)
+            self._stamp = stamp
+            # Someone refused a moment ago may have just been added
+            self._denied = OrderedDict()
+        _logger.info("Loaded %d players from %s", len(tiers), self.path)
+
+    def reload_if_changed(self):
+        """Reload the file if it was modified since it was last read."""
+        try:
+            if self._file_stamp() == self._stamp:
+                return False
+            self.reload()
+        except (OSError, ValueError) as error:
+            _logger.warning("Keeping the current ACL: %s", error)
+            return False
+        return True
+
+    def start(self, scheduler, interval=2.0):
+        """Watch the ACL file for changes every ``interval`` seconds."""
+        if self.path is not None and self._task is None:
+            self._task = scheduler.call_every(interval, self.reload_if_changed)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def tier_of(self, player):
+        """Tier of the player with UUID ``player``, :data:`NOBODY` if unknown."""
+        return self._tiers.get(player, NOBODY)
+
+    def is_authorized(self, player, tier=USER):
+        if tier == USER:
+            return player in self.members
+        return self._tiers.get(player, NOBODY) >= tier
+
+    def sender_tier(self, name, resolve):
+        """Tier of the player called ``name``, for incoming whispers.
+
+        Args:
+          name (str): sender name, may be ``None``
+          resolve: maps a name to a UUID, ``None`` if the player is unknown
+
+        Returns:
+          int: the tier, :data:`NOBODY` for unknown or refused senders; only
+          senders known to be in no tier are remembered as refused, one not
+          in the tab list yet is looked up again on their next whisper
+        """
+        now = self.clock()
+        denied = self._denied
+        until = denied.get(name)
+        if until is not None and until > now:
+            self.refused += 1
+            return NOBODY
+        player = resolve(name) if name is not None else None
+        tier = self._tiers.get(player, NOBODY)
+        if tier == NOBODY:
+            self.refused += 1
+            if player is None:
+                return tier
+            with self._lock:
+                denied.pop(name, None)
+                while len(denied) >= self.NEGATIVE_CACHE_SIZE:
+                    # The oldest refusals go first
+                    denied.popitem(last=False)
+                denied[name] = now + self.negative_ttl
+            _logger.info("Ignoring whispers from unauthorized sender %s", name)
+        return tier
@@ -0,0 +1,287 @@
+"""
+Cached, refresh-ahead Minecraft authentication.
+
+Session tokens are kept per account in a small JSON file guarded by a file
+lock, so several bots (or processes) can share it. :class:`TokenManager`
+hands out the cached token straight away and renews it in the background
+on the shared :class:`~trashbags.scheduler.Scheduler` before it expires, so
+starting a bot only waits on the network the very first time.
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from .scheduler import Scheduler
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = "default"
+DEFAULT_CACHE = os.path.join("~", ".cache", "trashbags", "tokens.json")
+
+# Minecraft session tokens obtained through Microsoft accounts last a day
+TOKEN_LIFETIME = 24 * 60 * 60
+
+
+class LoginError(Exception):
+    """Logging in to an account failed."""
+
+
+class InteractiveLoginRequired(LoginError):
+    """Only a login with someone at the keyboard can renew this token."""
+
+
+class AuthRecord(NamedTuple):
+    """A Minecraft session token and what it belongs to."""
+
+    account: str
+    username: str
+    uuid: str
+    access_token: str
+    expires_at: float
+
+    def expires_in(self, now=None) -> float:
+        return self.expires_at - (time.time() if now is None else now)
+
+
+def microsoft_token(username=None, interactive=True):
+    """Run the pyCraft Microsoft login flow.
+
+    Args:
+      username (str): account to restore from pyCraft's persistence files,
+        or ``None`` to authenticate interactively
+      interactive (bool): whether prompting for a login is allowed
+
+    Returns:
+      Microsoft_AuthenticationToken: the logged-in token
+
+    Raises:
+      InteractiveLoginRequired: without ``username`` when ``interactive``
+        is false
+      LoginError: when the login is refused or fails
+    """
+    if not username and not interactive:
+        raise InteractiveLoginRequired("Microsoft login needs a prompt")
+    from minecraft import authentication
+    from minecraft.exceptions import YggdrasilError
+
+    try:
+        token = authentication.Microsoft_AuthenticationToken()
+        if username:
+            if not token.PersistenceLogoin_r(username):
+                raise LoginError("Login to {} failed".format(username))
+        elif not token.authenticate():
+            raise LoginError("Microsoft authentication failed")
+    except YggdrasilError as e:
+        raise LoginError(str(e)) from e
+    return token
+
+
+def token_expiry(access_token, cached=None):
+    """Unix time ``access_token`` expires at.
+
+    Minecraft access tokens are JWTs, the ``exp`` claim is read from them
+    without checking their signature. Other tokens keep the expiry of the
+    ``cached`` record holding them, or live :data:`TOKEN_LIFETIME` from now.
+    """
+    try:
+        payload = access_token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return float(claims["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        pass
+    if cached is not None and cached.access_token == access_token:
+        return cached.expires_at
+    return time.time() + TOKEN_LIFETIME
+
+
+def microsoft_login(account, cached=None, interactive=True) -> AuthRecord:
+    """Default authenticator for :class:`TokenManager`.
+
+    The default account is renewed from pyCraft's persistence files under
+    the name it last logged in as, a prompt is only shown if ``interactive``.
+    """
+    username = None if account == DEFAULT_ACCOUNT else account
+    if username is None and not interactive and cached is not None:
+        username = cached.username
+    token = microsoft_token(username, interactive)
+    # A token restored from the persistence files may be hours old already
+    return AuthRecord(
+        account,
+        token.username,
+        token.profile.id_,
+        token.access_token,
+        token_expiry(token.access_token, cached),
+    )
+
+
+def to_pycraft(record: AuthRecord):
+    """Build a pyCraft token usable by ``Connection`` from a cached record."""
+    from minecraft import authentication
+
+    token = authentication.Microsoft_AuthenticationToken(
+        access_token=record.access_token
+    )
+    token.username = record.username
+    token.profile.id_ = record.uuid
+    token.profile.name = record.username
+    return token
+
+
+class TokenCache:
+    """Per-account :class:`AuthRecord` store in a file-locked JSON file."""
+
+    def __init__(self, path=DEFAULT_CACHE):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as cache:
+                return json.load(cache)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        temporary = self.path + ".tmp"
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as cache:
+            json.dump(entries, cache)
+        os.replace(temporary, self.path)
+
+    def get(self, account) -> Optional[AuthRecord]:
+        with self._locked():
+            entry = self._read().get(account)
+        return AuthRecord(**entry) if entry else None
+
+    def put(self, record: AuthRecord):
+        with self._locked():
+            entries = self._read()
+            entries[record.account] = record._asdict()
+            self._write(entries)
+
+    def discard(self, account):
+        with self._locked():
+            entries = self._read()
+            if entries.pop(account, None) is not None:
+                self._write(entries)
+
+
+class TokenManager:
+    """Hands out cached tokens and refreshes them ahead of expiry.
+
+    Args:
+      cache (TokenCache): where tokens are persisted
+      authenticator: ``authenticator(account, cached, interactive) ->
+        AuthRecord``, doing the network login; ``cached`` is the previous
+        record or ``None``, ``interactive`` false for background refreshes,
+        which must raise :class:`InteractiveLoginRequired` rather than prompt
+      scheduler (Scheduler): runs the background refreshes
+      refresh_ahead (float): seconds before expiry to start refreshing
+      retry (float): seconds to wait before retrying a failed refresh
+    """
+
+    def __init__(
+        self,
+        cache,
+        authenticator=microsoft_login,
+        scheduler=None,
+        refresh_ahead=60 * 60,
+        retry=60,
+    ):
+        self.cache = cache
+        self.authenticator = authenticator
+        self.scheduler = scheduler or Scheduler()
+        self.refresh_ahead = refresh_ahead
+        self.retry = retry
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def token_for(self, account=DEFAULT_ACCOUNT) -> AuthRecord:
+        """Token for ``account``, only logging in if none is cached and valid.
+
+        Raises:
+          LoginError: when there is no usable cached token and login fails
+        """
+        record = self.cache.get(account)
+        if record is None or record.expires_in() <= 0:
+            record = self._login(account, record)
+        self._schedule(record.account, record.expires_in() - self.refresh_ahead)
+        return record
+
+    def _login(self, account, cached, interactive=True):
+        try:
+            record = self.authenticator(account, cached, interactive)
+        except LoginError:
+            raise
+        except Exception as error:
+            raise LoginError(f"Login to {account} failed: {error!r}") from error
+        self.cache.put(record)
+        return record
+
+    def _schedule(self, account, delay):
+        self.scheduler.start()
+        with self._lock:
+            previous = self._tasks.get(account)
+            if previous is not None:
+                previous.cancel()
+            self._tasks[account] = self.scheduler.call_later(
+                max(delay, 0), self.refresh, account
+            )
+
+    def refresh(self, account):
+        """Log ``account`` in again now and reschedule its next refresh.
+
+        Runs on the scheduler, so it never prompts: an account that needs
+        an interactive login is left to the next :meth:`token_for`.
+        """
+        try:
+            record = self._login(account, self.cache.get(account), False)
+        except InteractiveLoginRequired as error:
+            _logger.warning("Not refreshing %s in the background: %s", account, error)
+            with self._lock:
+                self._tasks.pop(account, None)
+            return None
+        except LoginError as error:
+            _logger.warning("Refreshing %s failed, retrying: %s", account, error)
+            self._schedule(account, self.retry)
+            return None
+        _logger.info("Refreshed token for %s", account)
+        self._schedule(account, record.expires_in() - self.refresh_ahead)
+        return record
+
+    def stop(self):
+        with self._lock:
+            for task in self._tasks.values():
+                task.cancel()
+            self._tasks.clear()
@@ -0,0 +1,354 @@
+"""
+Binary packet capture.
+
+:class:`PacketCapture` records every packet a connection reads or writes
+without formatting anything on the network thread: the raw frame, a
+timestamp, the direction and the packet id go into a bounded ring buffer
+that a background thread appends to a capture file.
+
+A capture file starts with :data:`MAGIC` and is a sequence of records, each
+a :data:`RECORD` header (timestamp, flags, packet id, frame length) followed
+by the frame as it was on the wire after decryption. The file may be
+gzip-compressed as a whole. Read it back with :func:`read_capture`, or from
+the shell::
+
+    python -m trashbags.capture bot.cap --direction in --id 0x0F
+"""
+
+import gzip
+import logging
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from optparse import OptionParser
+from typing import NamedTuple
+
+from .protocol import registry
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"TBCAP\x01"
+RECORD = struct.Struct("<dBiI")
+
+# Record flags
+OUTGOING = 0x01
+COMPRESSED = 0x02
+PLAY = 0x04
+
+INCOMING = "in"
+OUTGOING_NAME = "out"
+
+
+def encode_varint(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, offset=0):
+    """Read a VarInt from ``data`` at ``offset``, returning (value, offset)."""
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    if result & 0x80000000:
+        result -= 1 << 32
+    return result, offset
+
+
+class _RecordingStream:
+    """Pass reads through to ``stream`` and keep a copy of what was read."""
+
+    __slots__ = ("stream", "chunks")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.chunks = []
+
+    def read(self, length=-1):
+        data = self.stream.read(length)
+        self.chunks.append(data)
+        return data
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class PacketCapture:
+    """Record a connection's packets to a capture file in the background.
+
+    Args:
+      path (str): capture file to write
+      compress (bool): gzip the file
+      buffer (int): packets held in memory before the oldest are dropped
+      flush_interval (float): seconds between two writes to disk
+    """
+
+    def __init__(self, path, compress=False, buffer=65536, flush_interval=0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self._ring = deque(maxlen=buffer)
+        self._file = (
+            gzip.open(path, "wb", compresslevel=1) if compress else open(path, "wb")
+        )
+        self._file.write(MAGIC)
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="trashbags-capture", daemon=True
+        )
+        self._thread.start()
+
+    def attach(self, connection):
+        """Capture everything ``connection`` reads and writes from now on."""
+        from minecraft.networking.packets import Packet
+
+        def outgoing(packet):
+            # Serialised on the writer thread, outgoing packets are not reused
+            flags = OUTGOING
+            if type(connection.reactor).__name__ == "PlayingReactor":
+                flags |= PLAY
+            self._record((time.time(), flags, packet.id, packet))
+
+        connection.add_reactor_hook(self._hook_reactor)
+        connection.register_packet_listener(outgoing, Packet, outgoing=True)
+
+    def _record(self, item):
+        ring = self._ring
+        if len(ring) == ring.maxlen:
+            self.dropped += 1
+        ring.append(item)
+
+    def _hook_reactor(self, reactor):
+        read_packet = reactor.read_packet
+        options = reactor.connection.options
+        play = PLAY if type(reactor).__name__ == "PlayingReactor" else 0
+        record = self._record
+
+        def capturing_read_packet(stream, timeout=0):
+            flags = play | (COMPRESSED if options.compression_enabled else 0)
+            recorder = _RecordingStream(stream)
+            packet = read_packet(recorder, timeout)
+            if packet is not None:
+                record((time.time(), flags, packet.id, recorder.chunks))
+            return packet
+
+        reactor.read_packet = capturing_read_packet
+
+    def _frame(self, payload):
+        if isinstance(payload, list):
+            return b"".join(payload)
+        from minecraft.networking.packets import PacketBuffer
+
+        buffer = PacketBuffer()
+        buffer.send(encode_varint(payload.id))
+        payload.write_fields(buffer)
+        body = buffer.get_writable()
+        return encode_varint(len(body)) + body
+
+    def _drain(self):
+        ring = self._ring
+        write = self._file.write
+        while ring:
+            timestamp, flags, packet_id, payload = ring.popleft()
+            try:
+                frame = self._frame(payload)
+            except Exception:
+                _logger.exception("Could not serialise packet 0x%02X", packet_id)
+                continue
+            write(RECORD.pack(timestamp, flags, packet_id, len(frame)))
+            write(frame)
+            self.recorded += 1
+        self._file.flush()
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self._drain()
+        self._drain()
+        self._file.close()
+
+    def close(self):
+        """Write the packets still buffered and finish the file."""
+        self._closed.set()
+        self._thread.join()
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float
+    direction: str
+    play: bool
+    packet_id: int
+    payload: bytes
+
+    @property
+    def incoming(self):
+        return self.direction == INCOMING
+
+
+def _payload(flags, frame):
+    _, offset = decode_varint(frame)
+    if flags & COMPRESSED:
+        data_length, offset = decode_varint(frame, offset)
+        if data_length:
+            frame, offset = zlib.decompress(frame[offset:]), 0
+    _, offset = decode_varint(frame, offset)
+    return bytes(frame[offset:])
+
+
+def read_capture(path):
+    """Yield the :class:`CaptureRecord` entries of a capture file.
+
+    ``payload`` is the packet body after its id, decompressed. A file cut
+    short, by a crash or a copy taken while recording, ends at its last
+    whole record.
+    """
+    with open(path, "rb") as raw:
+        gzipped = raw.read(2) == b"\x1f\x8b"
+    with (gzip.open if gzipped else open)(path, "rb") as capture:
+        if capture.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trashbags capture")
+        while True:
+            try:
+                header = capture.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                timestamp, flags, packet_id, length = RECORD.unpack(header)
+                frame = capture.read(length)
+            except EOFError:
+                # A gzip stream without its trailer
+                return
+            if len(frame) < length:
+                return
+            yield CaptureRecord(
+                timestamp,
+                OUTGOING_NAME if flags & OUTGOING else INCOMING,
+                bool(flags & PLAY),
+                packet_id,
+                _payload(flags, frame),
+            )
+
+
+def play_packets():
+    """Map (direction, id) to pyCraft's 1.12.2 play packet classes, if any.
+
+    Returns:
+      tuple: the pyCraft ``ConnectionContext`` (``None`` without pyCraft) and
+      the mapping
+    """
+    try:
+        packets = registry()
+    except ImportError:
+        return None, {}
+    classes = {}
+    for direction, ids in (
+        (INCOMING, packets.clientbound_ids),
+        (OUTGOING_NAME, packets.serverbound_ids),
+    ):
+        for packet_id, packet in ids.items():
+            classes[direction, packet_id] = packet
+    return packets.context, classes
+
+
+def decode_record(record, context, classes):
+    """Decode a play record into its pyCraft packet.
+
+    Returns ``None`` for records of unknown packets or outside play.
+
+    Raises:
+      Exception: whatever pyCraft raises on a malformed payload
+    """
+    packet_class = classes.get((record.direction, record.packet_id))
+    if not record.play or packet_class is None:
+        return None
+    from minecraft.networking.packets import PacketBuffer
+
+    buffer = PacketBuffer()
+    buffer.send(record.payload)
+    buffer.reset_cursor()
+    packet = packet_class(context)
+    packet.read(buffer)
+    return packet
+
+
+def _describe(record, context, classes):
+    try:
+        packet = decode_record(record, context, classes)
+    except Exception as error:
+        name = classes[record.direction, record.packet_id].__name__
+        return f"{name} (undecodable: {error!r})"
+    if packet is None:
+        return record.payload[:32].hex() + ("..." if len(record.payload) > 32 else "")
+    return str(packet)
+
+
+def main(args):
+    parser = OptionParser(usage="%prog [options] CAPTURE")
+    parser.add_option(
+        "-d", "--direction", dest="direction", choices=(INCOMING, OUTGOING_NAME)
+    )
+    parser.add_option(
+        "-i",
+        "--id",
+        dest="ids",
+        action="append",
+        default=[],
+        help="only show this packet id (e.g. 0x0F), may be repeated",
+    )
+    parser.add_option("-n", "--limit", dest="limit", type="int", default=None)
+    parser.add_option(
+        "-r", "--raw", dest="raw", action="store_true", help="show payload hex only"
+    )
+    (options, args) = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error("expected one capture file")
+
+    ids = {int(value, 0) for value in options.ids}
+    context, classes = (None, {}) if options.raw else play_packets()
+    start = None
+    shown = 0
+    for record in read_capture(args[0]):
+        if start is None:
+            start = record.timestamp
+        if options.direction and record.direction != options.direction:
+            continue
+        if ids and record.packet_id not in ids:
+            continue
+        arrow = "-->" if record.incoming else "<--"
+        print(
+            f"{record.timestamp - start:10.3f} {arrow} 0x{record.packet_id:02X} "
+            f"{len(record.payload):6d}B {_describe(record, context, classes)}"
+        )
+        shown += 1
+        if options.limit is not None and shown >= options.limit:
+            break
+
+
+def run():
+    """Entry point for console_scripts"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
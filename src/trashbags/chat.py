@@ -0,0 +1,149 @@
+"""
+Decoding of clientbound chat packets.
+
+Every ``ChatMessagePacket`` carries a JSON text component. It is parsed
+exactly once here and turned into an immutable :class:`ChatMessage` that
+the rest of the bot inspects, instead of each check running its own
+``json.loads``.
+"""
+
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover
+    import json
+
+    _loads = json.loads
+    JSON_BACKEND = "json"
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+CHAT = "chat"
+WHISPER = "whisper"
+SYSTEM = "system"
+
+# Colour the server uses for the sender's name in a private message
+SENDER_COLOR = "light_purple"
+
+# Vanilla translation keys, used when the server does not restyle messages
+_TRANSLATE_KINDS = {
+    "commands.message.display.incoming": WHISPER,
+    "chat.type.text": CHAT,
+    "chat.type.emote": CHAT,
+    "chat.type.announcement": SYSTEM,
+}
+
+CACHE_SIZE = 4096
+
+
+class ChatMessage(NamedTuple):
+    """A decoded chat packet.
+
+    ``components`` holds one ``(text, color)`` pair per text component, in
+    display order; ``color`` is ``None`` when the component is unstyled.
+    ``body`` is what the sender typed: the text of a whisper without its
+    ``[sender -> me]`` header, the whole text otherwise.
+    """
+
+    kind: str
+    sender: Optional[str]
+    text: str
+    components: Tuple[Tuple[str, Optional[str]], ...]
+    body: str
+
+
+def _flatten(node, color, out):
+    if isinstance(node, str):
+        out.append((node, color))
+        return
+    if isinstance(node, list):
+        for child in node:
+            _flatten(child, color, out)
+        return
+    if not isinstance(node, dict):
+        return
+    color = node.get("color", color)
+    text = node.get("text")
+    if text:
+        out.append((text, color))
+    with_ = node.get("with")
+    if with_:
+        _flatten(with_, color, out)
+    extra = node.get("extra")
+    if extra:
+        _flatten(extra, color, out)
+
+
+def _classify(root) -> str:
+    if "translate" in root:
+        return _TRANSLATE_KINDS.get(root["translate"], SYSTEM)
+    # Private messages arrive with a coloured root component, public chat
+    # and server broadcasts are plain text with coloured extras.
+    if "color" in root:
+        return WHISPER
+    return CHAT
+
+
+def _find_sender(root, kind, components) -> Optional[str]:
+    if kind != SYSTEM and "translate" in root:
+        with_ = root.get("with") or ()
+        if with_:
+            first = with_[0]
+            return first.get("text") if isinstance(first, dict) else first
+    for text, color in components:
+        if color == SENDER_COLOR:
+            return text
+    return None
+
+
+def _find_body(kind, sender, components, text) -> str:
+    if kind != WHISPER or sender is None:
+        return text
+    for index, (part, _) in enumerate(components):
+        if part == sender:
+            rest = "".join(part for part, _ in components[index + 1 :])
+            break
+    else:
+        return text
+    # Essentials-style "[Steve -> me] hi", vanilla puts the body on its own
+    if rest.startswith(" -> ") and "]" in rest:
+        rest = rest.split("]", 1)[1]
+    return rest.strip()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def decode_chat(json_data: str) -> ChatMessage:
+    """Parse the JSON payload of a chat packet into a :class:`ChatMessage`.
+
+    Identical payloads (join notices, server broadcasts, repeated spam) are
+    served from an LRU cache without being parsed again.
+
+    Args:
+      json_data (str): value of ``ChatMessagePacket.json_data``
+
+    Returns:
+      ChatMessage: the decoded message
+    """
+    try:
+        root = _loads(json_data)
+    except ValueError:
+        return ChatMessage(SYSTEM, None, json_data, ((json_data, None),), json_data)
+
+    if not isinstance(root, dict):
+        root = {"extra": root if isinstance(root, list) else [root]}
+
+    components = []
+    _flatten(root, None, components)
+    components = tuple(components)
+    kind = _classify(root)
+    sender = _find_sender(root, kind, components)
+    text = "".join(part for part, _ in components)
+    body = _find_body(kind, sender, components, text)
+    return ChatMessage(kind, sender, text, components, body)
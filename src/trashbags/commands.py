@@ -0,0 +1,350 @@
+"""
+Bot commands.
+
+One :class:`CommandRouter` holds the handler table for both the console and
+authorized whispers. Command names, which may be several words long, are
+compiled into a word trie, so a line is routed in one pass over its first
+words whatever the number of commands. Arguments are converted according to
+the handler's annotations::
+
+    router = CommandRouter()
+
+    @router.command("goto", cooldown=1)
+    def goto(context, x: float, y: float, z: float):
+        for bot in context.bots:
+            bot.walk_to((x, y, z))
+
+    router.dispatch("goto 10 64 -3", CommandContext(bots, "console", print))
+
+Every call is timed into a per-command :class:`Histogram`.
+"""
+
+import inspect
+import logging
+import re
+import threading
+import time
+from typing import Callable, List, NamedTuple, Optional
+
+from .acl import ADMIN, OPERATOR, USER
+from .metrics import Histogram
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+CONSOLE = "console"
+
+# Words, or "quoted strings" kept together
+_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+_TRUE = frozenset(("1", "true", "yes", "on"))
+_FALSE = frozenset(("0", "false", "no", "off"))
+
+
+class CommandError(Exception):
+    """A command was misused, the message is sent back to the caller."""
+
+
+class CommandContext(NamedTuple):
+    """Who runs a command and on which bots.
+
+    ``reply(text)`` answers the caller: ``print`` on the console, a whisper
+    back to the sender in game. ``tier`` is the caller's
+    :mod:`~trashbags.acl` tier, the console has them all.
+    """
+
+    bots: List[object]
+    sender: Optional[str]
+    reply: Callable[[str], None]
+    tier: int = ADMIN
+
+
+def _to_bool(word):
+    word = word.lower()
+    if word in _TRUE:
+        return True
+    if word in _FALSE:
+        return False
+    raise ValueError(word)
+
+
+_CONVERTERS = {bool: _to_bool}
+
+
+class _Parameter(NamedTuple):
+    name: str
+    convert: Callable
+    type_name: str
+    default: object
+
+
+class Command:
+    """A handler and what is needed to call it from a line of text."""
+
+    def __init__(self, name, handler, cooldown=0.0, help=None, tier=ADMIN):
+        self.name = name
+        self.handler = handler
+        self.cooldown = cooldown
+        self.tier = tier
+        self.help = help or inspect.getdoc(handler) or ""
+        self.latency = Histogram()
+        self.last_used = {}
+        self.parameters = []
+        self.rest = None
+        for parameter in list(inspect.signature(handler).parameters.values())[1:]:
+            annotation = parameter.annotation
+            if annotation is inspect.Parameter.empty:
+                annotation = str
+            converted = _Parameter(
+                parameter.name,
+                _CONVERTERS.get(annotation, annotation),
+                getattr(annotation, "__name__", str(annotation)),
+                parameter.default,
+            )
+            if parameter.kind is inspect.Parameter.VAR_POSITIONAL:
+                self.rest = converted
+            else:
+                self.parameters.append(converted)
+        self.required = sum(
+            parameter.default is inspect.Parameter.empty
+            for parameter in self.parameters
+        )
+
+    @property
+    def usage(self):
+        parts = [self.name]
+        for parameter in self.parameters:
+            part = f"{parameter.name}:{parameter.type_name}"
+            if parameter.default is not inspect.Parameter.empty:
+                part = f"[{part}]"
+            parts.append(f"<{part}>")
+        if self.rest is not None:
+            parts.append(f"<{self.rest.name}:{self.rest.type_name}...>")
+        return " ".join(parts)
+
+    def parse(self, words):
+        """Convert ``words`` into the handler's positional arguments.
+
+        Raises:
+          CommandError: on a missing, extra or malformed argument
+        """
+        count = len(words)
+        if count < self.required or (
+            self.rest is None and count > len(self.parameters)
+        ):
+            raise CommandError(f"Usage: {self.usage}")
+        args = []
+        for index, word in enumerate(words):
+            if index < len(self.parameters):
+                parameter = self.parameters[index]
+            else:
+                parameter = self.rest
+            try:
+                args.append(parameter.convert(word))
+            except ValueError:
+                raise CommandError(
+                    f"{parameter.name} must be a {parameter.type_name}, not {word!r}"
+                )
+        return args
+
+
+class CommandRouter:
+    """The table of commands, shared by the console and whispers.
+
+    Args:
+      clock: monotonic clock for cooldowns, ``time.monotonic`` by default
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.commands = {}
+        self._trie = None
+        self._lock = threading.Lock()
+
+    def add(self, name, handler, cooldown=0.0, help=None, tier=ADMIN):
+        """Register ``handler(context, *args)`` under ``name``.
+
+        Args:
+          name (str): one or more words
+          cooldown (float): seconds a caller waits between two uses
+          help (str): one line description, the docstring by default
+          tier (int): lowest :mod:`~trashbags.acl` tier allowed to run it
+
+        Returns:
+          Command: the registered command
+        """
+        name = " ".join(name.split())
+        command = Command(name, handler, cooldown, help, tier)
+        self.commands[name] = command
+        self._trie = None
+        return command
+
+    def command(self, name, cooldown=0.0, help=None, tier=ADMIN):
+        """Decorator form of :meth:`add`."""
+
+        def register(handler):
+            self.add(name, handler, cooldown, help, tier)
+            return handler
+
+        return register
+
+    def compile(self):
+        """Build the routing trie, done on first use after a change."""
+        trie = {}
+        for name, command in self.commands.items():
+            node = trie
+            for word in name.lower().split():
+                node = node.setdefault(word, {})
+            node[None] = command
+        self._trie = trie
+        return trie
+
+    def resolve(self, text):
+        """Find the command a line starts with.
+
+        Returns:
+          tuple: the longest matching :class:`Command` (``None`` if there is
+          none) and the remaining words
+        """
+        trie = self._trie or self.compile()
+        words = [quoted or word for quoted, word in _TOKEN.findall(text)]
+        node = trie
+        found, consumed = None, 0
+        for index, word in enumerate(words):
+            node = node.get(word.lower())
+            if node is None:
+                break
+            if None in node:
+                found, consumed = node[None], index + 1
+        return found, words[consumed:]
+
+    def _use(self, command, sender):
+        now = self.clock()
+        with self._lock:
+            last = command.last_used.get(sender)
+            wait = 0 if last is None else last + command.cooldown - now
+            if wait <= 0:
+                command.last_used[sender] = now
+                return
+        raise CommandError(f"{command.name} is cooling down, wait {wait:.1f}s")
+
+    def dispatch(self, text, context):
+        """Run the command on a line of text and answer the caller.
+
+        Returns:
+          bool: whether a command ran to completion
+        """
+        command, words = self.resolve(text)
+        if command is None:
+            if text.strip():
+                context.reply(f"Unknown command: {text.split()[0]}")
+            return False
+        if command.tier > context.tier:
+            context.reply(f"You may not use {command.name}")
+            return False
+        started = time.perf_counter()
+        try:
+            # A malformed command does not start the cooldown
+            args = command.parse(words)
+            if command.cooldown:
+                self._use(command, context.sender)
+            command.handler(context, *args)
+        except CommandError as error:
+            context.reply(str(error))
+            return False
+        except Exception:
+            _logger.exception("Command %r failed", text)
+            context.reply(f"{command.name} failed")
+            return False
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                command.latency.observe(elapsed)
+        return True
+
+    def stats(self):
+        """Latency summary of every command that ran, by name."""
+        return {
+            name: command.latency.as_dict()
+            for name, command in self.commands.items()
+            if command.latency.count
+        }
+
+
+def default_router():
+    """A router with the commands every bot understands."""
+    router = CommandRouter()
+
+    @router.command("help", tier=USER)
+    def help_(context, name: str = None):
+        """List the commands, or describe one."""
+        if name is not None:
+            command, _ = router.resolve(name)
+            if command is None:
+                raise CommandError(f"Unknown command: {name}")
+            context.reply(f"{command.usage}: {command.help}")
+            return
+        allowed = (
+            name
+            for name, command in router.commands.items()
+            if command.tier <= context.tier
+        )
+        context.reply(", ".join(sorted(allowed)))
+
+    @router.command("goto", cooldown=1.0, tier=OPERATOR)
+    def goto(context, x: float, y: float, z: float):
+        """Walk to a position, around obstacles."""
+        for bot in context.bots:
+            path = bot.navigate((x, y, z))
+            if path is not None and not path.complete:
+                context.reply(f"{bot.options.username}: no full path, getting closer")
+
+    @router.command("say", cooldown=1.0, tier=OPERATOR)
+    def say(context, *words: str):
+        """Send a chat message, server commands only for admins."""
+        text = " ".join(words)
+        # A slash command runs with the bot's own permissions on the server
+        if text.lstrip().startswith("/") and context.tier < ADMIN:
+            raise CommandError("Only admins may send server commands")
+        for bot in context.bots:
+            bot.send_chat(text)
+
+    @router.command("where", tier=USER)
+    def where(context):
+        """Report the bot's position."""
+        for bot in context.bots:
+            x, y, z = bot.position
+            context.reply(f"{bot.options.username}: {x:.1f} {y:.1f} {z:.1f}")
+
+    @router.command("nearby", tier=USER)
+    def nearby(context, radius: float = 16.0):
+        """Count the entities around the bot."""
+        for bot in context.bots:
+            if bot.entities is None:
+                context.reply(f"{bot.options.username}: entities are not tracked")
+                continue
+            ids, distances = bot.nearby(radius)
+            closest = f", closest {distances[0]:.1f}" if len(ids) else ""
+            context.reply(
+                f"{bot.options.username}: {len(ids)} within {radius:g}{closest}"
+            )
+
+    @router.command("lag", tier=OPERATOR)
+    def lag(context):
+        """Report the server's tick rate and round trip."""
+        for bot in context.bots:
+            tps, rtt = bot.lag.tps, bot.lag.rtt
+            tps = "?" if tps is None else f"{tps:.1f}"
+            rtt = "?" if rtt is None else f"{rtt * 1000:.0f} ms"
+            context.reply(f"{bot.options.username}: {tps} TPS, {rtt} round trip")
+
+    @router.command("outbox", tier=OPERATOR)
+    def outbox(context):
+        """Report chat queue statistics."""
+        for bot in context.bots:
+            context.reply(f"{bot.options.username}: {bot.outbox.stats()}")
+
+    return router
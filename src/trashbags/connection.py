@@ -0,0 +1,45 @@
+"""
+pyCraft ``Connection`` with extension points for the bot.
+
+pyCraft swaps its packet reactor as the connection moves from handshake to
+login to play. :class:`TrashbagConnection` lets code hook each new reactor,
+which is where raw packet frames are read and decoded.
+"""
+
+import threading
+
+from minecraft.networking.connection import Connection
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class TrashbagConnection(Connection):
+    """A ``Connection`` calling ``reactor_hooks`` on every reactor change."""
+
+    def __init__(self, *args, **kwargs):
+        # Connection.__init__ already assigns a reactor
+        self.reactor_hooks = []
+        # Hooks wrap the reactor's methods, each must see each reactor once:
+        # a switch on the network thread while a hook is added would run it
+        # twice on the new reactor
+        self._hooks_lock = threading.RLock()
+        super().__init__(*args, **kwargs)
+
+    @property
+    def reactor(self):
+        return self._trashbag_reactor
+
+    @reactor.setter
+    def reactor(self, reactor):
+        with self._hooks_lock:
+            self._trashbag_reactor = reactor
+            for hook in self.reactor_hooks:
+                hook(reactor)
+
+    def add_reactor_hook(self, hook):
+        """Call ``hook(reactor)`` on the current reactor and every later one."""
+        with self._hooks_lock:
+            self.reactor_hooks.append(hook)
+            hook(self.reactor)
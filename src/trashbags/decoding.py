@@ -0,0 +1,158 @@
+"""
+Decode only the packets something listens to.
+
+pyCraft's play reactor decodes every packet it has a class for, whether or
+not a listener wants it, and a catch-all listener on ``Packet`` (as
+``--dump-packets`` registers) does not need the fields either. A
+:class:`DecodingPolicy`, installed as a reactor hook, swaps every class no
+listener asks for by name for a lazy subclass: reading one keeps the rest
+of the frame as a zero-copy ``memoryview``, and the fields are decoded the
+first time one is accessed, so pyCraft's own handling of keep-alives and
+the like keeps working::
+
+    connection.add_reactor_hook(DecodingPolicy(connection).install)
+
+Lazy packets are still instances of their pyCraft class and keep its name;
+until decoded, their ``repr`` only shows their size.
+"""
+
+import io
+import logging
+import threading
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+# Packets may be read from several threads, each is decoded only once
+_DECODE_LOCK = threading.Lock()
+
+
+def _remaining(file_object):
+    """The unread rest of a packet buffer, without copying it if possible."""
+    stream = getattr(file_object, "bytes", file_object)
+    if isinstance(stream, io.BytesIO):
+        view = stream.getbuffer()[stream.tell() :]
+        stream.seek(0, io.SEEK_END)
+        return view
+    return memoryview(file_object.read())
+
+
+class LazyPacket:
+    """Mixed into a packet class to decode it on first field access."""
+
+    eager_class = None
+    raw = None
+
+    def read(self, file_object):
+        self.raw = _remaining(file_object)
+
+    @property
+    def decoded(self):
+        return "raw" not in self.__dict__
+
+    def decode(self):
+        """Decode the fields now, if not done yet."""
+        with _DECODE_LOCK:
+            raw = self.__dict__.get("raw")
+            if raw is not None:
+                super(LazyPacket, self).read(io.BytesIO(raw))
+                del self.__dict__["raw"]
+        return self
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not set yet
+        if name.startswith("__"):
+            raise AttributeError(name)
+        self.decode()
+        return object.__getattribute__(self, name)
+
+    def __repr__(self):
+        if self.decoded:
+            return super().__repr__()
+        name = type(self).__name__
+        return f"{name}(0x{self.id:02X}, {len(self.raw)} bytes, not decoded)"
+
+    __str__ = __repr__
+
+
+_LAZY_CLASSES = {}
+
+
+def lazy_class(packet_class):
+    """The lazy subclass of ``packet_class``, created once."""
+    lazy = _LAZY_CLASSES.get(packet_class)
+    if lazy is None:
+        lazy = _LAZY_CLASSES[packet_class] = type(
+            packet_class.__name__,
+            (LazyPacket, packet_class),
+            {
+                "__module__": packet_class.__module__,
+                "__qualname__": packet_class.__qualname__,
+                "eager_class": packet_class,
+            },
+        )
+    return lazy
+
+
+def listened_types(connection):
+    """Every packet class a listener of ``connection`` is registered for."""
+    types = set()
+    for attribute in ("early_packet_listeners", "packet_listeners"):
+        for listener in getattr(connection, attribute, ()):
+            types.update(listener.packets_to_listen)
+    return types
+
+
+class DecodingPolicy:
+    """Make lazy the play packets no listener of ``connection`` names.
+
+    Args:
+      connection: the pyCraft connection whose listeners decide
+      catch_all (tuple): classes whose listeners do not count, by default
+        pyCraft's base ``Packet``
+      eager (tuple): classes always decoded on read, by default the bot's
+        own raw packets
+    """
+
+    def __init__(self, connection, catch_all=None, eager=None):
+        self.connection = connection
+        self.catch_all = catch_all
+        self.eager = eager
+        self.lazy = set()
+
+    def needed(self, packet_class, listened):
+        if issubclass(packet_class, (LazyPacket,) + tuple(self.eager or ())):
+            return True
+        return any(issubclass(packet_class, wanted) for wanted in listened)
+
+    def apply(self, packets):
+        """Swap the classes of ``packets``, an id to class map, in place."""
+        catch_all = set(self.catch_all or ())
+        listened = tuple(listened_types(self.connection) - catch_all)
+        for packet_id, packet_class in list(packets.items()):
+            if not self.needed(packet_class, listened):
+                packets[packet_id] = lazy_class(packet_class)
+                self.lazy.add(packet_class)
+        _logger.debug(
+            "Decoding %d packet types on read, %d on demand",
+            len(packets) - len(self.lazy),
+            len(self.lazy),
+        )
+
+    def install(self, reactor):
+        """Reactor hook applying the policy to the play reactor."""
+        if type(reactor).__name__ != "PlayingReactor":
+            return
+        if self.catch_all is None:
+            from minecraft.networking.packets import Packet
+
+            self.catch_all = (Packet,)
+        if self.eager is None:
+            from .packets import RawPacket
+
+            # Already kept raw, decoded by the bot itself
+            self.eager = (RawPacket,)
+        self.apply(reactor.clientbound_packets)
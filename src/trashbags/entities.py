@@ -0,0 +1,261 @@
+"""
+Entities in view of the bot.
+
+:class:`EntityTracker` keeps every entity the server spawned in flat NumPy
+arrays (struct of arrays: id, kind, type and position per slot) rather
+than one object per entity. Relative moves, by far the most frequent
+entity packets, are queued and added in one vectorized step per tick.
+Range and nearest-neighbour queries go through a uniform grid on x/z,
+kept as entity slots sorted by cell so each row of cells is one
+``searchsorted`` slice, rebuilt only when something moved::
+
+    tracker.within(bot.position, 16, kind=PLAYER)
+    tracker.nearest(bot.position, kind=MOB)
+
+The ``apply_*`` methods decode 1.12.2 packet bodies.
+"""
+
+import struct
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .capture import decode_varint
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# Entity kinds
+OBJECT = 0
+ORB = 1
+MOB = 2
+PLAYER = 3
+
+# Relative moves are in 1/4096 of a block
+DELTA_SCALE = 1 / 4096
+
+_UUID_BYTES = 16
+_POSITION = struct.Struct(">ddd")
+_DELTA = struct.Struct(">hhh")
+
+_ROW = 1 << 32
+_ROW_OFFSET = 1 << 31
+
+
+class EntityTracker:
+    """Positions of the entities around the bot.
+
+    Args:
+      capacity (int): slots allocated up front, doubled when full
+      cell (float): side of a grid cell, in blocks
+    """
+
+    def __init__(self, capacity=1024, cell=16.0):
+        if np is None:
+            raise ImportError(
+                "entity tracking needs NumPy: pip install trashbags[numpy]"
+            )
+        self.cell = cell
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.kinds = np.zeros(capacity, dtype=np.int8)
+        self.types = np.zeros(capacity, dtype=np.int16)
+        self.positions = np.zeros((capacity, 3), dtype=np.float64)
+        self.moves = 0
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._pending = []
+        self._grid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, entity_id):
+        return entity_id in self._slots
+
+    def _grow(self):
+        size = len(self.ids)
+        self.ids = np.concatenate((self.ids, np.full(size, -1, dtype=np.int64)))
+        self.kinds = np.concatenate((self.kinds, np.zeros(size, dtype=np.int8)))
+        self.types = np.concatenate((self.types, np.zeros(size, dtype=np.int16)))
+        self.positions = np.concatenate((self.positions, np.zeros((size, 3))))
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def _flush(self):
+        pending = self._pending
+        if pending:
+            self._pending = []
+            moves = np.array(pending, dtype=np.float64)
+            np.add.at(
+                self.positions, moves[:, 0].astype(np.intp), moves[:, 1:] * DELTA_SCALE
+            )
+            self._grid = None
+
+    def flush(self):
+        """Apply the relative moves queued since the last flush."""
+        with self._lock:
+            self._flush()
+
+    def clear(self):
+        with self._lock:
+            self.ids[:] = -1
+            self._slots.clear()
+            self._free = list(range(len(self.ids) - 1, -1, -1))
+            self._pending = []
+            self._grid = None
+
+    def spawn(self, entity_id, kind, type_id, x, y, z):
+        with self._lock:
+            self._flush()
+            slot = self._slots.get(entity_id)
+            if slot is None:
+                if not self._free:
+                    self._grow()
+                slot = self._slots[entity_id] = self._free.pop()
+            self.ids[slot] = entity_id
+            self.kinds[slot] = kind
+            self.types[slot] = type_id
+            self.positions[slot] = (x, y, z)
+            self._grid = None
+
+    def move(self, entity_id, dx, dy, dz):
+        """Queue a move, in 1/4096 of a block, until the next flush."""
+        with self._lock:
+            slot = self._slots.get(entity_id)
+            if slot is not None:
+                self._pending.append((slot, dx, dy, dz))
+                self.moves += 1
+
+    def teleport(self, entity_id, x, y, z):
+        with self._lock:
+            slot = self._slots.get(entity_id)
+            if slot is not None:
+                self._flush()
+                self.positions[slot] = (x, y, z)
+                self._grid = None
+
+    def destroy(self, entity_ids):
+        with self._lock:
+            self._flush()
+            for entity_id in entity_ids:
+                slot = self._slots.pop(entity_id, None)
+                if slot is not None:
+                    self.ids[slot] = -1
+                    self._free.append(slot)
+            self._grid = None
+
+    def position_of(self, entity_id):
+        with self._lock:
+            self._flush()
+            slot = self._slots.get(entity_id)
+            return None if slot is None else tuple(self.positions[slot].tolist())
+
+    def _index(self):
+        if self._grid is None:
+            slots = np.flatnonzero(self.ids >= 0)
+            cells = np.floor(self.positions[slots][:, [0, 2]] / self.cell).astype(
+                np.int64
+            )
+            keys = cells[:, 0] * _ROW + (cells[:, 1] + _ROW_OFFSET)
+            order = np.argsort(keys, kind="stable")
+            self._grid = (keys[order], slots[order])
+        return self._grid
+
+    def _candidates(self, center, radius):
+        keys, slots = self._index()
+        low_x, _, low_z = np.floor((center - radius) / self.cell).astype(np.int64)
+        high_x, _, high_z = np.floor((center + radius) / self.cell).astype(np.int64)
+        rows = np.arange(low_x, high_x + 1, dtype=np.int64) * _ROW
+        starts = np.searchsorted(keys, rows + low_z + _ROW_OFFSET, "left")
+        ends = np.searchsorted(keys, rows + high_z + _ROW_OFFSET, "right")
+        if not (ends > starts).any():
+            return slots[:0]
+        return np.concatenate([slots[s:e] for s, e in zip(starts, ends) if e > s])
+
+    def _select(self, slots, center, radius, kind):
+        if kind is not None:
+            slots = slots[self.kinds[slots] == kind]
+        distances = np.linalg.norm(self.positions[slots] - center, axis=1)
+        inside = distances <= radius
+        slots, distances = slots[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return self.ids[slots[order]], distances[order]
+
+    def within(self, center, radius, kind=None):
+        """Entities within ``radius`` blocks of ``center``, nearest first.
+
+        Returns:
+          tuple: arrays of entity ids and of their distances
+        """
+        center = np.asarray(center, dtype=np.float64)
+        with self._lock:
+            self._flush()
+            return self._select(self._candidates(center, radius), center, radius, kind)
+
+    def nearest(self, center, kind=None, count=1, max_radius=256.0):
+        """The ``count`` entities closest to ``center``.
+
+        The search widens from one cell until enough are found.
+
+        Returns:
+          tuple: arrays of entity ids and of their distances, nearest first
+        """
+        center = np.asarray(center, dtype=np.float64)
+        radius = self.cell
+        with self._lock:
+            self._flush()
+            while True:
+                ids, distances = self._select(
+                    self._candidates(center, radius), center, radius, kind
+                )
+                if len(ids) >= count or radius >= max_radius:
+                    return ids[:count], distances[:count]
+                radius = min(radius * 2, max_radius)
+
+    def counts(self):
+        """Number of tracked entities of each kind."""
+        with self._lock:
+            kinds = self.kinds[self.ids >= 0]
+        return {kind: int((kinds == kind).sum()) for kind in (OBJECT, ORB, MOB, PLAYER)}
+
+    # Packet bodies, 1.12.2
+
+    def apply_spawn_object(self, data):
+        entity_id, offset = decode_varint(data)
+        offset += _UUID_BYTES
+        type_id = data[offset]
+        self.spawn(entity_id, OBJECT, type_id, *_POSITION.unpack_from(data, offset + 1))
+
+    def apply_spawn_orb(self, data):
+        entity_id, offset = decode_varint(data)
+        self.spawn(entity_id, ORB, 0, *_POSITION.unpack_from(data, offset))
+
+    def apply_spawn_mob(self, data):
+        entity_id, offset = decode_varint(data)
+        type_id, offset = decode_varint(data, offset + _UUID_BYTES)
+        self.spawn(entity_id, MOB, type_id, *_POSITION.unpack_from(data, offset))
+
+    def apply_spawn_player(self, data):
+        entity_id, offset = decode_varint(data)
+        position = _POSITION.unpack_from(data, offset + _UUID_BYTES)
+        self.spawn(entity_id, PLAYER, 0, *position)
+
+    def apply_relative_move(self, data):
+        entity_id, offset = decode_varint(data)
+        self.move(entity_id, *_DELTA.unpack_from(data, offset))
+
+    def apply_teleport(self, data):
+        entity_id, offset = decode_varint(data)
+        self.teleport(entity_id, *_POSITION.unpack_from(data, offset))
+
+    def apply_destroy(self, data):
+        count, offset = decode_varint(data)
+        entity_ids = []
+        for _ in range(count):
+            entity_id, offset = decode_varint(data, offset)
+            entity_ids.append(entity_id)
+        self.destroy(entity_ids)
@@ -0,0 +1,435 @@
+"""
+Chat, whispers, joins and leaves, kept in a SQLite database.
+
+Listeners hand events to an :class:`EventStore` with :meth:`~EventStore.record`,
+which only appends a tuple to an in-memory buffer; a background thread
+commits whatever accumulated every ``flush_interval`` seconds in one
+transaction, so a listener never waits on the disk and thousands of
+messages a second cost one commit each flush. Several bots, and several
+processes of a ``--shards`` pool, may share one database.
+
+Every bot on a server sees the same chat, so only one records it: within a
+process, the first bot in the game on that server that asks
+:meth:`~EventStore.records` (another takes over when it leaves), and
+between processes, the one holding the server's lease in the ``recorders``
+table. A lease is renewed by each commit of events from its server and
+lapses ``LEASE`` seconds after the last; events of servers leased to
+another process are discarded when committing.
+
+Events are indexed by sender UUID, by sender name and by time, and their
+text by a full-text index (SQLite's FTS5, or a plain scan where SQLite was
+built without it)::
+
+    store = EventStore("events.db").start()
+    if store.records(server, bot):
+        store.record(CHAT, "miner", "hello there", "alice", uuid, server=server)
+    store.query(text="hello", since=time.time() - 3600)
+
+    python -m trashbags.events events.db --sender alice --since 2h
+"""
+
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from optparse import OptionParser
+from typing import NamedTuple, Optional
+
+from .chat import CHAT, SYSTEM, WHISPER
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+JOIN = "join"
+LEAVE = "leave"
+KINDS = (CHAT, WHISPER, SYSTEM, JOIN, LEAVE)
+
+# Seconds a process keeps recording a server after its last event from it
+LEASE = 10.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    server TEXT,
+    bot TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sender TEXT,
+    uuid TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_uuid ON events (uuid, time);
+CREATE INDEX IF NOT EXISTS events_sender ON events (sender COLLATE NOCASE, time);
+CREATE TABLE IF NOT EXISTS recorders (
+    server TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+_FULL_TEXT = """
+CREATE VIRTUAL TABLE IF NOT EXISTS events_text USING fts5 (
+    text, content='events', content_rowid='id'
+);
+"""
+
+_INSERT = (
+    "INSERT INTO events (time, server, bot, kind, sender, uuid, text) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+# One statement indexes a whole batch, four times faster than a trigger
+_INDEX_TEXT = (
+    "INSERT INTO events_text (rowid, text) SELECT id, text FROM events WHERE id > ?"
+)
+# Take the lease of a server if it is ours or has lapsed
+_LEASE = (
+    "INSERT INTO recorders (server, owner, expires) VALUES (?, ?, ?) "
+    "ON CONFLICT (server) DO UPDATE SET owner = excluded.owner, "
+    "expires = excluded.expires "
+    "WHERE recorders.owner = excluded.owner OR recorders.expires < ?"
+)
+
+
+class Event(NamedTuple):
+    id: int
+    time: float
+    server: Optional[str]
+    bot: str
+    kind: str
+    sender: Optional[str]
+    uuid: Optional[str]
+    text: str
+
+    def __str__(self):
+        when = datetime.fromtimestamp(self.time).strftime("%Y-%m-%d %H:%M:%S")
+        sender = f" <{self.sender}>" if self.sender else ""
+        return f"[{when}] {self.bot} {self.kind}{sender} {self.text}"
+
+
+def connect(path, timeout=30.0):
+    """Open ``path``, creating the tables it lacks.
+
+    Returns:
+      tuple: the connection, and whether it has the full-text index
+    """
+    # Transactions are opened explicitly, see EventStore.flush
+    connection = sqlite3.connect(
+        path, timeout=timeout, isolation_level=None, check_same_thread=False
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(_SCHEMA)
+    try:
+        connection.executescript(_FULL_TEXT)
+        full_text = True
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5
+        full_text = False
+    return connection, full_text
+
+
+def match_words(text):
+    """An FTS5 query for rows holding every word of ``text``.
+
+    Words are quoted, so punctuation (``don't``, ``anti-grief``) is
+    searched for rather than read as query syntax; a trailing ``*`` still
+    matches a prefix.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word[:-1] if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class EventStore:
+    """Append-only event log with a background writer.
+
+    Args:
+      path (str): SQLite database, created if missing
+      buffer (int): events held in memory before the oldest are dropped
+      flush_interval (float): seconds between two commits
+    """
+
+    def __init__(self, path, buffer=100000, flush_interval=0.2):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.owner = uuid.uuid4().hex
+        self.recorded = 0
+        self.committed = 0
+        self.dropped = 0
+        # Events of servers another process records
+        self.skipped = 0
+        self.commits = 0
+        self._ring = deque(maxlen=buffer)
+        self._recorders = {}
+        self._connection, self.full_text = connect(path)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="trashbags-events", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def records(self, server, bot):
+        """Whether ``bot`` is the bot of this process recording ``server``.
+
+        The first bot in the game on a server records it until it leaves
+        the game; bots that are not in the game never record.
+        """
+        if not bot.spawned:
+            return False
+        with self._lock:
+            current = self._recorders.get(server)
+            if current is None or (current is not bot and not current.spawned):
+                self._recorders[server] = current = bot
+        return current is bot
+
+    def record(
+        self, kind, bot, text, sender=None, uuid=None, timestamp=None, server=None
+    ):
+        """Queue an event, without waiting for it to be written."""
+        ring = self._ring
+        if len(ring) == ring.maxlen:
+            self.dropped += 1
+        ring.append(
+            (
+                time.time() if timestamp is None else timestamp,
+                server,
+                bot,
+                kind,
+                sender,
+                uuid,
+                text,
+            )
+        )
+        self.recorded += 1
+
+    def flush(self):
+        """Commit every queued event in one transaction.
+
+        Returns:
+          int: events committed
+        """
+        ring = self._ring
+        batch = []
+        while ring:
+            batch.append(ring.popleft())
+        if not batch:
+            return 0
+        connection = self._connection
+        with self._lock:
+            # Taking the write lock first keeps other processes from adding
+            # rows between reading the last id and indexing the new ones
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                held = self._lease({row[1] for row in batch} - {None})
+                rows = [row for row in batch if row[1] is None or row[1] in held]
+                if self.full_text:
+                    last = connection.execute("SELECT max(id) FROM events")
+                    last = last.fetchone()[0] or 0
+                connection.executemany(_INSERT, rows)
+                if self.full_text:
+                    connection.execute(_INDEX_TEXT, (last,))
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                self.dropped += len(batch)
+                raise
+        self.skipped += len(batch) - len(rows)
+        self.committed += len(rows)
+        self.commits += 1
+        return len(rows)
+
+    def _lease(self, servers):
+        """Renew or take the leases of ``servers``, in the open transaction.
+
+        Returns:
+          set: the servers this store may record
+        """
+        if not servers:
+            return set()
+        connection = self._connection
+        now = time.time()
+        connection.executemany(
+            _LEASE, [(server, self.owner, now + LEASE, now) for server in servers]
+        )
+        owned = connection.execute(
+            "SELECT server FROM recorders WHERE owner = ?", (self.owner,)
+        )
+        return {server for (server,) in owned} & servers
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                _logger.exception("Writing events to %s failed", self.path)
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._connection.close()
+
+    def query(
+        self,
+        text=None,
+        sender=None,
+        uuid=None,
+        kind=None,
+        bot=None,
+        server=None,
+        since=None,
+        until=None,
+        limit=100,
+    ):
+        """Committed events matching every given filter, newest first.
+
+        Args:
+          text (str): words the text contains, searched in the full text
+            index when there is one, as a substring otherwise; a word
+            ending in ``*`` matches a prefix in the index
+          sender (str): sender name, in any case
+          since, until (float): Unix time bounds
+
+        Returns:
+          list of Event
+        """
+        return query(
+            self._connection,
+            self.full_text,
+            self._lock,
+            text=text,
+            sender=sender,
+            uuid=uuid,
+            kind=kind,
+            bot=bot,
+            server=server,
+            since=since,
+            until=until,
+            limit=limit,
+        )
+
+
+def query(connection, full_text, lock=None, text=None, limit=100, **filters):
+    """Run an :meth:`EventStore.query` on an open ``connection``."""
+    clauses = []
+    parameters = []
+    for column, value in (
+        ("e.uuid = ?", filters.get("uuid")),
+        ("e.sender = ? COLLATE NOCASE", filters.get("sender")),
+        ("e.kind = ?", filters.get("kind")),
+        ("e.bot = ?", filters.get("bot")),
+        ("e.server = ?", filters.get("server")),
+        ("e.time >= ?", filters.get("since")),
+        ("e.time < ?", filters.get("until")),
+    ):
+        if value is not None:
+            clauses.append(column)
+            parameters.append(value)
+    if text is not None and text.strip():
+        if full_text:
+            clauses.append("e.id IN (SELECT rowid FROM events_text WHERE text MATCH ?)")
+            parameters.append(match_words(text))
+        else:
+            clauses.append("e.text LIKE ?")
+            parameters.append(f"%{text}%")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    statement = (
+        f"SELECT e.id, e.time, e.server, e.bot, e.kind, e.sender, e.uuid, e.text "
+        f"FROM events AS e {where} ORDER BY e.time DESC, e.id DESC LIMIT ?"
+    )
+    parameters.append(-1 if limit is None else limit)
+    with lock or threading.Lock():
+        rows = connection.execute(statement, parameters).fetchall()
+    return [Event(*row) for row in rows]
+
+
+_AGO = re.compile(r"^(\d+(?:\.\d+)?)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_time(value, now=None):
+    """Unix time of ``30m``/``2h``/``7d`` ago, or of an ISO 8601 date."""
+    match = _AGO.match(value)
+    if match:
+        now = time.time() if now is None else now
+        return now - float(match.group(1)) * _UNITS[match.group(2)]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: '{value}'") from None
+
+
+def main(args):
+    parser = OptionParser(usage="%prog [options] DATABASE")
+    parser.add_option("-t", "--text", dest="text", help="words the message contains")
+    parser.add_option("-s", "--sender", dest="sender", help="sender name")
+    parser.add_option("-u", "--uuid", dest="uuid", help="sender UUID")
+    parser.add_option("-k", "--kind", dest="kind", choices=KINDS)
+    parser.add_option("-b", "--bot", dest="bot", help="bot that saw the event")
+    parser.add_option("--server", dest="server", help="server, as ADDRESS:PORT")
+    parser.add_option(
+        "--since", dest="since", help="start time, ISO 8601 or e.g. 30m, 2h, 7d ago"
+    )
+    parser.add_option("--until", dest="until", help="end time, as --since")
+    parser.add_option("-n", "--limit", dest="limit", type="int", default=50)
+    (options, args) = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error("expected one database")
+
+    try:
+        since = parse_time(options.since) if options.since else None
+        until = parse_time(options.until) if options.until else None
+    except ValueError as error:
+        parser.error(str(error))
+    connection, full_text = connect(args[0])
+    try:
+        events = query(
+            connection,
+            full_text,
+            text=options.text,
+            sender=options.sender,
+            uuid=options.uuid,
+            kind=options.kind,
+            bot=options.bot,
+            server=options.server,
+            since=since,
+            until=until,
+            limit=options.limit,
+        )
+    except sqlite3.Error as error:
+        parser.error(f"search failed: {error}")
+    finally:
+        connection.close()
+    # Oldest first, as a log reads
+    for event in reversed(events):
+        print(event)
+
+
+def run():
+    """Entry point for console_scripts"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,489 @@
+"""
+A stand-in Minecraft 1.12.2 server for load tests.
+
+:class:`FakeServer` speaks just enough of protocol 340 (status, offline
+login, and the play packets :class:`~trashbags.trashbag.Trashbag` listens
+to) to accept hundreds of bots on one asyncio loop, then keeps them busy
+with configurable player-list churn, chat floods and position corrections.
+No compression, encryption or world data is sent.
+
+    python -m trashbags.fakeserver --port 25565 --chat-rate 20 --churn-rate 5
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import struct
+import sys
+import time
+import uuid
+from optparse import OptionParser
+
+from .capture import decode_varint, encode_varint
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 340
+VERSION_NAME = "1.12.2"
+
+# Handshaking, status and login states
+HANDSHAKE = 0x00
+STATUS_REQUEST = 0x00
+STATUS_RESPONSE = 0x00
+PING = 0x01
+PONG = 0x01
+LOGIN_START = 0x00
+LOGIN_SUCCESS = 0x02
+
+# Clientbound play
+CHAT_MESSAGE = 0x0F
+DISCONNECT = 0x1A
+KEEP_ALIVE = 0x1F
+JOIN_GAME = 0x23
+PLAYER_LIST_ITEM = 0x2E
+PLAYER_POSITION_AND_LOOK = 0x2F
+TIME_UPDATE = 0x47
+
+# Serverbound play
+SERVERBOUND_KEEP_ALIVE = 0x0B
+SERVERBOUND_CHAT = 0x02
+
+ADD_PLAYER = 0
+REMOVE_PLAYER = 4
+
+_DOUBLE3_FLOAT2_BYTE = struct.Struct(">dddffb")
+_LONG = struct.Struct(">q")
+_LONG2 = struct.Struct(">qq")
+
+
+def pack_string(value):
+    data = value.encode("utf-8")
+    return encode_varint(len(data)) + data
+
+
+def unpack_string(data, offset):
+    length, offset = decode_varint(data, offset)
+    return data[offset : offset + length].decode("utf-8"), offset + length
+
+
+def offline_uuid(name):
+    """The UUID vanilla servers give ``name`` in offline mode.
+
+    Java's ``UUID.nameUUIDFromBytes``: a version 3 UUID of the name alone,
+    unlike :func:`uuid.uuid3` which also hashes a namespace.
+    """
+    digest = hashlib.md5(("OfflinePlayer:" + name).encode()).digest()
+    return uuid.UUID(bytes=digest, version=3)
+
+
+def frame(packet_id, payload=b""):
+    body = encode_varint(packet_id) + payload
+    return encode_varint(len(body)) + body
+
+
+async def read_frame(reader):
+    """Read one uncompressed frame, returning (packet id, payload)."""
+    length = shift = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    body = await reader.readexactly(length)
+    packet_id, offset = decode_varint(body)
+    return packet_id, body[offset:]
+
+
+def join_game(entity_id):
+    return frame(
+        JOIN_GAME,
+        struct.pack(">iBiBB", entity_id, 0, 0, 1, 100)
+        + pack_string("default")
+        + b"\x00",
+    )
+
+
+def position_and_look(x, y, z, yaw=0.0, pitch=0.0, teleport_id=0):
+    return frame(
+        PLAYER_POSITION_AND_LOOK,
+        _DOUBLE3_FLOAT2_BYTE.pack(x, y, z, yaw, pitch, 0) + encode_varint(teleport_id),
+    )
+
+
+def chat_message(text_json, position=0):
+    return frame(CHAT_MESSAGE, pack_string(text_json) + bytes((position,)))
+
+
+def add_players(players):
+    """``PlayerListItem`` adding (uuid, name) pairs in one packet."""
+    payload = [encode_varint(ADD_PLAYER), encode_varint(len(players))]
+    for player_uuid, name in players:
+        payload.append(player_uuid.bytes)
+        payload.append(pack_string(name))
+        # No properties, survival, 50 ms, no display name
+        payload.append(b"\x00\x00" + encode_varint(50) + b"\x00")
+    return frame(PLAYER_LIST_ITEM, b"".join(payload))
+
+
+def remove_players(uuids):
+    payload = [encode_varint(REMOVE_PLAYER), encode_varint(len(uuids))]
+    payload.extend(player_uuid.bytes for player_uuid in uuids)
+    return frame(PLAYER_LIST_ITEM, b"".join(payload))
+
+
+def whisper_json(sender, text):
+    return json.dumps(
+        {
+            "color": "gray",
+            "extra": [
+                {"text": "["},
+                {"color": "light_purple", "text": sender},
+                {"text": " -> me] "},
+                {"text": text},
+            ],
+            "text": "",
+        }
+    )
+
+
+def chat_json(sender, text):
+    return json.dumps({"extra": [{"text": f"<{sender}> {text}"}], "text": ""})
+
+
+class ServerStats:
+    """Totals across every connection of a :class:`FakeServer`."""
+
+    def __init__(self):
+        self.connections = 0
+        self.active = 0
+        self.logins = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.packets_received = 0
+        self.bytes_received = 0
+        self.keep_alive_rtts = []
+        # Seconds from accepting the socket to sending JoinGame
+        self.setup_times = []
+
+    def as_dict(self):
+        def mean(values):
+            return sum(values) / len(values) if values else None
+
+        return {
+            "connections": self.connections,
+            "active": self.active,
+            "logins": self.logins,
+            "packets_sent": self.packets_sent,
+            "bytes_sent": self.bytes_sent,
+            "packets_received": self.packets_received,
+            "bytes_received": self.bytes_received,
+            "mean_setup_time": mean(self.setup_times),
+            "mean_keep_alive_rtt": mean(self.keep_alive_rtts),
+        }
+
+
+class _Client:
+    __slots__ = ("reader", "writer", "name", "uuid", "keep_alive", "teleport_id")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.name = None
+        self.uuid = None
+        self.keep_alive = {}
+        self.teleport_id = 0
+
+
+class FakeServer:
+    """Offline-mode 1.12.2 server generating synthetic load.
+
+    Args:
+      host (str): address to listen on
+      port (int): port to listen on, 0 picks a free one
+      chat_rate (float): chat messages per second sent to each client
+      whisper_ratio (float): share of those chat messages that are whispers
+      churn_rate (float): fake players joining (and later leaving) per second
+      churn_batch (int): players per ``PlayerListItem`` packet
+      correction_rate (float): position corrections per second per client
+      keep_alive_interval (float): seconds between keep-alives
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=25565,
+        chat_rate=0.0,
+        whisper_ratio=0.1,
+        churn_rate=0.0,
+        churn_batch=1,
+        correction_rate=0.0,
+        keep_alive_interval=15.0,
+        senders=("Steve", "Alex"),
+        seed=None,
+    ):
+        self.host = host
+        self.port = port
+        self.chat_rate = chat_rate
+        self.whisper_ratio = whisper_ratio
+        self.churn_rate = churn_rate
+        self.churn_batch = churn_batch
+        self.correction_rate = correction_rate
+        self.keep_alive_interval = keep_alive_interval
+        self.senders = [(offline_uuid(name), name) for name in senders]
+        self.stats = ServerStats()
+        self.clients = set()
+        self._rng = random.Random(seed)
+        self._server = None
+        self._entity_ids = iter(range(1, 1 << 31))
+        self._fake_players = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        for client in list(self.clients):
+            client.writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _send(self, client, data):
+        client.writer.write(data)
+        self.stats.packets_sent += 1
+        self.stats.bytes_sent += len(data)
+
+    async def _handle(self, reader, writer):
+        client = _Client(reader, writer)
+        accepted = time.perf_counter()
+        self.stats.connections += 1
+        try:
+            packet_id, payload = await read_frame(reader)
+            if packet_id != HANDSHAKE:
+                return
+            _, offset = decode_varint(payload)
+            _, offset = unpack_string(payload, offset)
+            next_state, _ = decode_varint(payload, offset + 2)
+            if next_state == 1:
+                await self._status(client)
+            elif next_state == 2:
+                await self._login(client, accepted)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _status(self, client):
+        status = {
+            "version": {"name": VERSION_NAME, "protocol": PROTOCOL_VERSION},
+            "players": {"max": 1000, "online": len(self.clients)},
+            "description": {"text": "trashbags fake server"},
+        }
+        while True:
+            packet_id, payload = await read_frame(client.reader)
+            if packet_id == STATUS_REQUEST:
+                self._send(
+                    client, frame(STATUS_RESPONSE, pack_string(json.dumps(status)))
+                )
+            elif packet_id == PING:
+                self._send(client, frame(PONG, payload))
+                await client.writer.drain()
+                return
+            await client.writer.drain()
+
+    async def _login(self, client, accepted):
+        packet_id, payload = await read_frame(client.reader)
+        if packet_id != LOGIN_START:
+            return
+        client.name, _ = unpack_string(payload, 0)
+        client.uuid = offline_uuid(client.name)
+        self._send(
+            client,
+            frame(
+                LOGIN_SUCCESS, pack_string(str(client.uuid)) + pack_string(client.name)
+            ),
+        )
+        self._send(client, join_game(next(self._entity_ids)))
+        self._send(client, add_players([(client.uuid, client.name)] + self.senders))
+        self._send(client, position_and_look(0.5, 64.0, 0.5))
+        await client.writer.drain()
+        self.stats.logins += 1
+        self.stats.setup_times.append(time.perf_counter() - accepted)
+
+        self.clients.add(client)
+        self.stats.active += 1
+        tasks = [asyncio.ensure_future(self._keep_alive(client))]
+        for rate, generator in (
+            (self.chat_rate, self._chat_flood),
+            (self.churn_rate, self._churn),
+            (self.correction_rate, self._corrections),
+        ):
+            if rate > 0:
+                tasks.append(asyncio.ensure_future(generator(client, rate)))
+        try:
+            await self._play(client)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.clients.discard(client)
+            self.stats.active -= 1
+
+    async def _play(self, client):
+        stats = self.stats
+        while True:
+            packet_id, payload = await read_frame(client.reader)
+            stats.packets_received += 1
+            stats.bytes_received += len(payload) + 2
+            if packet_id == SERVERBOUND_KEEP_ALIVE:
+                (key,) = _LONG.unpack_from(payload)
+                sent = client.keep_alive.pop(key, None)
+                if sent is not None:
+                    stats.keep_alive_rtts.append(time.perf_counter() - sent)
+
+    async def _every(self, rate, client, send):
+        """Call ``send()`` ``rate`` times a second, draining the socket."""
+        interval = 1.0 / rate
+        deadline = time.perf_counter()
+        try:
+            while True:
+                deadline += interval
+                send()
+                await client.writer.drain()
+                await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+        except ConnectionError:
+            pass
+
+    async def _keep_alive(self, client):
+        def send():
+            key = self._rng.getrandbits(62)
+            client.keep_alive[key] = time.perf_counter()
+            self._send(client, frame(KEEP_ALIVE, _LONG.pack(key)))
+
+        await asyncio.sleep(self.keep_alive_interval)
+        await self._every(1.0 / self.keep_alive_interval, client, send)
+
+    async def _chat_flood(self, client, rate):
+        counter = iter(range(1 << 62))
+
+        def send():
+            sender = self._rng.choice(self.senders)[1]
+            text = f"message {next(counter)}"
+            if self._rng.random() < self.whisper_ratio:
+                self._send(client, chat_message(whisper_json(sender, text)))
+            else:
+                self._send(client, chat_message(chat_json(sender, text)))
+
+        await self._every(rate, client, send)
+
+    async def _churn(self, client, rate):
+        joined = []
+
+        def send():
+            batch = []
+            for _ in range(self.churn_batch):
+                self._fake_players += 1
+                name = f"churn{self._fake_players}"
+                batch.append((offline_uuid(name), name))
+            self._send(client, add_players(batch))
+            joined.extend(player_uuid for player_uuid, _ in batch)
+            if len(joined) > 100 * self.churn_batch:
+                leaving = joined[: self.churn_batch]
+                del joined[: self.churn_batch]
+                self._send(client, remove_players(leaving))
+
+        await self._every(rate / self.churn_batch, client, send)
+
+    async def _corrections(self, client, rate):
+        def send():
+            client.teleport_id += 1
+            x, z = self._rng.uniform(-5, 5), self._rng.uniform(-5, 5)
+            self._send(
+                client, position_and_look(x, 64.0, z, teleport_id=client.teleport_id)
+            )
+
+        await self._every(rate, client, send)
+
+    def broadcast_time(self, world_age, time_of_day):
+        for client in self.clients:
+            self._send(client, frame(TIME_UPDATE, _LONG2.pack(world_age, time_of_day)))
+
+
+def main(args):
+    parser = OptionParser()
+    parser.add_option("--host", dest="host", default="127.0.0.1")
+    parser.add_option("-p", "--port", dest="port", type="int", default=25565)
+    parser.add_option(
+        "--chat-rate",
+        dest="chat_rate",
+        type="float",
+        default=0.0,
+        help="chat messages per second per client",
+    )
+    parser.add_option(
+        "--whisper-ratio", dest="whisper_ratio", type="float", default=0.1
+    )
+    parser.add_option(
+        "--churn-rate",
+        dest="churn_rate",
+        type="float",
+        default=0.0,
+        help="fake players joining per second",
+    )
+    parser.add_option("--churn-batch", dest="churn_batch", type="int", default=1)
+    parser.add_option(
+        "--correction-rate",
+        dest="correction_rate",
+        type="float",
+        default=0.0,
+        help="position corrections per second per client",
+    )
+    parser.add_option(
+        "--stats-interval", dest="stats_interval", type="float", default=10.0
+    )
+    (options, args) = parser.parse_args(args)
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+
+    server = FakeServer(
+        options.host,
+        options.port,
+        chat_rate=options.chat_rate,
+        whisper_ratio=options.whisper_ratio,
+        churn_rate=options.churn_rate,
+        churn_batch=options.churn_batch,
+        correction_rate=options.correction_rate,
+    )
+
+    async def serve():
+        await server.start()
+        _logger.info("Listening on %s:%d", server.host, server.port)
+        while True:
+            await asyncio.sleep(options.stats_interval)
+            _logger.info("%s", server.stats.as_dict())
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def run():
+    """Entry point for console_scripts"""
+    main(sys.argv[1:])
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,200 @@
+"""
+Run several :class:`~trashbags.trashbag.Trashbag` bots in one process.
+
+A roster is an INI file with one section per account. Keys in
+``[DEFAULT]`` apply to every account::
+
+    [DEFAULT]
+    server = mc.example.org:25565
+    microsoft = yes
+
+    [miner]
+    username = miner@example.org
+
+    [guard]
+    username = guard@example.org
+    server = other.example.org
+
+All bots share one :class:`~trashbags.scheduler.Scheduler`, the process
+logging setup, the same ``auth_list`` object and any listener added with
+:meth:`Fleet.add_listener`.
+"""
+
+import copy
+import logging
+import os
+import re
+from configparser import ConfigParser
+from functools import partial
+
+from .scheduler import Scheduler
+from .supervisor import ConnectionSupervisor
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+_ADDRESS = re.compile(
+    r"((?P<host>[^\[\]:]+)|\[(?P<addr>[^\[\]]+)\])" r"(:(?P<port>\d+))?$"
+)
+
+_BOOLEAN_KEYS = ("offline", "microsoft", "dump_packets", "dump_unknown")
+
+
+def parse_address(server):
+    """Split ``host``, ``host:port`` or ``[ipv6]:port`` into (address, port)."""
+    match = _ADDRESS.match(server)
+    if match is None:
+        raise ValueError("Invalid server address: '%s'." % server)
+    return match.group("host") or match.group("addr"), int(match.group("port") or 25565)
+
+
+def load_roster(path, defaults):
+    """Read a roster file into one options object per account.
+
+    Args:
+      path (str): path of the INI roster
+      defaults: options every account starts from, usually from
+        ``get_options``; it is shallow-copied so ``auth_list`` stays shared
+
+    Returns:
+      list: per-account options, in file order
+    """
+    parser = ConfigParser()
+    with open(path, encoding="utf-8") as roster:
+        parser.read_file(roster)
+
+    accounts = []
+    for name in parser.sections():
+        section = parser[name]
+        options = copy.copy(defaults)
+        options.name = name
+        options.username = section.get("username", name)
+        options.password = section.get("password", None)
+        for key in _BOOLEAN_KEYS:
+            if key in section:
+                setattr(options, key, section.getboolean(key))
+        server = section.get("server", getattr(defaults, "server", None))
+        if not server:
+            raise ValueError(f"No server given for account '{name}'")
+        options.server = server
+        options.address, options.port = parse_address(server)
+        accounts.append(options)
+    return accounts
+
+
+def resident_memory():
+    """Resident set size of this process, in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):  # pragma: no cover
+        import resource
+
+        # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Fleet:
+    """Start, share listeners across and stop a set of bots.
+
+    Args:
+      roster (list): per-account options, see :func:`load_roster`
+      stagger (float): seconds between two bot start-ups
+      scheduler (Scheduler): shared scheduler, one is created if omitted
+      bot_factory: callable building a bot from its options
+      supervisor_factory: builds the ConnectionSupervisor keeping a bot online
+    """
+
+    def __init__(
+        self,
+        roster,
+        stagger=2.0,
+        scheduler=None,
+        bot_factory=None,
+        supervisor_factory=ConnectionSupervisor,
+    ):
+        if bot_factory is None:
+            from .trashbag import Trashbag as bot_factory
+
+        self.roster = list(roster)
+        self.stagger = stagger
+        self.scheduler = scheduler or Scheduler()
+        self.bot_factory = bot_factory
+        self.supervisor_factory = supervisor_factory
+        self.bots = []
+        self.supervisors = {}
+        self.startup_memory = {}
+        self._listeners = []
+
+    def add_listener(self, handler, *packet_types, **kwargs):
+        """Register ``handler(bot, packet)`` on every bot, current and future."""
+        self._listeners.append((handler, packet_types, kwargs))
+        for bot in self.bots:
+            if bot.connection is not None:
+                self._attach(bot, handler, packet_types, kwargs)
+
+    def _attach_all(self, bot):
+        for handler, packet_types, kwargs in self._listeners:
+            self._attach(bot, handler, packet_types, kwargs)
+
+    def _attach(self, bot, handler, packet_types, kwargs):
+        bot.connection.register_packet_listener(
+            partial(handler, bot), *packet_types, **kwargs
+        )
+
+    def start(self):
+        """Schedule every account's start-up, ``stagger`` seconds apart."""
+        self.scheduler.start()
+        for index, options in enumerate(self.roster):
+            self.scheduler.call_later(index * self.stagger, self.start_bot, options)
+
+    def add(self, options, delay=0.0):
+        """Start one more account, ``delay`` seconds from now."""
+        self.roster.append(options)
+        self.scheduler.start()
+        self.scheduler.call_later(delay, self.start_bot, options)
+
+    def start_bot(self, options):
+        name = getattr(options, "name", options.username)
+        before = resident_memory()
+        try:
+            bot = self.bot_factory(options)
+            bot.login()
+        except Exception as error:
+            _logger.error("Bot %s failed to log in: %r", name, error)
+            return None
+        supervisor = self.supervisor_factory(
+            bot, self.scheduler, on_connect=[self._attach_all]
+        )
+        # A failed first connect is retried by the supervisor
+        supervisor.start()
+        self.supervisors[name] = supervisor
+        self.bots.append(bot)
+        self.startup_memory[name] = resident_memory() - before
+        _logger.info("Bot %s started (%d/%d)", name, len(self.bots), len(self.roster))
+        return bot
+
+    def stop(self):
+        for supervisor in self.supervisors.values():
+            supervisor.stop()
+        self.scheduler.stop()
+
+    def reconnect_stats(self):
+        return {name: sup.stats.as_dict() for name, sup in self.supervisors.items()}
+
+    def memory_report(self):
+        """Memory used by the fleet, per bot.
+
+        Returns:
+          dict: ``startup`` maps each bot name to the resident memory its
+          start-up added, ``per_bot`` is the process RSS divided evenly
+        """
+        total = resident_memory()
+        return {
+            "total": total,
+            "per_bot": total // len(self.bots) if self.bots else 0,
+            "startup": dict(self.startup_memory),
+        }
@@ -0,0 +1,514 @@
+"""
+Process metrics, in the Prometheus text format.
+
+A :class:`Metrics` registry is only created when asked for (``--metrics-port``
+or ``--metrics-log``); bots given none register no extra hooks, so
+instrumentation costs nothing when it is off. When on, it counts the
+packets and bytes each connection reads per packet type, times packet
+listeners (one call in ``sample`` for the hottest ones) and reads queue
+depths, reconnects and scheduler lag from their owners only when scraped::
+
+    metrics = Metrics().serve(9464)
+    metrics.watch_scheduler(scheduler)
+    bot = Trashbag(options, metrics=metrics)
+
+    curl http://127.0.0.1:9464/metrics
+"""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+PACKETS = "trashbags_packets_received_total"
+PACKET_BYTES = "trashbags_packet_bytes_received_total"
+LISTENER_CALLS = "trashbags_listener_calls_total"
+LISTENER_SECONDS = "trashbags_listener_seconds"
+SCHEDULER_LAG = "trashbags_scheduler_lag_seconds"
+
+_HELP = {
+    PACKETS: (COUNTER, "Packets read, by bot and packet type"),
+    PACKET_BYTES: (COUNTER, "Bytes read from the socket, by bot and packet type"),
+    LISTENER_CALLS: (COUNTER, "Packet listener calls"),
+    LISTENER_SECONDS: (HISTOGRAM, "Packet listener run time, sampled"),
+    SCHEDULER_LAG: (HISTOGRAM, "Delay between a task's due time and its run"),
+}
+
+
+class Histogram:
+    """Latency histogram with fixed buckets, in seconds."""
+
+    BUCKETS = (
+        0.0001,
+        0.0005,
+        0.001,
+        0.005,
+        0.01,
+        0.05,
+        0.1,
+        0.5,
+        1.0,
+        5.0,
+        float("inf"),
+    )
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.BUCKETS[-1]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+
+class _CountingStream:
+    """Pass reads through to ``stream``, adding up the bytes read."""
+
+    __slots__ = ("stream", "read_bytes")
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.read_bytes = 0
+
+    def read(self, length=-1):
+        data = self.stream.read(length)
+        self.read_bytes += len(data)
+        return data
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters, histograms and collectors rendered for Prometheus.
+
+    Counters and histograms are keyed by name and a tuple of ``(label,
+    value)`` pairs. Collectors are callables run at scrape time that return
+    ``(labels, value)`` pairs, for values their owner already keeps.
+
+    Args:
+      sample (int): time one call in ``sample`` of the hot listeners
+    """
+
+    def __init__(self, sample=16):
+        self.sample = sample
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = {}
+        self.sources = []
+        self._help = dict(_HELP)
+        self._lock = threading.Lock()
+        # Counters are bumped from the network thread and the workers at once
+        self._counting = threading.Lock()
+        self._server = None
+        self._task = None
+
+    def describe(self, name, kind, help):
+        self._help[name] = (kind, help)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._counting:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name, labels=()):
+        """The histogram for ``name`` and ``labels``, created on first use."""
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def collect(self, name, kind, help, func):
+        """Read ``name`` from ``func()`` at scrape time.
+
+        Args:
+          func: returns an iterable of ``(labels, value)`` pairs
+        """
+        self.describe(name, kind, help)
+        self.collectors[name] = func
+
+    def gather(self, source):
+        """Add the families ``source()`` returns to every scrape.
+
+        Args:
+          source: returns ``(name, kind, help, samples)`` tuples, as
+            :meth:`export` does, usually from other processes
+        """
+        self.sources.append(source)
+        return self
+
+    # Instrumentation
+
+    def attach(self, connection, bot):
+        """Count what ``connection`` reads, per packet type, labelled ``bot``."""
+
+        def hook(reactor):
+            read_packet = reactor.read_packet
+            seen = {}
+            inc = self.inc
+
+            def counting_read_packet(stream, timeout=0):
+                counter = _CountingStream(stream)
+                packet = read_packet(counter, timeout)
+                if packet is not None:
+                    packet_type = type(packet)
+                    labels = seen.get(packet_type)
+                    if labels is None:
+                        labels = seen[packet_type] = (
+                            ("bot", bot),
+                            ("packet", packet_type.__name__),
+                        )
+                    inc(PACKETS, labels)
+                    inc(PACKET_BYTES, labels, counter.read_bytes)
+                return packet
+
+            reactor.read_packet = counting_read_packet
+
+        connection.add_reactor_hook(hook)
+
+    def timed(self, handler, name, every=1):
+        """Wrap ``handler`` to count its calls and time one in ``every``."""
+        labels = (("listener", name),)
+        histogram = self.histogram(LISTENER_SECONDS, labels)
+        key = (LISTENER_CALLS, labels)
+        counters = self.counters
+        counting = self._counting
+        clock = time.perf_counter
+
+        def timed_handler(packet):
+            with counting:
+                calls = counters[key] = counters.get(key, 0) + 1
+            if calls % every:
+                return handler(packet)
+            began = clock()
+            try:
+                return handler(packet)
+            finally:
+                elapsed = clock() - began
+                with counting:
+                    histogram.observe(elapsed)
+
+        timed_handler.__wrapped__ = handler
+        return timed_handler
+
+    def watch_scheduler(self, scheduler):
+        scheduler.lag_histogram = self.histogram(SCHEDULER_LAG)
+        return self
+
+    def watch_runtime(self, runtime):
+        def lanes(field):
+            stats = runtime.stats()
+            return [((("lane", lane),), stats[lane][field]) for lane in sorted(stats)]
+
+        self.collect(
+            "trashbags_listener_queue",
+            GAUGE,
+            "Listener calls waiting to run",
+            lambda: lanes("pending"),
+        )
+        self.collect(
+            "trashbags_listener_dropped_total",
+            COUNTER,
+            "Packets dropped because a listener lane was full",
+            lambda: lanes("dropped"),
+        )
+        self.collect(
+            "trashbags_listener_waits_total",
+            COUNTER,
+            "Packets the network thread held until a listener lane had room",
+            lambda: lanes("waits"),
+        )
+        return self
+
+    def watch_ticks(self, ticks):
+        """Report the overruns and run time of a :class:`TickLoop`."""
+        stats = ticks.stats
+        for name, help in (
+            ("skipped", "Ticks not run because the loop was late"),
+            ("overruns", "Ticks whose jobs took longer than a tick"),
+            ("deferred", "Deferrable tick jobs put off to a later tick"),
+        ):
+            self.collect(
+                f"trashbags_ticks_{name}_total",
+                COUNTER,
+                help,
+                lambda name=name: [((), getattr(stats, name))],
+            )
+        self.collect(
+            "trashbags_tick_seconds",
+            HISTOGRAM,
+            "Run time of the jobs of a tick",
+            lambda: [((), stats.durations)],
+        )
+        return self
+
+    def watch_bots(self, bots):
+        """Report the write queues of ``bots``, a list that may grow later."""
+
+        def depths():
+            for bot in list(bots):
+                name = bot.options.username
+                if bot.outbox is not None:
+                    yield (("bot", name), ("queue", "chat")), bot.outbox.depth
+                if bot.movement is not None:
+                    yield (("bot", name), ("queue", "movement")), bot.movement.pending
+                # pyCraft's own queue of packets waiting for the writer thread
+                queue = getattr(bot.connection, "_outgoing_packet_queue", None)
+                if queue is not None:
+                    yield (("bot", name), ("queue", "socket")), len(queue)
+
+        def lag(field):
+            for bot in list(bots):
+                value = getattr(bot.lag, field)
+                if value is not None:
+                    yield (("bot", bot.options.username),), value
+
+        self.collect(
+            "trashbags_write_queue", GAUGE, "Outgoing items waiting to be sent", depths
+        )
+        self.collect(
+            "trashbags_server_tps",
+            GAUGE,
+            "Server ticks per second, from its time updates",
+            lambda: lag("tps"),
+        )
+        self.collect(
+            "trashbags_rtt_seconds",
+            GAUGE,
+            "Round trip the server measures from keep-alives",
+            lambda: lag("rtt"),
+        )
+        self.collect(
+            "trashbags_position_corrections_total",
+            COUNTER,
+            "Positions the server set back after a move",
+            lambda: [
+                ((("bot", bot.options.username),), bot.corrections.total)
+                for bot in list(bots)
+            ],
+        )
+        self.collect(
+            "trashbags_position_corrections_per_minute",
+            GAUGE,
+            "Position corrections over the last minute",
+            lambda: [
+                ((("bot", bot.options.username),), bot.corrections.per_minute())
+                for bot in list(bots)
+            ],
+        )
+        self.collect(
+            "trashbags_keep_alive_delay_seconds",
+            GAUGE,
+            "Extra delay of the last keep-alive over the recent fastest",
+            lambda: lag("keep_alive_delay"),
+        )
+        return self
+
+    def watch_supervisors(self, supervisors):
+        """Report reconnects from a name to supervisor mapping."""
+
+        def field(name):
+            return [
+                ((("bot", bot),), getattr(supervisor.stats, name))
+                for bot, supervisor in list(supervisors.items())
+            ]
+
+        self.collect(
+            "trashbags_disconnects_total",
+            COUNTER,
+            "Connections lost",
+            lambda: field("disconnects"),
+        )
+        self.collect(
+            "trashbags_reconnects_total",
+            COUNTER,
+            "Connections restored after a loss",
+            lambda: field("reconnects"),
+        )
+        return self
+
+    # Output
+
+    def _families(self):
+        families = {}
+        for (name, labels), value in list(self.counters.items()):
+            families.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in list(self.histograms.items()):
+            families.setdefault(name, []).append((labels, histogram))
+        for name, func in list(self.collectors.items()):
+            try:
+                families[name] = list(func())
+            except Exception:
+                _logger.exception("Collecting %s failed", name)
+        for source in list(self.sources):
+            try:
+                gathered = list(source())
+            except Exception:
+                _logger.exception("Gathering from %r failed", source)
+                continue
+            for name, kind, help, samples in gathered:
+                self._help.setdefault(name, (kind, help))
+                families.setdefault(name, []).extend(samples)
+        return families
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, samples in sorted(self._families().items()):
+            kind, help = self._help.get(name, (GAUGE, ""))
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(samples, key=lambda sample: sample[0]):
+                if not isinstance(value, Histogram):
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                seen = 0
+                for bound, count in zip(value.BUCKETS, value.counts):
+                    seen += count
+                    bucket = _labels(labels, [("le", _number(bound))])
+                    lines.append(f"{name}_bucket{bucket} {seen}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value.total)}")
+                lines.append(f"{name}_count{_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Every metric as picklable ``(name, kind, help, samples)`` tuples."""
+        return [
+            (name, *self._help.get(name, (GAUGE, "")), samples)
+            for name, samples in sorted(self._families().items())
+        ]
+
+    def snapshot(self):
+        """Every metric as plain data, histograms summarised."""
+        snapshot = {}
+        for name, samples in sorted(self._families().items()):
+            values = snapshot[name] = {}
+            for labels, value in samples:
+                key = ",".join(
+                    f"{label}={label_value}" for label, label_value in labels
+                )
+                if isinstance(value, Histogram):
+                    value = value.as_dict()
+                values[key] = value
+        return snapshot
+
+    def log(self):
+        _logger.info("Metrics: %s", json.dumps(self.snapshot(), sort_keys=True))
+
+    def start_logging(self, scheduler, interval=60.0):
+        """Log a snapshot every ``interval`` seconds."""
+        self.stop_logging()
+        self._task = scheduler.call_every(interval, self.log)
+        return self
+
+    def stop_logging(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve ``/metrics`` over HTTP from a daemon thread."""
+        from http.server import ThreadingHTTPServer
+
+        server = ThreadingHTTPServer((host, port), _metrics_handler())
+        server.daemon_threads = True
+        server.metrics = self
+        self._server = server
+        thread = threading.Thread(
+            target=server.serve_forever, name="trashbags-metrics", daemon=True
+        )
+        thread.start()
+        _logger.info("Serving metrics on http://%s:%d/metrics", host, port)
+        return self
+
+    @property
+    def address(self):
+        return None if self._server is None else self._server.server_address
+
+    def close(self):
+        self.stop_logging()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+@lru_cache(maxsize=None)
+def _metrics_handler():
+    # http.server is only imported when metrics are served
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = self.server.metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            _logger.debug("%s " + format, self.address_string(), *args)
+
+    return MetricsHandler
@@ -0,0 +1,234 @@
+"""
+Tick-paced movement.
+
+Instead of writing a position packet for every call, moves are queued on a
+:class:`MovementQueue` and flushed once per game tick: a new target
+supersedes whatever was still pending, long moves are cut into steps the
+server accepts, and at most one position packet is sent per tick.
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import deque
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+TICK = 0.05
+WALK_SPEED = 4.317
+SPRINT_SPEED = 5.612
+
+# Length prefix, packet id, x/y/z doubles, yaw/pitch floats and on_ground
+POSITION_AND_LOOK_BYTES = 1 + 1 + 3 * 8 + 2 * 4 + 1
+
+
+def _steps_python(start, waypoints, step):
+    x, y, z = start
+    for wx, wy, wz in waypoints:
+        dx, dy, dz = wx - x, wy - y, wz - z
+        distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+        count = max(1, math.ceil(distance / step))
+        for i in range(1, count + 1):
+            t = i / count
+            yield (x + dx * t, y + dy * t, z + dz * t)
+        x, y, z = wx, wy, wz
+
+
+def _steps_numpy(start, waypoints, step):
+    import numpy as np
+
+    points = np.vstack((np.asarray(start, dtype=float), waypoints))
+    deltas = np.diff(points, axis=0)
+    counts = np.maximum(1, np.ceil(np.linalg.norm(deltas, axis=1) / step))
+    counts = counts.astype(np.intp)
+    segment = np.repeat(np.arange(len(deltas)), counts)
+    first = np.cumsum(counts) - counts
+    fraction = (np.arange(len(segment)) - first[segment] + 1) / counts[segment]
+    return points[segment] + deltas[segment] * fraction[:, None]
+
+
+def plan_steps(start, waypoints, step):
+    """Positions visited when walking from ``start`` through ``waypoints``.
+
+    Each returned position is at most ``step`` blocks from the previous one.
+
+    Args:
+      start (tuple): current (x, y, z)
+      waypoints: sequence of (x, y, z), or a NumPy array of shape (n, 3)
+      step (float): longest distance covered between two positions
+
+    Returns:
+      list of (x, y, z) tuples ending on the last waypoint, or an array of
+      shape (m, 3) when ``waypoints`` is an array
+    """
+    # Only a caller that already imported NumPy can pass an array
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(waypoints, np.ndarray):
+        waypoints = waypoints.reshape(-1, 3).astype(float, copy=False)
+        if len(waypoints) == 0:
+            return np.empty((0, 3))
+        return _steps_numpy(start, waypoints, step)
+    return list(_steps_python(start, waypoints, step))
+
+
+class MovementQueue:
+    """Coalesce a bot's moves and send them one step per game tick.
+
+    Args:
+      bot (Trashbag): the bot to move; its ``position`` is the starting point
+        of every plan and is kept up to date as steps are sent
+      scheduler: drives the 20 Hz flush, a Scheduler or a TickLoop
+      speed (float): metres per second, walking speed by default
+    """
+
+    def __init__(self, bot, scheduler, speed=WALK_SPEED):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.speed = speed
+        self.packets_sent = 0
+        # Positions the server placed the bot at, see send()
+        self.teleports = 0
+        self._moving = threading.Lock()
+        self._steps = ()
+        self._next = 0
+        self._rotation = None
+        # Bumped whenever the plan is replaced, see peek()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    @property
+    def step(self):
+        return self.speed * TICK
+
+    @property
+    def pending(self):
+        return len(self._steps) - self._next
+
+    def start(self):
+        if self._task is None:
+            self.scheduler.start()
+            self._task = self.scheduler.call_every(TICK, self.flush)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def move_to(self, destination, rotation=None):
+        """Walk to ``destination``, replacing any move still pending."""
+        self.follow((destination,), rotation)
+
+    def follow(self, waypoints, rotation=None):
+        """Walk through ``waypoints``, replacing any move still pending."""
+        steps = plan_steps(self.bot.position, waypoints, self.step)
+        with self._lock:
+            self._steps = steps
+            self._next = 0
+            self._rotation = rotation
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._steps = ()
+            self._next = 0
+            self._generation += 1
+
+    def peek(self):
+        """The next step, without taking it.
+
+        Returns:
+          tuple: ``(ticket, position, rotation)``, ``None`` when there is no
+          step left; pass ``ticket`` to :meth:`advance` once it is taken
+        """
+        with self._lock:
+            index = self._next
+            if index >= len(self._steps):
+                return None
+            position = self._steps[index]
+            if not isinstance(position, tuple):
+                position = tuple(position.tolist())
+            rotation = self._rotation or self.bot.rotation
+            return (self._generation, index), position, rotation
+
+    def advance(self, ticket):
+        """Move past the step :meth:`peek` returned, unless the plan changed."""
+        with self._lock:
+            if ticket == (self._generation, self._next):
+                self._next += 1
+
+    def placed(self, position, rotation):
+        """The server put the bot at ``position``, moves planned before lose."""
+        with self._moving:
+            self.bot.position = position
+            self.bot.rotation = rotation
+            self.teleports += 1
+
+    def send(self, teleports, position, rotation, on_ground=True):
+        """Send a move computed when :attr:`teleports` was ``teleports``.
+
+        Returns:
+          bool: whether it was sent; a move the server placed the bot since
+          would overwrite the server's position with a stale one
+        """
+        bot = self.bot
+        with self._moving:
+            if self.teleports != teleports:
+                return False
+            bot.player_move(position, rotation, on_ground=on_ground)
+            bot.position = position
+            self.packets_sent += 1
+        return True
+
+    def flush(self):
+        """Send the next step, if any; called once per tick."""
+        if self.bot.connection is None:
+            return False
+        teleports = self.teleports
+        step = self.peek()
+        if step is None:
+            return False
+        ticket, position, rotation = step
+        if not self.send(teleports, position, rotation):
+            return False
+        self.advance(ticket)
+        return True
+
+
+class CorrectionCounter:
+    """Position corrections the server sent, in total and over the last minute.
+
+    The server teleports a bot back whenever it rejects a move, so this
+    counts every position packet but the first one of a connection.
+    """
+
+    def __init__(self, window=60.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.total = 0
+        self._positioned = False
+        self._times = deque()
+
+    def connected(self):
+        """Start a connection, its first position is not a correction."""
+        self._positioned = False
+
+    def record(self):
+        """Account for a position packet; returns whether it is a correction."""
+        if not self._positioned:
+            self._positioned = True
+            return False
+        self.total += 1
+        self._times.append(self.clock())
+        return True
+
+    def per_minute(self):
+        times = self._times
+        horizon = self.clock() - self.window
+        while times and times[0] < horizon:
+            times.popleft()
+        return len(times) * 60.0 / self.window
@@ -0,0 +1,241 @@
+"""
+Paced sending of chat messages and commands.
+
+Vanilla servers kick players whose chat spam counter (20 per message, -1
+per tick) exceeds 200, so a bot can send roughly one message a second with
+short bursts. :class:`Outbox` queues outgoing messages and sends them from
+the shared scheduler within that budget, with a token bucket per
+destination, duplicate suppression, splitting of long messages and
+priority lanes so replies to authorized users go out first.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+MAX_LENGTH = 256
+FLUSH_INTERVAL = 0.05
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+BROADCAST = "broadcast"
+COMMAND = "command"
+
+_WHISPER = re.compile(r"/(?:msg|tell|w|whisper)\s+(\S+)\s+", re.IGNORECASE)
+
+
+def destination_of(text):
+    """Who a message goes to: ``broadcast``, ``command`` or a player name."""
+    if not text.startswith("/"):
+        return BROADCAST
+    match = _WHISPER.match(text)
+    if match is not None:
+        return match.group(1).lower()
+    return COMMAND
+
+
+def split_message(text, limit=MAX_LENGTH):
+    """Cut ``text`` into chunks of at most ``limit`` characters.
+
+    Chat is cut at spaces where possible. Whispers keep their ``/msg name``
+    prefix on every chunk; other commands cannot be split.
+
+    Raises:
+      ValueError: for a command longer than ``limit``
+    """
+    if len(text) <= limit:
+        return [text]
+    prefix = ""
+    if text.startswith("/"):
+        match = _WHISPER.match(text)
+        if match is None:
+            raise ValueError(f"Command longer than {limit} characters")
+        prefix, text = text[: match.end()], text[match.end() :]
+    room = limit - len(prefix)
+    if room <= 0:
+        raise ValueError(f"Command longer than {limit} characters")
+
+    chunks = []
+    while text:
+        if len(text) <= room:
+            chunks.append(text)
+            break
+        cut = text.rfind(" ", 0, room + 1)
+        if cut <= 0:
+            cut = room
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip(" ")
+    return [prefix + chunk for chunk in chunks]
+
+
+class TokenBucket:
+    """Allow ``burst`` sends at once, refilled at ``rate`` per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Message:
+    __slots__ = ("text", "destination", "queued_at")
+
+    def __init__(self, text, destination, queued_at):
+        self.text = text
+        self.destination = destination
+        self.queued_at = queued_at
+
+
+class Outbox:
+    """Queue of chat messages and commands waiting to be sent.
+
+    Args:
+      bot (Trashbag): the bot whose ``write_chat`` sends a message
+      scheduler: drives the flushes, a Scheduler or a TickLoop
+      rate (float): messages per second across all destinations
+      burst (int): messages that may go out back to back
+      destination_rate (float): messages per second to any one destination
+      destination_burst (int): back-to-back messages to one destination
+    """
+
+    def __init__(
+        self,
+        bot,
+        scheduler,
+        rate=1.0,
+        burst=9,
+        destination_rate=0.5,
+        destination_burst=3,
+        clock=time.monotonic,
+    ):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.clock = clock
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.sent = 0
+        self.dropped = 0
+        # Seconds messages spent queued, most recent last
+        self.latencies = deque(maxlen=1000)
+        self._bucket = TokenBucket(rate, burst, clock())
+        self._buckets = {}
+        self._lanes = (deque(), deque(), deque())
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.scheduler.start()
+            self._task = self.scheduler.call_every(FLUSH_INTERVAL, self.flush)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def depth(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "depth": [len(lane) for lane in self._lanes],
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "latency_p50": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+        }
+
+    def send(self, text, priority=NORMAL):
+        """Queue ``text``, split if too long.
+
+        Returns:
+          int: number of chunks queued, 0 if all were already pending
+        """
+        destination = destination_of(text)
+        now = self.clock()
+        queued = 0
+        with self._lock:
+            for chunk in split_message(text):
+                key = (destination, chunk)
+                if key in self._queued:
+                    self.dropped += 1
+                    continue
+                self._queued.add(key)
+                self._lanes[priority].append(_Message(chunk, destination, now))
+                queued += 1
+        return queued
+
+    def _bucket_for(self, destination, now):
+        bucket = self._buckets.get(destination)
+        if bucket is None:
+            bucket = self._buckets[destination] = TokenBucket(
+                self.destination_rate, self.destination_burst, now
+            )
+        return bucket
+
+    def _next(self, now):
+        if not self._bucket.ready(now):
+            return None
+        for lane in self._lanes:
+            for index, message in enumerate(lane):
+                bucket = self._bucket_for(message.destination, now)
+                if bucket.ready(now):
+                    del lane[index]
+                    bucket.take(now)
+                    self._bucket.take(now)
+                    self._queued.discard((message.destination, message.text))
+                    return message
+        return None
+
+    def flush(self):
+        """Send every message the rate limits allow right now.
+
+        Returns:
+          int: number of messages sent
+        """
+        if self.bot.connection is None:
+            return 0
+        sent = 0
+        while True:
+            now = self.clock()
+            with self._lock:
+                message = self._next(now)
+            if message is None:
+                return sent
+            try:
+                self.bot.write_chat(message.text)
+            except Exception:
+                _logger.exception("Sending chat message failed")
+                return sent
+            self.latencies.append(self.clock() - message.queued_at)
+            self.sent += 1
+            sent += 1
@@ -0,0 +1,122 @@
+"""
+Clientbound play packets pyCraft does not decode, or that the bot reads raw.
+
+Each packet keeps its body as ``data`` bytes for the bot's own decoders,
+:mod:`trashbags.world` for the world packets and :mod:`trashbags.entities`
+for the entity ones. :func:`install` adds them to
+a connection's reactor, use it as a reactor hook::
+
+    connection.add_reactor_hook(install)
+"""
+
+from minecraft.networking.packets import Packet
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class RawPacket(Packet):
+    """A packet whose body is kept undecoded in ``data``."""
+
+    packet_id = None
+
+    @classmethod
+    def get_id(cls, context):
+        return cls.packet_id
+
+    def read(self, file_object):
+        self.data = file_object.read()
+
+    def __repr__(self):
+        size = len(getattr(self, "data", b""))
+        return f"{type(self).__name__}(0x{self.packet_id:02X}, {size} bytes)"
+
+
+# 1.12.2 ids
+class SpawnObjectPacket(RawPacket):
+    packet_name = "spawn object"
+    packet_id = 0x00
+
+
+class SpawnExperienceOrbPacket(RawPacket):
+    packet_name = "spawn experience orb"
+    packet_id = 0x01
+
+
+class SpawnMobPacket(RawPacket):
+    packet_name = "spawn mob"
+    packet_id = 0x03
+
+
+class SpawnPlayerPacket(RawPacket):
+    packet_name = "spawn player"
+    packet_id = 0x05
+
+
+class BlockChangePacket(RawPacket):
+    packet_name = "block change"
+    packet_id = 0x0B
+
+
+class MultiBlockChangePacket(RawPacket):
+    packet_name = "multi block change"
+    packet_id = 0x10
+
+
+class UnloadChunkPacket(RawPacket):
+    packet_name = "unload chunk"
+    packet_id = 0x1D
+
+
+class ChunkDataPacket(RawPacket):
+    packet_name = "chunk data"
+    packet_id = 0x20
+
+
+class EntityRelativeMovePacket(RawPacket):
+    packet_name = "entity relative move"
+    packet_id = 0x26
+
+
+class EntityLookAndRelativeMovePacket(RawPacket):
+    packet_name = "entity look and relative move"
+    packet_id = 0x27
+
+
+class DestroyEntitiesPacket(RawPacket):
+    packet_name = "destroy entities"
+    packet_id = 0x32
+
+
+class EntityTeleportPacket(RawPacket):
+    packet_name = "entity teleport"
+    packet_id = 0x4C
+
+
+WORLD_PACKETS = (
+    BlockChangePacket,
+    MultiBlockChangePacket,
+    UnloadChunkPacket,
+    ChunkDataPacket,
+)
+
+ENTITY_PACKETS = (
+    SpawnObjectPacket,
+    SpawnExperienceOrbPacket,
+    SpawnMobPacket,
+    SpawnPlayerPacket,
+    EntityRelativeMovePacket,
+    EntityLookAndRelativeMovePacket,
+    DestroyEntitiesPacket,
+    EntityTeleportPacket,
+)
+
+
+def install(reactor, packets=WORLD_PACKETS):
+    """Decode ``packets`` with these classes on a play reactor."""
+    if type(reactor).__name__ != "PlayingReactor":
+        return
+    context = reactor.connection.context
+    for packet in packets:
+        reactor.clientbound_packets[packet.get_id(context)] = packet
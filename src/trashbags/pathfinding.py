@@ -0,0 +1,476 @@
+"""
+A* paths through the loaded world.
+
+:class:`Walkability` turns each loaded chunk into a flat byte grid saying,
+for every block, whether a player fits there and whether it can stand
+there; a grid is rebuilt only when its chunk's ``version`` changes.
+:class:`Pathfinder` runs A* over those grids with a fixed set of moves
+(straight, diagonal, one-block jumps and short falls) and an octile
+heuristic, within a time budget. :class:`Navigator` walks a bot along the
+result and, when a block change blocks the way, searches on from the last
+node still reachable while the bot keeps walking up to it::
+
+    bot.navigator.go((120, 64, -30))
+"""
+
+import heapq
+import logging
+import math
+import time
+from typing import List, NamedTuple, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .movement import TICK
+from .world import SECTIONS
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+# Block ids a player walks through: air, plants, rails, torches, signs...
+PASSABLE_BLOCKS = frozenset(
+    (0, 6, 27, 28, 31, 32, 37, 38, 39, 40, 50, 55, 59, 63, 65, 66, 68, 69, 70, 72)
+    + (75, 76, 77, 78, 83, 93, 94, 104, 105, 106, 115, 131, 132, 141, 142, 143)
+    + (147, 148, 149, 150, 157, 171, 175, 176, 177)
+)
+# Liquids, fire, cactus and cobwebs: never walked through nor stood on
+AVOIDED_BLOCKS = frozenset((8, 9, 10, 11, 30, 51, 81))
+
+PASSABLE = 1
+WALKABLE = 2
+
+JUMP_COST = 0.5
+FALL_COST = 0.2
+MAX_FALL = 3
+SQRT2 = math.sqrt(2)
+
+_CARDINALS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# Horizontal moves as (dx, dz, cost, sides): the four cardinal moves first,
+# then the diagonals with the indices of the two cardinal moves they pass
+MOVES = tuple((dx, dz, 1.0, None) for dx, dz in _CARDINALS) + tuple(
+    (dx, dz, SQRT2, (_CARDINALS.index((dx, 0)), _CARDINALS.index((0, dz))))
+    for dx in (1, -1)
+    for dz in (1, -1)
+)
+
+_BLOCK_IDS = 4096
+
+
+def _lookup(ids):
+    table = np.zeros(_BLOCK_IDS, dtype=bool)
+    table[list(ids)] = True
+    return table
+
+
+class Walkability:
+    """Per-chunk passable/walkable flags, cached until the chunk changes.
+
+    Flags are bytes indexed ``y << 8 | z << 4 | x``, see :data:`PASSABLE`
+    and :data:`WALKABLE` (a free block with a free one above it and a
+    solid one below). Grids of chunks the world no longer holds are dropped
+    once they outnumber the loaded chunks, so they do not outlive the
+    world's memory limit.
+    """
+
+    def __init__(self, world):
+        if np is None:
+            raise ImportError("pathfinding needs NumPy: pip install trashbags[numpy]")
+        self.world = world
+        self.built = 0
+        self._grids = {}
+        self._passable = _lookup(PASSABLE_BLOCKS)
+        self._floor = ~(self._passable | _lookup(AVOIDED_BLOCKS))
+
+    def grid(self, chunk_x, chunk_z):
+        """Flags of a chunk, ``None`` if it is not loaded."""
+        key = (chunk_x, chunk_z)
+        chunk = self.world.chunks.get(key)
+        if chunk is None:
+            self._grids.pop(key, None)
+            return None
+        cached = self._grids.get(key)
+        if cached is not None and cached[0] is chunk and cached[1] == chunk.version:
+            return cached[2]
+        version = chunk.version
+        grid = self._build(chunk)
+        self._grids[key] = (chunk, version, grid)
+        if len(self._grids) > 2 * len(self.world.chunks) + 64:
+            self._prune()
+        return grid
+
+    def _prune(self):
+        """Drop the grids of chunks unloaded, evicted or replaced."""
+        chunks = self.world.chunks
+        # Rebuilt rather than changed in place, other threads read it
+        self._grids = {
+            key: cached
+            for key, cached in list(self._grids.items())
+            if chunks.get(key) is cached[0]
+        }
+
+    def _build(self, chunk):
+        # Index y + 1, so y = -1 (the void, never a floor) and y = 256 (sky)
+        passable = np.ones((258, 16, 16), dtype=bool)
+        floor = np.zeros((258, 16, 16), dtype=bool)
+        for section_y in range(SECTIONS):
+            section = chunk.sections[section_y]
+            if section is None:
+                continue
+            ids = np.minimum(section.palette >> 4, _BLOCK_IDS - 1)
+            rows = slice(1 + section_y * 16, 17 + section_y * 16)
+            passable[rows] = self._passable[ids][section.blocks]
+            floor[rows] = self._floor[ids][section.blocks]
+        walkable = passable[1:257] & passable[2:258] & floor[0:256]
+        flags = passable[1:257].astype(np.uint8) | walkable.astype(np.uint8) << 1
+        self.built += 1
+        return flags.tobytes()
+
+    def flags(self, x, y, z):
+        if y < 0:
+            return 0
+        if y > 255:
+            return PASSABLE
+        grid = self.grid(x >> 4, z >> 4)
+        return 0 if grid is None else grid[y << 8 | (z & 15) << 4 | (x & 15)]
+
+    def walkable(self, x, y, z):
+        return bool(self.flags(x, y, z) & WALKABLE)
+
+
+class Path(NamedTuple):
+    """Result of a search.
+
+    ``nodes`` are the block positions stepped on, ``waypoints`` the points
+    to walk through (block centres, straight runs merged). ``complete`` is
+    false when the search ran out of time or the goal is unreachable, the
+    path then ends at the closest node found.
+    """
+
+    nodes: List[Tuple[int, int, int]]
+    waypoints: List[Tuple[float, float, float]]
+    complete: bool
+    expanded: int
+    elapsed: float
+
+
+def block_of(position):
+    """Integer block coordinates of a position."""
+    return tuple(int(math.floor(value)) for value in position)
+
+
+def _waypoints(nodes):
+    points = []
+    for index, (x, y, z) in enumerate(nodes):
+        if 0 < index < len(nodes) - 1:
+            px, py, pz = nodes[index - 1]
+            nx, ny, nz = nodes[index + 1]
+            # Drop the middle of straight, level runs
+            if py == y == ny and (x - px, z - pz) == (nx - x, nz - z):
+                continue
+        points.append((x + 0.5, float(y), z + 0.5))
+    return points
+
+
+class Pathfinder:
+    """A* over a :class:`~trashbags.world.WorldCache`.
+
+    Args:
+      world (WorldCache): the known world
+      budget (float): default seconds a search may take
+      max_fall (int): highest drop taken, in blocks
+    """
+
+    def __init__(self, world, budget=0.05, max_fall=MAX_FALL):
+        self.world = world
+        self.walkability = Walkability(world)
+        self.budget = budget
+        self.max_fall = max_fall
+        self.searches = 0
+        self.expanded = 0
+        self.elapsed = 0.0
+
+    @property
+    def nodes_per_sec(self):
+        return self.expanded / self.elapsed if self.elapsed else None
+
+    def find(self, start, goal, budget=None):
+        """Search a path from ``start`` to ``goal``.
+
+        Args:
+          start (tuple): (x, y, z), usually the bot's feet
+          goal (tuple): (x, y, z) to stand on
+          budget (float): seconds, :attr:`budget` by default
+
+        Returns:
+          Path: the path found, possibly partial
+        """
+        began = time.perf_counter()
+        deadline = began + (self.budget if budget is None else budget)
+        start, goal = block_of(start), block_of(goal)
+        grid_of = self.walkability.grid
+        grids = {}
+        max_fall = self.max_fall
+
+        def flags(x, y, z):
+            # Grids are fetched once per search, also a consistent snapshot
+            if not 0 <= y < 256:
+                return PASSABLE if y > 255 else 0
+            key = (x >> 4, z >> 4)
+            grid = grids.get(key, False)
+            if grid is False:
+                grid = grids[key] = grid_of(*key)
+            return 0 if grid is None else grid[y << 8 | (z & 15) << 4 | (x & 15)]
+
+        gx, gy, gz = goal
+
+        def heuristic(x, y, z):
+            # Moves cost at least their horizontal distance, and at least 1
+            # for every max_fall blocks of height
+            dx, dz = abs(x - gx), abs(z - gz)
+            return max(dx + dz + (SQRT2 - 2) * min(dx, dz), abs(y - gy) / max_fall)
+
+        g_score = {start: 0.0}
+        came_from = {}
+        closed = set()
+        best, best_h = start, heuristic(*start)
+        counter = 0
+        heap = [(best_h, best_h, counter, start)]
+        expanded = 0
+        complete = False
+        while heap:
+            _, h, _, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node == goal:
+                best, complete = node, True
+                break
+            closed.add(node)
+            expanded += 1
+            if h < best_h:
+                best, best_h = node, h
+            if not expanded & 255 and time.perf_counter() > deadline:
+                break
+            x, y, z = node
+            g = g_score[node]
+            head_room = flags(x, y + 2, z) & PASSABLE
+            clear = [0, 0, 0, 0]
+            for index, (dx, dz, cost, sides) in enumerate(MOVES):
+                nx, nz = x + dx, z + dz
+                here = flags(nx, y, nz)
+                if sides:
+                    # Diagonals stay level and do not cut corners
+                    if not (here & WALKABLE and clear[sides[0]] and clear[sides[1]]):
+                        continue
+                else:
+                    above = flags(nx, y + 1, nz)
+                    clear[index] = here & above & PASSABLE
+                if here & WALKABLE:
+                    ny = y
+                elif head_room and above & WALKABLE:
+                    ny, cost = y + 1, cost + JUMP_COST
+                elif clear[index]:
+                    for ny in range(y - 1, y - max_fall - 1, -1):
+                        below = flags(nx, ny, nz)
+                        if below & WALKABLE or not below & PASSABLE:
+                            break
+                    if not below & WALKABLE:
+                        continue
+                    cost += FALL_COST * (y - ny)
+                else:
+                    continue
+                neighbour = (nx, ny, nz)
+                if neighbour in closed:
+                    continue
+                tentative = g + cost
+                if tentative < g_score.get(neighbour, math.inf):
+                    g_score[neighbour] = tentative
+                    came_from[neighbour] = node
+                    nh = heuristic(nx, ny, nz)
+                    counter += 1
+                    heapq.heappush(heap, (tentative + nh, nh, counter, neighbour))
+
+        nodes = [best]
+        while nodes[-1] in came_from:
+            nodes.append(came_from[nodes[-1]])
+        nodes.reverse()
+        elapsed = time.perf_counter() - began
+        self.searches += 1
+        self.expanded += expanded
+        self.elapsed += elapsed
+        return Path(nodes, _waypoints(nodes[1:]), complete, expanded, elapsed)
+
+
+class Navigator:
+    """Walk a bot to a goal along A* paths.
+
+    Every ``check_interval`` seconds, if a chunk the path crosses changed,
+    the rest of the path is checked; when a node is no longer walkable, the
+    path is kept up to the node before it and searched again from there.
+    A partial path is extended once walked.
+
+    Those searches take up to the pathfinder's budget, as long as a tick,
+    so with an ``executor`` they run on it and their result is applied on
+    the first tick after they end, the bot walking the part of its path
+    still valid meanwhile.
+
+    Args:
+      bot (Trashbag): the bot, with a ``movement`` queue
+      pathfinder (Pathfinder): searches the bot's world
+      scheduler: runs the checks, a Scheduler or a TickLoop
+      max_plans (int): searches per :meth:`go` before giving up
+      executor: runs searches after the first, with ``submit(func, *args)``
+        like a Runtime; in the checks when ``None``
+    """
+
+    def __init__(
+        self,
+        bot,
+        pathfinder,
+        scheduler,
+        check_interval=0.25,
+        max_plans=20,
+        executor=None,
+    ):
+        self.bot = bot
+        self.pathfinder = pathfinder
+        self.scheduler = scheduler
+        self.check_interval = check_interval
+        self.max_plans = max_plans
+        self.executor = executor
+        self.goal = None
+        self.path = None
+        self.plans = 0
+        self.replans = 0
+        self._versions = None
+        self._task = None
+        # (future, goal, prefix) of the search running on the executor
+        self._search = None
+        self._collect_task = None
+
+    def go(self, goal):
+        """Plan a path to ``goal`` and start walking it.
+
+        Returns:
+          Path: the first path, ``None`` if there is no way to go
+        """
+        self.goal = block_of(goal)
+        self.plans = 1
+        self._forget_search()
+        # Called off the tick thread, the first search runs right away
+        path = self._planned((), self.pathfinder.find(self.bot.position, self.goal))
+        if self._task is None:
+            self._task = self.scheduler.call_every(self.check_interval, self.check)
+        return path
+
+    def stop(self):
+        self.goal = None
+        self.path = None
+        self._forget_search()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _forget_search(self):
+        self._search = None
+        if self._collect_task is not None:
+            self._collect_task.cancel()
+            self._collect_task = None
+
+    def _chunk_versions(self, nodes):
+        chunks = self.pathfinder.world.chunks
+        keys = {(x >> 4, z >> 4) for x, _, z in nodes}
+        return {
+            key: chunk.version if chunk is not None else None
+            for key in keys
+            for chunk in (chunks.get(key),)
+        }
+
+    def _plan(self, prefix=()):
+        """Search on from the last node of ``prefix``, the bot's position if empty.
+
+        Returns:
+          Path: the new path, ``None`` while the search runs on the executor
+        """
+        if self.plans >= self.max_plans:
+            _logger.info("Giving up on reaching %s", self.goal)
+            self.stop()
+            return None
+        self.plans += 1
+        start = prefix[-1] if prefix else self.bot.position
+        if self.executor is None:
+            return self._planned(prefix, self.pathfinder.find(start, self.goal))
+        search = self.executor.submit(self.pathfinder.find, start, self.goal)
+        self._search = (search, self.goal, prefix)
+        self._collect_task = self.scheduler.call_every(TICK, self._collect)
+        return None
+
+    def _collect(self):
+        """Apply the result of the search on the executor, once it ended."""
+        search = self._search
+        if search is None or not search[0].done():
+            return
+        self._forget_search()
+        future, goal, prefix = search
+        if goal != self.goal:
+            return
+        try:
+            path = future.result()
+        except Exception:
+            _logger.exception("Searching a way to %s failed", goal)
+            self.stop()
+            return
+        self._planned(prefix, path)
+
+    def _planned(self, prefix, path):
+        """Walk ``prefix`` then ``path``, which starts at its last node."""
+        if len(path.nodes) < 2 and not path.complete:
+            _logger.info("No way to %s from %s", self.goal, path.nodes[0])
+            self.stop()
+            return None
+        nodes = list(prefix[:-1]) + path.nodes
+        if prefix:
+            path = path._replace(nodes=nodes, waypoints=_waypoints(nodes[1:]))
+        # The bot walked on during the search, it goes on from where it is
+        here = block_of(self.bot.position)
+        walked = nodes.index(here) + 1 if here in nodes else 0
+        self.path = path
+        self._versions = self._chunk_versions(nodes)
+        self.bot.walk_path(_waypoints(nodes[walked:]) if walked else path.waypoints)
+        return path
+
+    def check(self):
+        """Plan again if the path got blocked or a partial path was walked."""
+        path = self.path
+        if path is None or self.goal is None or self._search is not None:
+            return
+        if not self.bot.movement.pending:
+            if block_of(self.bot.position) == self.goal or path.complete:
+                self.stop()
+            else:
+                self._plan()
+            return
+        versions = self._chunk_versions(path.nodes)
+        if versions == self._versions:
+            return
+        self._versions = versions
+        here = block_of(self.bot.position)
+        nodes = path.nodes
+        # Off the path, every node is checked and the search starts from the bot
+        on_path = here in nodes
+        remaining = nodes[nodes.index(here) :] if on_path else nodes
+        walkable = self.pathfinder.walkability.walkable
+        for index, node in enumerate(remaining):
+            if not walkable(*node):
+                break
+        else:
+            return
+        self.replans += 1
+        # Keep what is still walkable, the search starts where it ends
+        self._plan(remaining[:index] if on_path else ())
@@ -0,0 +1,351 @@
+"""
+Client-side player physics.
+
+The server checks every move a client sends and teleports the player back
+when the move is impossible: walking into a wall, floating, or claiming to
+be on the ground mid-air. A :class:`PhysicsEngine` moves bots the way the
+vanilla client does, one tick at a time: gravity and drag on the vertical
+speed, collisions of the 0.6 x 1.8 player box with the blocks of the bot's
+:class:`~trashbags.world.WorldCache`, a jump when a walk is blocked by a
+step, and ``on_ground`` from the collision rather than assumed. Bots in
+chunks that are not loaded yet stay where they are, as the client does.
+
+One engine steps every bot of a tick loop in one batch: the arithmetic runs
+on NumPy arrays of all bots at once and block lookups gather from the
+walkability grid of each chunk touched, so a tick costs a few array
+operations per chunk rather than per block::
+
+    engine = engine_for(ticks)
+    engine.add(bot, pathfinder.walkability)
+"""
+
+import logging
+import threading
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .movement import TICK
+from .pathfinding import PASSABLE
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+# Vanilla 1.12.2 values, per tick
+GRAVITY = 0.08
+DRAG = 0.98
+JUMP_VELOCITY = 0.42
+HALF_WIDTH = 0.3
+HEIGHT = 1.8
+
+# Furthest a body can fall in one tick, in whole blocks
+_FALL_LEVELS = 5
+_EPSILON = 1e-7
+# Ticks a walk may stay blocked before its plan is dropped
+STUCK_TICKS = 20
+
+_engines = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def engine_for(ticks):
+    """The :class:`PhysicsEngine` of ``ticks``, created and started once."""
+    with _engines_lock:
+        engine = _engines.get(ticks)
+        if engine is None:
+            engine = _engines[ticks] = PhysicsEngine(ticks).start()
+        return engine
+
+
+def _corners(xs, zs):
+    """Block columns under the four corners of each body, ``(n, 4)``."""
+    low = HALF_WIDTH
+    high = HALF_WIDTH - _EPSILON
+    bx = np.floor(np.stack((xs - low, xs + high, xs - low, xs + high), 1))
+    bz = np.floor(np.stack((zs - low, zs - low, zs + high, zs + high), 1))
+    return bx.astype(np.int64), bz.astype(np.int64)
+
+
+class PhysicsEngine:
+    """Step the bodies of many bots each tick.
+
+    Args:
+      ticks (TickLoop): runs :meth:`tick`, or ``None`` to call it yourself
+    """
+
+    def __init__(self, ticks=None):
+        if np is None:
+            raise ImportError("physics needs NumPy: pip install trashbags[numpy]")
+        self.ticks = ticks
+        self.bots = []
+        self.walkability = []
+        self.velocity = np.zeros(0)
+        self.on_ground = np.zeros(0, dtype=bool)
+        self.stuck = np.zeros(0, dtype=np.int32)
+        self.jumps = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.ticks is not None:
+            self._task = self.ticks.call_every(TICK, self.tick, deferrable=False)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, bot, walkability):
+        """Move ``bot`` with physics, looking blocks up in ``walkability``."""
+        with self._lock:
+            self.bots = self.bots + [bot]
+            self.walkability = self.walkability + [walkability]
+            self.velocity = np.append(self.velocity, 0.0)
+            self.on_ground = np.append(self.on_ground, False)
+            self.stuck = np.append(self.stuck, 0)
+
+    def remove(self, bot):
+        with self._lock:
+            index = self.bots.index(bot)
+            keep = np.arange(len(self.bots)) != index
+            self.bots = self.bots[:index] + self.bots[index + 1 :]
+            self.walkability = self.walkability[:index] + self.walkability[index + 1 :]
+            self.velocity = self.velocity[keep]
+            self.on_ground = self.on_ground[keep]
+            self.stuck = self.stuck[keep]
+
+    def reset(self, bot):
+        """Forget ``bot``'s speed, after the server placed it somewhere."""
+        with self._lock:
+            index = self.bots.index(bot)
+            self.velocity[index] = 0.0
+            self.on_ground[index] = False
+
+    # Block lookups
+
+    def solid(self, owners, xs, ys, zs):
+        """Whether each block blocks a body, for many bots at once.
+
+        Blocks of chunks that are not loaded are solid, above the world
+        and below it nothing is.
+
+        Args:
+          owners: index of the bot whose world each block is looked up in
+          xs, ys, zs: integer block coordinates, arrays of one shape
+        """
+        shape = np.broadcast_shapes(
+            np.shape(owners), np.shape(xs), np.shape(ys), np.shape(zs)
+        )
+        owners, xs, ys, zs = (
+            np.broadcast_to(a, shape).ravel() for a in (owners, xs, ys, zs)
+        )
+        solid = np.ones(len(xs), dtype=bool)
+        inside = (ys >= 0) & (ys < 256)
+        solid[~inside] = False
+        if not inside.any():
+            return solid.reshape(shape)
+        cells = np.flatnonzero(inside)
+        cx, cz = xs[cells] >> 4, zs[cells] >> 4
+        keys = owners[cells] << 44 | (cx & 0x3FFFFF) << 22 | (cz & 0x3FFFFF)
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(np.bincount(inverse, minlength=len(unique)))
+        offsets = (ys[cells] << 8) | (zs[cells] & 15) << 4 | (xs[cells] & 15)
+        start = 0
+        for group, end in enumerate(bounds):
+            members = order[start:end]
+            start = end
+            cell = cells[first[group]]
+            grid = self.walkability[owners[cell]].grid(xs[cell] >> 4, zs[cell] >> 4)
+            if grid is None:
+                continue
+            flags = np.frombuffer(grid, dtype=np.uint8)
+            solid[cells[members]] = (flags[offsets[members]] & PASSABLE) == 0
+        return solid.reshape(shape)
+
+    def _blocked(self, owners, xs, ys, zs):
+        """Whether the box of each body at ``xs``, ``ys``, ``zs`` hits a block."""
+        bx, bz = _corners(xs, zs)
+        feet = np.floor(ys + _EPSILON).astype(np.int64)
+        head = np.floor(ys + HEIGHT - _EPSILON).astype(np.int64)
+        levels = feet[:, None] + np.arange(3)
+        levels = np.minimum(levels, head[:, None])
+        solid = self.solid(
+            owners[:, None, None], bx[:, :, None], levels[:, None, :], bz[:, :, None]
+        )
+        return solid.any(axis=(1, 2))
+
+    # Stepping
+
+    def step(self, positions, targets, velocity, owners=None):
+        """Move bodies by one tick.
+
+        Args:
+          positions: ``(n, 3)`` current feet positions
+          targets: ``(n, 3)`` where each bot walks to this tick, NaN rows
+            for bots standing still
+          velocity: ``(n,)`` vertical speed, in blocks per tick
+          owners: bot index of each row, ``arange(n)`` by default
+
+        Returns:
+          tuple: new positions, velocity and on_ground, and a mask of the
+          bots whose walk was blocked this tick
+        """
+        n = len(positions)
+        if owners is None:
+            owners = np.arange(n)
+        x, y, z = (positions[:, axis].copy() for axis in range(3))
+        walking = ~np.isnan(targets[:, 0])
+        dx = np.where(walking, targets[:, 0] - x, 0.0)
+        dz = np.where(walking, targets[:, 2] - z, 0.0)
+        velocity = velocity.copy()
+
+        # Vertical first, as the client does
+        y, velocity, on_ground = self._fall(owners, x, y, z, velocity)
+
+        blocked = np.zeros(n, dtype=bool)
+        for delta, axis in ((dx, 0), (dz, 2)):
+            moving = delta != 0
+            if not moving.any():
+                continue
+            nx = x + delta if axis == 0 else x
+            nz = z + delta if axis == 2 else z
+            hit = moving & self._blocked(owners, nx, y, nz)
+            blocked |= hit
+            if axis == 0:
+                x = np.where(hit, x, nx)
+            else:
+                z = np.where(hit, z, nz)
+
+        # A walk stopped by a step jumps, the next ticks clear it
+        jumping = blocked & on_ground
+        self.jumps += int(jumping.sum())
+        velocity = np.where(jumping, JUMP_VELOCITY, velocity)
+        return np.stack((x, y, z), 1), velocity, on_ground, blocked
+
+    def _fall(self, owners, x, y, z, velocity):
+        bx, bz = _corners(x, z)
+        target = y + velocity
+
+        # Landing: the highest block top between the feet and the target
+        top = np.floor(y + _EPSILON).astype(np.int64) - 1
+        levels = top[:, None] - np.arange(_FALL_LEVELS)
+        solid = self.solid(
+            owners[:, None, None], bx[:, :, None], levels[:, None, :], bz[:, :, None]
+        ).any(axis=1)
+        reachable = (levels + 1 >= target[:, None] - _EPSILON) & (velocity <= 0)[
+            :, None
+        ]
+        landing = solid & reachable
+        lands = landing.any(axis=1)
+        floor = levels[np.arange(len(y)), np.argmax(landing, axis=1)] + 1
+
+        # Bumping a ceiling when going up
+        head = np.floor(y + HEIGHT + _EPSILON).astype(np.int64)
+        ceiling_levels = head[:, None] + np.arange(2)
+        ceiling = self.solid(
+            owners[:, None, None],
+            bx[:, :, None],
+            ceiling_levels[:, None, :],
+            bz[:, :, None],
+        ).any(axis=1)
+        above = ceiling_levels >= (y + HEIGHT - _EPSILON)[:, None]
+        bumping = ceiling & above & (ceiling_levels < target[:, None] + HEIGHT)
+        bumping &= (velocity > 0)[:, None]
+        bumps = bumping.any(axis=1)
+        roof = ceiling_levels[np.arange(len(y)), np.argmax(bumping, axis=1)]
+
+        # Bodies in unloaded chunks, inside a block as far as we know, wait
+        frozen = self.solid(
+            owners[:, None], bx, np.floor(y + _EPSILON).astype(np.int64)[:, None], bz
+        ).all(axis=1)
+        new_y = np.where(lands, floor, np.where(bumps, roof - HEIGHT, target))
+        new_y = np.where(frozen, y, new_y)
+        stopped = lands | bumps | frozen
+        velocity = np.where(stopped, 0.0, velocity)
+        # Gravity and drag for the next tick
+        velocity = (velocity - GRAVITY) * DRAG
+        return new_y, velocity, lands
+
+    def tick(self):
+        """Step every bot in the game and send the moves it made.
+
+        Bots move once the server placed them, as the vanilla client does;
+        before that a connection may still be logging in.
+        """
+        with self._lock:
+            bots = self.bots
+            rows = [
+                i
+                for i, bot in enumerate(bots)
+                if bot.connection is not None and bot.spawned
+            ]
+            if not rows:
+                return
+            velocity = self.velocity[rows]
+            on_ground = self.on_ground[rows]
+        # Moves are only sent from positions the server has not replaced since
+        teleports = [bots[i].movement.teleports for i in rows]
+        steps = [bots[i].movement.peek() for i in rows]
+        positions = np.array([bots[i].position for i in rows], dtype=float)
+        targets = np.array(
+            [step[1] if step is not None else (np.nan,) * 3 for step in steps],
+            dtype=float,
+        )
+        owners = np.array(rows)
+        moved, velocity, landed, blocked = self.step(
+            positions, targets, velocity, owners
+        )
+        reached = ~blocked & ~np.isnan(targets[:, 0])
+        changed = (moved != positions).any(axis=1) | (landed != on_ground)
+
+        with self._lock:
+            if self.bots is bots:
+                # reset() already gave teleported bots the speed they keep
+                current = np.array(
+                    [
+                        bots[i].movement.teleports == teleports[row]
+                        for row, i in enumerate(rows)
+                    ],
+                    dtype=bool,
+                )
+                kept = np.array(rows)[current]
+                self.velocity[kept] = velocity[current]
+                self.on_ground[kept] = landed[current]
+                self.stuck[rows] = np.where(blocked, self.stuck[rows] + 1, 0)
+                stuck = self.stuck[rows]
+            else:
+                stuck = np.zeros(len(rows), dtype=np.int32)
+
+        for row, i in enumerate(rows):
+            bot = bots[i]
+            step = steps[row]
+            if changed[row] or step is not None:
+                position = tuple(moved[row].tolist())
+                rotation = step[2] if step is not None else bot.rotation
+                try:
+                    sent = bot.movement.send(
+                        teleports[row], position, rotation, on_ground=bool(landed[row])
+                    )
+                except Exception:
+                    # A connection dropping under one bot must not stop the rest;
+                    # the server places it again when it reconnects
+                    _logger.exception("Moving %s failed", bot.options.username)
+                    continue
+                if not sent:
+                    continue
+            if step is not None:
+                if reached[row]:
+                    bot.movement.advance(step[0])
+                elif stuck[row] >= STUCK_TICKS:
+                    _logger.debug(
+                        "%s is stuck, dropping its walk", bot.options.username
+                    )
+                    bot.movement.clear()
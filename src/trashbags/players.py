@@ -0,0 +1,138 @@
+"""
+Tab-list player registry.
+
+Keeps the players announced through ``PlayerListItemPacket`` indexed both
+by UUID and by name, so joins, leaves and lookups are all O(1) and a packet
+carrying a batch of players is applied in one pass.
+"""
+
+from typing import Dict, Iterator, Optional
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class PlayerEntry:
+    """One player on the server's tab list."""
+
+    __slots__ = ("uuid", "name", "gamemode", "ping", "display_name")
+
+    def __init__(self, uuid, name, gamemode=None, ping=None, display_name=None):
+        self.uuid = uuid
+        self.name = name
+        self.gamemode = gamemode
+        self.ping = ping
+        self.display_name = display_name
+
+    def __repr__(self):
+        return f"PlayerEntry({self.name!r}, {self.uuid!r})"
+
+
+class PlayerRegistry:
+    """Players currently on the server, indexed by UUID and by name."""
+
+    def __init__(self):
+        self._by_uuid: Dict[str, PlayerEntry] = {}
+        self._by_name: Dict[str, PlayerEntry] = {}
+
+    def __len__(self):
+        return len(self._by_uuid)
+
+    def __contains__(self, uuid):
+        return uuid in self._by_uuid
+
+    def __iter__(self) -> Iterator[PlayerEntry]:
+        return iter(self._by_uuid.values())
+
+    def get(self, uuid) -> Optional[PlayerEntry]:
+        return self._by_uuid.get(uuid)
+
+    def by_name(self, name) -> Optional[PlayerEntry]:
+        return self._by_name.get(name)
+
+    def uuid_of(self, name) -> Optional[str]:
+        entry = self._by_name.get(name)
+        return entry.uuid if entry is not None else None
+
+    def name_of(self, uuid) -> Optional[str]:
+        entry = self._by_uuid.get(uuid)
+        return entry.name if entry is not None else None
+
+    def add(self, uuid, name, gamemode=None, ping=None, display_name=None):
+        entry = self._by_uuid.get(uuid)
+        if entry is None:
+            entry = self._by_uuid[uuid] = PlayerEntry(uuid, name)
+        elif entry.name != name and self._by_name.get(entry.name) is entry:
+            del self._by_name[entry.name]
+        entry.name = name
+        entry.gamemode = gamemode
+        entry.ping = ping
+        entry.display_name = display_name
+        self._by_name[name] = entry
+        return entry
+
+    def remove(self, uuid) -> Optional[PlayerEntry]:
+        entry = self._by_uuid.pop(uuid, None)
+        if entry is not None and self._by_name.get(entry.name) is entry:
+            del self._by_name[entry.name]
+        return entry
+
+    def clear(self):
+        self._by_uuid.clear()
+        self._by_name.clear()
+
+    def apply(self, packet):
+        """Apply every action of a ``PlayerListItemPacket``.
+
+        Args:
+          packet: the packet, or anything with ``action_type`` and ``actions``
+        """
+        handler = self._ACTIONS.get(packet.action_type.__name__)
+        if handler is not None:
+            handler(self, packet.actions)
+
+    def _add_players(self, actions):
+        add = self.add
+        for action in actions:
+            add(
+                action.uuid,
+                action.name,
+                getattr(action, "gamemode", None),
+                getattr(action, "ping", None),
+                getattr(action, "display_name", None),
+            )
+
+    def _remove_players(self, actions):
+        remove = self.remove
+        for action in actions:
+            remove(action.uuid)
+
+    def _update_gamemode(self, actions):
+        by_uuid = self._by_uuid
+        for action in actions:
+            entry = by_uuid.get(action.uuid)
+            if entry is not None:
+                entry.gamemode = action.gamemode
+
+    def _update_latency(self, actions):
+        by_uuid = self._by_uuid
+        for action in actions:
+            entry = by_uuid.get(action.uuid)
+            if entry is not None:
+                entry.ping = action.ping
+
+    def _update_display_name(self, actions):
+        by_uuid = self._by_uuid
+        for action in actions:
+            entry = by_uuid.get(action.uuid)
+            if entry is not None:
+                entry.display_name = action.display_name
+
+    _ACTIONS = {
+        "AddPlayerAction": _add_players,
+        "RemovePlayerAction": _remove_players,
+        "UpdateGameModeAction": _update_gamemode,
+        "UpdateLatencyAction": _update_latency,
+        "UpdateDisplayNameAction": _update_display_name,
+    }
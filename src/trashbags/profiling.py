@@ -0,0 +1,195 @@
+"""
+Opt-in sampling profiler for the bot's threads.
+
+:class:`Profiler` samples the stack of every thread at a fixed interval
+from a daemon thread, so pyCraft's decoding, the packet listeners, the
+writer and the console all show up in proportion to the time they take,
+without tracing every call. Listeners and ``write_packet`` wrapped with
+:meth:`Profiler.wrap` and :meth:`Profiler.wrap_writes` also tag the
+samples taken while they run with the handler and packet type, and are
+timed per handler and packet type for the slow handler report::
+
+    profiler = Profiler().start()
+    bot = Trashbag(options, profiler=profiler)
+    ...
+    profiler.stop()
+    profiler.write_collapsed("bot.folded")  # flamegraph.pl bot.folded
+    print(profiler.report())
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+
+class HandlerStats:
+    """Calls and run time of one handler for one packet type."""
+
+    __slots__ = ("calls", "total", "worst")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.worst = 0.0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.worst:
+            self.worst = elapsed
+
+
+def _frame_name(code):
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Profiler:
+    """Sample every thread's stack and time the wrapped handlers.
+
+    Args:
+      interval (float): seconds between two samples
+      max_depth (int): innermost frames kept per sample
+    """
+
+    def __init__(self, interval=0.005, max_depth=64, clock=time.perf_counter):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.clock = clock
+        self.stacks = Counter()
+        self.handlers = {}
+        self.samples = 0
+        self._tags = {}
+        self._names = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="trashbags-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """Record the current stack of every thread but the sampler's."""
+        me = threading.get_ident()
+        frames = sys._current_frames()
+        if frames.keys() - self._names.keys():
+            self._names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+        for ident, frame in frames.items():
+            if ident == me:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            tag = self._tags.get(ident)
+            if tag is not None:
+                names.append(tag)
+            names.append(self._names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(names))] += 1
+        self.samples += 1
+
+    def _timed(self, name, packet_type, func, *args, **kwargs):
+        ident = threading.get_ident()
+        tags = self._tags
+        outer = tags.get(ident)
+        tags[ident] = f"[{name} {packet_type}]"
+        began = self.clock()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = self.clock() - began
+            if outer is None:
+                del tags[ident]
+            else:
+                tags[ident] = outer
+            key = (name, packet_type)
+            stats = self.handlers.get(key)
+            if stats is None:
+                stats = self.handlers[key] = HandlerStats()
+            stats.add(elapsed)
+
+    def wrap(self, handler, name=None):
+        """Wrap a packet listener to tag and time each call by packet type."""
+        name = name or getattr(handler, "__name__", repr(handler))
+        timed = self._timed
+
+        # Named after the handler, so metrics wrapped around it label it right
+        @wraps(handler)
+        def profiled(packet):
+            return timed(name, type(packet).__name__, handler, packet)
+
+        return profiled
+
+    def wrap_writes(self, connection):
+        """Tag and time ``connection.write_packet`` calls."""
+        write_packet = connection.write_packet
+        timed = self._timed
+
+        def profiled_write_packet(packet, *args, **kwargs):
+            return timed(
+                "write_packet",
+                type(packet).__name__,
+                write_packet,
+                packet,
+                *args,
+                **kwargs,
+            )
+
+        connection.write_packet = profiled_write_packet
+
+    def write_collapsed(self, path):
+        """Write the samples in the collapsed stack format of flamegraph.pl."""
+        with open(path, "w") as collapsed:
+            for stack, count in sorted(self.stacks.items()):
+                collapsed.write(f"{stack} {count}\n")
+        _logger.info(
+            "Wrote %d stacks from %d samples to %s",
+            len(self.stacks),
+            self.samples,
+            path,
+        )
+
+    def top(self, count=10):
+        """The ``count`` handler and packet type pairs that took the most time."""
+        ranked = sorted(self.handlers.items(), key=lambda item: -item[1].total)
+        return ranked[:count]
+
+    def report(self, count=10):
+        lines = [
+            f"{'handler':<24} {'packet':<32} {'calls':>8} {'total ms':>10} "
+            f"{'mean ms':>8} {'max ms':>8}"
+        ]
+        for (name, packet_type), stats in self.top(count):
+            lines.append(
+                f"{name:<24} {packet_type:<32} {stats.calls:>8} "
+                f"{stats.total * 1e3:>10.1f} {stats.total / stats.calls * 1e3:>8.3f} "
+                f"{stats.worst * 1e3:>8.1f}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,83 @@
+"""
+The one protocol version the bot speaks, and pyCraft's packets for it.
+
+Importing pyCraft's networking layer pulls in every packet module of every
+version it supports, so the bot only does it when it first needs a packet
+class. :func:`registry` then indexes the 1.12.2 play packets by id once per
+process, for every bot, capture and replay to share. :func:`prebuild` does
+that on a background thread, overlapping with option parsing and login::
+
+    protocol.prebuild()
+    ...
+    packets = protocol.registry()
+    packets.serverbound.ChatPacket()
+    packets.clientbound_ids[0x0F]  # ChatMessagePacket
+"""
+
+import logging
+import threading
+from functools import lru_cache
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+VERSION = "1.12.2"
+PROTOCOL_VERSION = 340
+
+
+class PacketRegistry:
+    """pyCraft's play packets for one protocol version, indexed by id.
+
+    Attributes:
+      context: the pyCraft ``ConnectionContext`` for the version
+      Packet: pyCraft's base packet class
+      clientbound: module of clientbound play packet classes
+      serverbound: module of serverbound play packet classes
+      clientbound_ids (dict): packet id to clientbound play class
+      serverbound_ids (dict): packet id to serverbound play class
+    """
+
+    def __init__(self, protocol_version=PROTOCOL_VERSION):
+        from minecraft.networking.connection import ConnectionContext
+        from minecraft.networking.packets import Packet, clientbound, serverbound
+
+        self.protocol_version = protocol_version
+        self.context = ConnectionContext(protocol_version=protocol_version)
+        self.Packet = Packet
+        self.clientbound = clientbound.play
+        self.serverbound = serverbound.play
+        self.clientbound_ids = self._index(clientbound.play)
+        self.serverbound_ids = self._index(serverbound.play)
+
+    def _index(self, module):
+        context = self.context
+        return {
+            packet.get_id(context): packet for packet in module.get_packets(context)
+        }
+
+
+@lru_cache(maxsize=None)
+def registry(protocol_version=PROTOCOL_VERSION):
+    """The :class:`PacketRegistry` of ``protocol_version``, built once."""
+    return PacketRegistry(protocol_version)
+
+
+def prebuild():
+    """Build the registry on a daemon thread, if pyCraft is installed.
+
+    Returns:
+      threading.Thread: the thread doing it
+    """
+
+    def build():
+        try:
+            registry()
+        except ImportError as error:
+            _logger.debug("Not prebuilding the packet registry: %s", error)
+
+    thread = threading.Thread(target=build, name="trashbags-prebuild", daemon=True)
+    thread.start()
+    return thread
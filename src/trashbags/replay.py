@@ -0,0 +1,292 @@
+"""
+Offline packet replay.
+
+:class:`FakeConnection` stands in for pyCraft's ``Connection`` so a
+:class:`~trashbags.trashbag.Trashbag` can register its listeners without a
+server, and :class:`ReplayEngine` feeds it clientbound packets, recorded
+with ``--capture`` or built by the ``synthetic_*`` helpers, either as fast
+as possible or at their recorded pace, timing every listener.
+"""
+
+import time
+import tracemalloc
+from optparse import Values
+
+from .capture import INCOMING, decode_record, play_packets, read_capture
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_DEFAULT_OPTIONS = {
+    "username": "replay",
+    "password": None,
+    "server": "localhost",
+    "address": "localhost",
+    "port": 25565,
+    "offline": True,
+    "dump_packets": False,
+    "dump_unknown": False,
+    "microsoft": False,
+    "capture": None,
+    "capture_gzip": False,
+    "decode_all": False,
+    "snapshots": None,
+    "world_memory": 64,
+    "auth_list": [],
+    "loglevel": None,
+}
+
+
+def replay_options(**overrides):
+    """Options for a bot that is only ever fed replayed packets."""
+    return Values(dict(_DEFAULT_OPTIONS, **overrides))
+
+
+class _Listener:
+    __slots__ = ("method", "packet_types", "name")
+
+    def __init__(self, method, packet_types):
+        self.method = method
+        self.packet_types = packet_types
+        self.name = getattr(method, "__qualname__", repr(method))
+
+
+class FakeConnection:
+    """Enough of pyCraft's ``Connection`` for a bot to run against."""
+
+    def __init__(self):
+        self.connected = True
+        self.listeners = []
+        self.early_listeners = []
+        self.outgoing_listeners = []
+        self.exception_handlers = []
+        self.reactor = None
+        self.written = []
+
+    def register_packet_listener(
+        self, method, *packet_types, outgoing=False, early=False
+    ):
+        listener = _Listener(method, packet_types)
+        if outgoing:
+            self.outgoing_listeners.append(listener)
+        elif early:
+            self.early_listeners.append(listener)
+        else:
+            self.listeners.append(listener)
+
+    def register_exception_handler(self, handler, *exc_types, early=False):
+        self.exception_handlers.append(handler)
+
+    def add_reactor_hook(self, hook):
+        pass
+
+    def write_packet(self, packet, force=False):
+        for listener in self.outgoing_listeners:
+            if isinstance(packet, listener.packet_types):
+                listener.method(packet)
+        self.written.append(packet)
+
+    def disconnect(self, immediate=False):
+        self.connected = False
+
+    def receive(self, packet):
+        """Dispatch ``packet`` as pyCraft's reactor would."""
+        for listeners in (self.early_listeners, self.listeners):
+            for listener in listeners:
+                if isinstance(packet, listener.packet_types):
+                    listener.method(packet)
+
+
+class ListenerStats:
+    """Per-listener timings collected during a replay."""
+
+    __slots__ = ("name", "durations", "allocated")
+
+    def __init__(self, name):
+        self.name = name
+        self.durations = []
+        self.allocated = []
+
+    def summary(self):
+        durations = sorted(self.durations)
+        count = len(durations)
+        total = sum(durations)
+        p99 = durations[min(count - 1, int(count * 0.99))] if count else None
+        result = {
+            "calls": count,
+            "packets_per_sec": count / total if total else None,
+            "mean_us": total / count * 1e6 if count else None,
+            "p99_us": p99 * 1e6 if count else None,
+        }
+        if self.allocated:
+            result["alloc_bytes_per_packet"] = sum(self.allocated) / len(self.allocated)
+        return result
+
+
+class ReplayEngine:
+    """Feed packets into a bot through a :class:`FakeConnection`.
+
+    Args:
+      connection (FakeConnection): the connection the bot registered on
+      trace_allocations (bool): also record, per listener call, the peak
+        memory it allocated; this slows the replay down considerably
+    """
+
+    def __init__(self, connection, trace_allocations=False):
+        self.connection = connection
+        self.trace_allocations = trace_allocations
+        self.stats = {}
+        self.packets = 0
+        self.elapsed = 0.0
+
+    def _stats_for(self, listener):
+        stats = self.stats.get(listener.name)
+        if stats is None:
+            stats = self.stats[listener.name] = ListenerStats(listener.name)
+        return stats
+
+    def _dispatch(self, packet):
+        clock = time.perf_counter
+        trace = self.trace_allocations
+        connection = self.connection
+        for listeners in (connection.early_listeners, connection.listeners):
+            for listener in listeners:
+                if not isinstance(packet, listener.packet_types):
+                    continue
+                stats = self._stats_for(listener)
+                if trace:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                start = clock()
+                listener.method(packet)
+                stats.durations.append(clock() - start)
+                if trace:
+                    stats.allocated.append(tracemalloc.get_traced_memory()[1] - before)
+
+    def replay(self, packets, realtime=False, speed=1.0):
+        """Dispatch every packet.
+
+        Args:
+          packets: iterable of packets, or of (timestamp, packet) pairs
+          realtime (bool): sleep to reproduce the recorded spacing of
+            timestamped packets, divided by ``speed``
+
+        Returns:
+          dict: per-listener summaries, see :meth:`summary`
+        """
+        started_tracing = self.trace_allocations and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        first = None
+        start = time.perf_counter()
+        try:
+            for item in packets:
+                if isinstance(item, tuple):
+                    timestamp, packet = item
+                    if realtime:
+                        if first is None:
+                            first = timestamp
+                        delay = (timestamp - first) / speed - (
+                            time.perf_counter() - start
+                        )
+                        if delay > 0:
+                            time.sleep(delay)
+                else:
+                    packet = item
+                self._dispatch(packet)
+                self.packets += 1
+        finally:
+            self.elapsed += time.perf_counter() - start
+            if started_tracing:
+                tracemalloc.stop()
+        return self.summary()
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+
+def load_capture(path):
+    """Decoded clientbound play packets of a capture, as (timestamp, packet).
+
+    Requires pyCraft.
+    """
+    context, classes = play_packets()
+    packets = []
+    for record in read_capture(path):
+        if record.direction != INCOMING:
+            continue
+        try:
+            packet = decode_record(record, context, classes)
+        except Exception:
+            continue
+        if packet is not None:
+            packets.append((record.timestamp, packet))
+    return packets
+
+
+def synthetic_chat(messages, whisper_every=10):
+    """Chat packets, every ``whisper_every``-th one a whisper."""
+    from minecraft.networking.packets import clientbound
+
+    packets = []
+    for i in range(messages):
+        packet = clientbound.play.ChatMessagePacket()
+        if i % whisper_every == 0:
+            packet.json_data = (
+                '{"color":"gray","extra":[{"text":"["},{"color":"light_purple",'
+                f'"text":"player{i % 50}"}},{{"text":" -> me] message {i}"}}],'
+                '"text":""}'
+            )
+        else:
+            packet.json_data = (
+                f'{{"extra":[{{"text":"<player{i % 50}> message {i}"}}],"text":""}}'
+            )
+        packet.position = 0
+        packets.append(packet)
+    return packets
+
+
+def synthetic_player_list(players, batch=1):
+    """Add every player in batches of ``batch``, then remove them one by one."""
+    import uuid
+
+    from minecraft.networking.packets import clientbound
+
+    item = clientbound.play.PlayerListItemPacket
+    people = [(str(uuid.UUID(int=i + 1)), f"player{i}") for i in range(players)]
+    packets = []
+    for start in range(0, players, batch):
+        packet = item()
+        packet.action_type = item.AddPlayerAction
+        packet.actions = []
+        for player_uuid, name in people[start : start + batch]:
+            action = item.AddPlayerAction()
+            action.uuid, action.name = player_uuid, name
+            action.properties, action.gamemode, action.ping = [], 0, 50
+            action.display_name = None
+            packet.actions.append(action)
+        packets.append(packet)
+    for player_uuid, _ in people:
+        packet = item()
+        packet.action_type = item.RemovePlayerAction
+        action = item.RemovePlayerAction()
+        action.uuid = player_uuid
+        packet.actions = [action]
+        packets.append(packet)
+    return packets
+
+
+def synthetic_positions(count):
+    """Server position corrections along the x axis."""
+    from minecraft.networking.packets import clientbound
+
+    packets = []
+    for i in range(count):
+        packet = clientbound.play.PlayerPositionAndLookPacket()
+        packet.x, packet.y, packet.z = float(i), 64.0, 0.0
+        packet.yaw, packet.pitch = 0.0, 0.0
+        packet.flags = 0
+        packet.teleport_id = i
+        packets.append(packet)
+    return packets
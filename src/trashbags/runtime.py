@@ -0,0 +1,184 @@
+"""
+Asyncio front end for the bot.
+
+pyCraft calls packet listeners on its networking thread, so a slow listener
+delays reading the next packet (and the keep-alive behind it). A
+:class:`Runtime` moves listeners off that thread: they are queued onto the
+asyncio loop, or onto a bounded worker pool for handlers that block. When
+a lane falls behind, pyCraft's thread waits for room rather than queueing
+without limit, since most listeners keep state (the tab list, the world,
+entities, the position) that a lost packet would leave wrong for good;
+only listeners registered as ``sheddable`` have packets dropped and
+counted instead. Console lines are read without blocking the loop.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+
+class _Lane:
+    """Bounded count of listener calls queued on one side of the runtime."""
+
+    __slots__ = ("limit", "pending", "dispatched", "dropped", "waits", "ready")
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.pending = 0
+        self.dispatched = 0
+        self.dropped = 0
+        # Calls that had to wait for room
+        self.waits = 0
+        self.ready = threading.Condition()
+
+    def acquire(self, shed=False):
+        """Take a slot, waiting for one unless the call may be ``shed``.
+
+        Returns:
+          bool: whether to queue the call
+        """
+        with self.ready:
+            if self.pending >= self.limit:
+                if shed:
+                    self.dropped += 1
+                    return False
+                self.waits += 1
+                while self.pending >= self.limit:
+                    self.ready.wait()
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self.ready:
+            self.pending -= 1
+            self.dispatched += 1
+            self.ready.notify()
+
+    def as_dict(self):
+        return {
+            "pending": self.pending,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "waits": self.waits,
+        }
+
+
+class Runtime:
+    """Dispatch listeners onto an asyncio loop or a worker pool.
+
+    Args:
+      workers (int): threads for blocking handlers
+      max_pending (int): calls queued per lane before the network thread
+        waits, or the packets of sheddable listeners are dropped
+    """
+
+    def __init__(self, workers=4, max_pending=1000):
+        self.loop = None
+        self.loop_lane = _Lane(max_pending)
+        self.worker_lane = _Lane(max_pending)
+        self._executor = ThreadPoolExecutor(workers, "trashbags-worker")
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        return self
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return {"loop": self.loop_lane.as_dict(), "workers": self.worker_lane.as_dict()}
+
+    def listener(self, handler, blocking=False, sheddable=False):
+        """Wrap ``handler`` so pyCraft's thread only queues the call.
+
+        Args:
+          handler: the packet listener
+          blocking (bool): run it on the worker pool instead of the loop, for
+            handlers that wait on I/O; such handlers may run concurrently
+          sheddable (bool): drop packets when the lane is full instead of
+            waiting, only for handlers that keep no state
+
+        Returns:
+          callable: the listener to register with pyCraft
+        """
+        lane = self.worker_lane if blocking else self.loop_lane
+        call = self._call
+
+        if blocking:
+
+            def dispatch(packet):
+                if lane.acquire(sheddable):
+                    self._executor.submit(call, lane, handler, packet)
+
+        else:
+
+            def dispatch(packet):
+                if lane.acquire(sheddable):
+                    self.loop.call_soon_threadsafe(call, lane, handler, packet)
+
+        dispatch.__wrapped__ = handler
+        return dispatch
+
+    @staticmethod
+    def _call(lane, handler, packet):
+        try:
+            handler(packet)
+        except Exception:
+            _logger.exception("Packet listener %r failed", handler)
+        finally:
+            lane.release()
+
+    def submit(self, func, *args):
+        """Run ``func(*args)`` on the worker pool, from any thread.
+
+        Returns:
+          concurrent.futures.Future: its result
+        """
+        return self._executor.submit(func, *args)
+
+    async def run_blocking(self, func, *args):
+        """Run ``func(*args)`` on the worker pool and wait for its result."""
+        return await self.loop.run_in_executor(self._executor, func, *args)
+
+    async def lines(self, stream=None):
+        """Yield lines typed on ``stream`` (stdin) without blocking the loop.
+
+        Lines are read by a thread of their own with blocking reads. Having
+        the loop watch stdin would make it non-blocking, and stdout with it
+        on a terminal, so that prints the terminal cannot take at once fail.
+        """
+        stream = stream or sys.stdin
+        loop = self.loop
+        queue = asyncio.Queue()
+
+        def read():
+            while True:
+                try:
+                    line = stream.readline()
+                except (OSError, ValueError):
+                    line = ""
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, line)
+                except RuntimeError:
+                    # The loop closed
+                    return
+                if not line:
+                    return
+
+        # A daemon, the process may exit while it waits for a line
+        threading.Thread(target=read, name="trashbags-console", daemon=True).start()
+        while True:
+            line = await queue.get()
+            if not line:
+                return
+            if isinstance(line, bytes):
+                line = line.decode(errors="replace")
+            yield line.rstrip("\r\n")
@@ -0,0 +1,131 @@
+"""
+A single background thread that runs timed and periodic callbacks.
+
+One :class:`Scheduler` is shared by every bot in a process, so staggered
+start-ups and periodic housekeeping do not cost a thread per bot.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+
+class Task:
+    """A scheduled callback, as returned by the ``Scheduler.call_*`` methods."""
+
+    __slots__ = ("when", "seq", "func", "args", "interval", "cancelled")
+
+    def __init__(self, when, seq, func, args, interval=None):
+        self.when = when
+        self.seq = seq
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """Runs callbacks at given monotonic times on one daemon thread."""
+
+    def __init__(self, name="trashbags-scheduler", clock=time.monotonic):
+        self.name = name
+        self.clock = clock
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        # Seconds the last task ran past its due time, and optionally all of them
+        self.lag = 0.0
+        self.lag_histogram = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return self
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait=True):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        thread = self._thread
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def call_at(self, when, func, *args) -> Task:
+        return self._push(Task(when, next(self._seq), func, args))
+
+    def call_later(self, delay, func, *args) -> Task:
+        return self.call_at(self.clock() + delay, func, *args)
+
+    def call_every(self, interval, func, *args, delay=None) -> Task:
+        """Run ``func`` every ``interval`` seconds, without accumulating drift.
+
+        If the scheduler falls behind, missed runs are skipped rather than
+        run back to back.
+        """
+        when = self.clock() + (interval if delay is None else delay)
+        return self._push(Task(when, next(self._seq), func, args, interval))
+
+    def _push(self, task):
+        with self._cond:
+            heapq.heappush(self._queue, task)
+            if self._queue[0] is task:
+                self._cond.notify()
+        return task
+
+    def _run(self):
+        queue = self._queue
+        while True:
+            with self._cond:
+                while self._running:
+                    if queue:
+                        timeout = queue[0].when - self.clock()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                task = heapq.heappop(queue)
+
+            if task.cancelled:
+                continue
+            self.lag = lag = -timeout
+            if self.lag_histogram is not None:
+                self.lag_histogram.observe(lag)
+            try:
+                task.func(*task.args)
+            except Exception:
+                _logger.exception("Scheduled task %r failed", task.func)
+
+            if task.interval is not None and not task.cancelled:
+                now = self.clock()
+                task.when += task.interval
+                if task.when < now:
+                    skipped = (now - task.when) // task.interval + 1
+                    task.when += skipped * task.interval
+                self._push(task)
@@ -0,0 +1,278 @@
+"""
+Spread a roster over several processes.
+
+pyCraft decodes packets in pure Python, under the GIL, so one process runs
+out of CPU long before the machine does. A :class:`ShardPool` splits the
+accounts of a roster between worker processes, one per CPU by default, that
+share nothing: each runs its own :class:`~trashbags.fleet.Fleet`, scheduler
+and listeners. The parent only talks to them over a pipe per worker, with
+small request and reply tuples:
+
+==========================  ==================================
+request                     reply
+==========================  ==================================
+``("command", text)``       lines the command replied with
+``("metrics",)``            :meth:`Metrics.export` families
+``("start", [options])``    ``None``, once the bots are queued
+``("stop",)``               ``None``, then the worker exits
+==========================  ==================================
+
+When a worker dies, its accounts are handed to the surviving workers with
+the fewest bots, or to a new worker if none survive::
+
+    pool = ShardPool(load_roster(path, options), partial(run_shard, options))
+    pool.start(scheduler)
+    pool.dispatch("where", print)
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from .commands import CONSOLE, CommandContext
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+
+def assign(roster, shards):
+    """Deal the accounts of ``roster`` round-robin into ``shards`` lists."""
+    return [list(roster[index::shards]) for index in range(shards)]
+
+
+def _name(options):
+    return getattr(options, "name", options.username)
+
+
+class Shard:
+    """The parent's side of one worker process."""
+
+    def __init__(self, index, process, channel, accounts):
+        self.index = index
+        self.process = process
+        self.channel = channel
+        self.accounts = accounts
+        self.lock = threading.Lock()
+        self._sequence = 0
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def request(self, message, timeout):
+        """Send ``message`` and wait up to ``timeout`` seconds for the reply.
+
+        Raises:
+          EOFError: the worker is gone
+          TimeoutError: it did not answer in time
+        """
+        with self.lock:
+            self._sequence += 1
+            deadline = time.monotonic() + timeout
+            try:
+                self.channel.send((self._sequence,) + message)
+                while True:
+                    if not self.channel.poll(max(0.0, deadline - time.monotonic())):
+                        raise TimeoutError(f"shard {self.index} did not answer")
+                    sequence, reply = self.channel.recv()
+                    # Late replies to requests that timed out are skipped
+                    if sequence == self._sequence:
+                        return reply
+            except (BrokenPipeError, ConnectionResetError) as error:
+                raise EOFError(str(error)) from error
+
+    def __repr__(self):
+        names = ", ".join(_name(options) for options in self.accounts)
+        return f"Shard({self.index}, pid={self.process.pid}, [{names}])"
+
+
+class ShardPool:
+    """Run the accounts of a roster in a pool of worker processes.
+
+    Args:
+      roster (list): per-account options, see
+        :func:`~trashbags.fleet.load_roster`
+      target: run in each worker as ``target(index, accounts, channel)``;
+        it must be picklable and answer requests with :class:`ShardWorker`
+      processes (int): worker count, one per CPU if omitted, never more than
+        there are accounts
+      context: the :mod:`multiprocessing` context, ``spawn`` by default as
+        the parent already runs threads
+      timeout (float): seconds to wait for a worker's reply
+    """
+
+    def __init__(self, roster, target, processes=None, context=None, timeout=10.0):
+        self.roster = list(roster)
+        self.target = target
+        self.processes = max(1, min(processes or os.cpu_count() or 1, len(roster)))
+        self.context = context or multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self.shards = []
+        self.deaths = 0
+        self._next_index = 0
+        self._task = None
+        self._stopping = False
+
+    def start(self, scheduler=None, interval=1.0):
+        """Start the workers, and check on them every ``interval`` seconds."""
+        for accounts in assign(self.roster, self.processes):
+            self._spawn(accounts)
+        if scheduler is not None:
+            scheduler.start()
+            self._task = scheduler.call_every(interval, self.check)
+        return self
+
+    def _spawn(self, accounts):
+        index = self._next_index
+        self._next_index += 1
+        channel, child = self.context.Pipe()
+        process = self.context.Process(
+            target=self.target,
+            args=(index, accounts, child),
+            name=f"trashbags-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        # Only the worker keeps its end, so its death closes the pipe
+        child.close()
+        shard = Shard(index, process, channel, list(accounts))
+        self.shards.append(shard)
+        _logger.info("Started %r", shard)
+        return shard
+
+    def check(self):
+        """Hand the accounts of dead workers to the live ones."""
+        if self._stopping:
+            return
+        for shard in [shard for shard in self.shards if not shard.alive]:
+            self.deaths += 1
+            self.shards.remove(shard)
+            shard.channel.close()
+            _logger.warning(
+                "Shard %d exited with code %s", shard.index, shard.process.exitcode
+            )
+            self.rebalance(shard.accounts)
+
+    def rebalance(self, accounts):
+        """Start ``accounts`` on the live workers with the fewest bots."""
+        for position, options in enumerate(accounts):
+            while True:
+                live = [shard for shard in self.shards if shard.alive]
+                if not live:
+                    self._spawn(accounts[position:])
+                    return
+                shard = min(live, key=lambda shard: len(shard.accounts))
+                try:
+                    shard.request(("start", [options]), self.timeout)
+                except (EOFError, TimeoutError) as error:
+                    _logger.warning("Shard %d refused a bot: %s", shard.index, error)
+                    # Its own accounts are moved on the next check
+                    shard.process.kill()
+                    shard.process.join(self.timeout)
+                    continue
+                shard.accounts.append(options)
+                _logger.info("Moved %s to shard %d", _name(options), shard.index)
+                break
+
+    def broadcast(self, message):
+        """Send ``message`` to every live worker.
+
+        Returns:
+          list: (shard, reply) pairs, workers that failed to answer left out
+        """
+        replies = []
+        for shard in list(self.shards):
+            try:
+                replies.append((shard, shard.request(message, self.timeout)))
+            except (EOFError, TimeoutError) as error:
+                _logger.warning("Shard %d: %s", shard.index, error)
+        return replies
+
+    def dispatch(self, text, reply):
+        """Run a console command on every worker, prefixing its replies."""
+        for shard, lines in self.broadcast(("command", text)):
+            for line in lines or ():
+                reply(f"[{shard.index}] {line}")
+
+    def export(self):
+        """The metric families of every worker, labelled by ``worker``."""
+        families = []
+        for shard, exported in self.broadcast(("metrics",)):
+            label = (("worker", str(shard.index)),)
+            for name, kind, help, samples in exported:
+                samples = [(label + labels, value) for labels, value in samples]
+                families.append((name, kind, help, samples))
+        return families
+
+    def status(self):
+        return {
+            shard.index: [_name(options) for options in shard.accounts]
+            for shard in self.shards
+        }
+
+    def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+        self.broadcast(("stop",))
+        for shard in self.shards:
+            shard.process.join(self.timeout)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.channel.close()
+
+
+class ShardWorker:
+    """Answer the parent's requests in a worker process.
+
+    Args:
+      channel: the worker's end of the pipe
+      fleet (Fleet): the bots of this worker
+      commands (CommandRouter): runs the console commands
+      metrics (Metrics): exported when asked, ``None`` exports nothing
+    """
+
+    def __init__(self, channel, fleet, commands, metrics=None):
+        self.channel = channel
+        self.fleet = fleet
+        self.commands = commands
+        self.metrics = metrics
+
+    def serve(self):
+        """Answer requests until told to stop or the parent goes away."""
+        while True:
+            try:
+                message = self.channel.recv()
+            except (EOFError, OSError):
+                _logger.info("Parent process gone, stopping")
+                return
+            sequence, kind, args = message[0], message[1], message[2:]
+            if kind == "stop":
+                # The caller stops the fleet once this returns
+                self.channel.send((sequence, None))
+                return
+            reply = None
+            try:
+                reply = getattr(self, "_" + kind)(*args)
+            except Exception:
+                _logger.exception("Request %r failed", kind)
+            self.channel.send((sequence, reply))
+
+    def _command(self, text):
+        lines = []
+        self.commands.dispatch(
+            text, CommandContext(self.fleet.bots, CONSOLE, lines.append)
+        )
+        return lines
+
+    def _metrics(self):
+        return [] if self.metrics is None else self.metrics.export()
+
+    def _start(self, accounts):
+        for options in accounts:
+            self.fleet.add(options)
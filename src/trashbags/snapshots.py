@@ -0,0 +1,448 @@
+"""
+Bot state kept on disk between runs.
+
+A :class:`Snapshotter` saves what a bot learnt from the server, so a
+restarted bot starts from it instead of from nothing: its position and
+rotation, the tab list, the chunks of its world cache and the account it
+played as. A snapshot is a directory of two files:
+
+* ``state.json``: everything but the chunks, with the name of the chunk
+  log and the offset of each chunk's latest record in it
+* ``chunks.N.bin``: an append-only log of chunk records, each the palettes
+  and block indices of a chunk's sections as raw little-endian arrays
+
+Saves are incremental, only chunks whose ``version`` changed since they
+were last written are appended; once most of the log is superseded, the
+live records are copied to a log of the next generation ``N``, which
+``state.json`` names from then on. The old log is only removed after the
+new ``state.json`` replaced the old one, so a crash at any point leaves a
+state and a log that agree. Restoring maps the log copy-on-write and builds the
+sections as NumPy views of the mapping, so nothing is parsed or copied
+and restoring a full cache takes milliseconds.
+
+Restored data is reconciled as the server sends fresh state: the first
+position it sends replaces ours, chunks it sends replace restored ones,
+and restored players it does not list again within ``grace`` seconds of
+joining are dropped::
+
+    snapshots = Snapshotter("state/miner", bot)
+    snapshots.restore()
+    snapshots.start(scheduler)
+"""
+
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .world import SECTIONS, Chunk, ChunkSection
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+FORMAT = 2
+MAGIC = b"TBSNAP1\n"
+STATE = "state.json"
+CHUNKS = "chunks.{}.bin"
+_LOG = re.compile(r"^chunks\.\d+\.bin$")
+
+# Chunk x and z, mask of the sections present, reserved; every part of a
+# record is a multiple of 4 bytes long so the palettes stay aligned
+_RECORD = struct.Struct("<iiHH")
+# Palette length, bytes per block index
+_SECTION = struct.Struct("<HH")
+_SECTION_BLOCKS = 16 * 16 * 16
+
+
+def encode_chunk(chunk):
+    """One record of ``chunks.bin`` holding ``chunk``."""
+    mask = 0
+    parts = [b""]
+    for section_y, section in enumerate(chunk.sections):
+        if section is None:
+            continue
+        mask |= 1 << section_y
+        palette = section.palette.astype("<u4", copy=False)
+        blocks = section.blocks
+        blocks = blocks.astype(blocks.dtype.newbyteorder("<"), copy=False)
+        parts.append(_SECTION.pack(len(palette), blocks.itemsize))
+        parts.append(palette.tobytes())
+        parts.append(blocks.tobytes())
+    parts[0] = _RECORD.pack(chunk.x, chunk.z, mask, 0)
+    return b"".join(parts)
+
+
+def decode_chunk(buffer, offset=0):
+    """The chunk of the record at ``offset``, its arrays views of ``buffer``.
+
+    Returns:
+      tuple: the chunk and the record's length in bytes
+    """
+    chunk_x, chunk_z, mask, _ = _RECORD.unpack_from(buffer, offset)
+    position = offset + _RECORD.size
+    sections = {}
+    for section_y in range(SECTIONS):
+        if not mask & 1 << section_y:
+            continue
+        length, itemsize = _SECTION.unpack_from(buffer, position)
+        position += _SECTION.size
+        palette = np.frombuffer(buffer, "<u4", length, position)
+        position += palette.nbytes
+        dtype = "<u1" if itemsize == 1 else "<u2"
+        blocks = np.frombuffer(buffer, dtype, _SECTION_BLOCKS, position)
+        position += blocks.nbytes
+        sections[section_y] = ChunkSection(palette, blocks.reshape(16, 16, 16))
+    return Chunk(chunk_x, chunk_z, sections), position - offset
+
+
+def _copy(chunk):
+    """A copy of ``chunk`` the network thread cannot change while it is saved."""
+    copy = Chunk(chunk.x, chunk.z)
+    for section_y, section in enumerate(chunk.sections):
+        if section is not None:
+            copy.sections[section_y] = ChunkSection(
+                section.palette.copy(), section.blocks.copy()
+            )
+    return copy
+
+
+class Snapshotter:
+    """Save a bot's state every ``interval`` seconds and restore it.
+
+    Args:
+      path (str): directory of the snapshot, created on first save
+      bot (Trashbag): the bot, its ``world`` may be ``None``
+      interval (float): seconds between two saves
+      grace (float): seconds after joining for the server to list again
+        the players restored from the snapshot
+    """
+
+    def __init__(self, path, bot, interval=30.0, grace=5.0, clock=time.monotonic):
+        self.path = path
+        self.bot = bot
+        self.interval = interval
+        self.grace = grace
+        self.clock = clock
+        self.saves = 0
+        self.written = 0
+        self.restored = None
+        # Name and generation of the chunk log state.json refers to
+        self._log = None
+        self._generation = 0
+        # Chunk key to (chunk, version, offset, length) of its latest record
+        self._records = {}
+        self._restored_chunks = {}
+        self._stale_players = set()
+        self._resume_dimension = None
+        self._joined_at = None
+        self._lock = threading.Lock()
+        self._next_save = None
+        self._task = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.path, STATE)
+
+    @property
+    def chunks_path(self):
+        """The current chunk log, ``None`` before the first save or restore."""
+        return None if self._log is None else os.path.join(self.path, self._log)
+
+    def _server(self):
+        options = self.bot.options
+        return f"{options.address}:{options.port}"
+
+    # Restoring
+
+    def restore(self):
+        """Load the last snapshot into the bot.
+
+        Returns:
+          bool: whether there was a snapshot of this bot's server to load
+        """
+        began = time.perf_counter()
+        try:
+            with open(self.state_path, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return False
+        if state.get("format") != FORMAT or state.get("server") != self._server():
+            _logger.info("Ignoring the snapshot in %s, made elsewhere", self.path)
+            return False
+
+        bot = self.bot
+        try:
+            log = state["log"]
+            if not _LOG.match(log):
+                raise ValueError(f"invalid chunk log {log!r}")
+            position = tuple(map(float, state["position"]))
+            rotation = tuple(map(float, state["rotation"]))
+            players = [tuple(player) for player in state["players"]]
+            chunks = []
+            if bot.world is not None and state["chunks"]:
+                chunks = self._read_chunks(os.path.join(self.path, log), state)
+        except (KeyError, TypeError, ValueError, struct.error) as error:
+            # A bot that cannot restore starts from nothing rather than never
+            _logger.warning("Ignoring the snapshot in %s: %s", self.path, error)
+            return False
+
+        self._log = log
+        self._generation = state.get("generation", 0)
+        bot.position = position
+        bot.rotation = rotation
+        for uuid, name, gamemode, ping, display_name in players:
+            bot.players.add(uuid, name, gamemode, ping, display_name)
+            self._stale_players.add(uuid)
+        if chunks:
+            self._restore_chunks(state, chunks)
+        self.restored = state
+        self._resume_dimension = state["dimension"]
+        _logger.info(
+            "Restored %s: %d players, %d chunks in %.1f ms",
+            self.path,
+            len(state["players"]),
+            len(self._restored_chunks),
+            (time.perf_counter() - began) * 1e3,
+        )
+        return True
+
+    def _read_chunks(self, path, state):
+        """Decode the chunks ``state`` lists from the log at ``path``.
+
+        Raises:
+          ValueError: the log does not hold the records ``state`` lists
+        """
+        try:
+            with open(path, "rb") as chunks_file:
+                # Private pages: the world may change blocks in place
+                mapped = mmap.mmap(chunks_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except OSError as error:
+            raise ValueError(f"could not map {path}: {error}") from None
+        if mapped[: len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a chunk log")
+        chunks = []
+        for chunk_x, chunk_z, offset, length in state["chunks"]:
+            if offset < len(MAGIC) or offset + length > len(mapped):
+                raise ValueError(f"chunk {chunk_x}, {chunk_z} is past the log's end")
+            chunk, read = decode_chunk(mapped, offset)
+            if (chunk.x, chunk.z) != (chunk_x, chunk_z) or read != length:
+                raise ValueError(f"the log does not hold chunk {chunk_x}, {chunk_z}")
+            chunks.append((chunk, offset, length))
+        return chunks
+
+    def _restore_chunks(self, state, chunks):
+        world = self.bot.world
+        with world._lock:
+            world.has_sky = state["has_sky"]
+            world.dimension = state["dimension"]
+            for chunk, offset, length in chunks:
+                key = (chunk.x, chunk.z)
+                world.chunks[key] = chunk
+                world.nbytes += chunk.nbytes
+                self._records[key] = (chunk, chunk.version, offset, length)
+                self._restored_chunks[key] = chunk
+            if world.nbytes > world.max_bytes:
+                world._evict()
+
+    # Reconciling
+
+    def connected(self):
+        """The bot joined: restored players get ``grace`` seconds to show up."""
+        self._joined_at = self.clock()
+
+    def resumes(self, dimension):
+        """Whether a join in ``dimension`` resumes the restored world, once."""
+        resumed = self._resume_dimension == dimension
+        self._resume_dimension = None
+        return resumed
+
+    def seen(self, packet):
+        """Mark the players a ``PlayerListItemPacket`` adds as fresh."""
+        if packet.action_type.__name__ == "AddPlayerAction":
+            for action in packet.actions:
+                self._stale_players.discard(action.uuid)
+
+    def expire(self):
+        """Drop restored players the server did not list within ``grace``."""
+        joined_at = self._joined_at
+        if joined_at is None or self.clock() - joined_at < self.grace:
+            return 0
+        self._joined_at = None
+        stale, self._stale_players = self._stale_players, set()
+        for uuid in stale:
+            self.bot.players.remove(uuid)
+        return len(stale)
+
+    def stale(self):
+        """Restored players and chunks the server has not confirmed yet."""
+        world = self.bot.world
+        chunks = 0
+        if world is not None:
+            chunks = sum(
+                world.chunks.get(key) is chunk
+                for key, chunk in list(self._restored_chunks.items())
+            )
+        return {"players": len(self._stale_players), "chunks": chunks}
+
+    # Saving
+
+    def save(self):
+        """Write the bot's state, appending only the chunks that changed.
+
+        Returns:
+          int: bytes written
+        """
+        with self._lock:
+            return self._save()
+
+    def _save(self):
+        bot = self.bot
+        world = bot.world
+        changed = []
+        kept = {}
+        dimension = None
+        has_sky = True
+        if world is not None:
+            with world._lock:
+                dimension = getattr(world, "dimension", None)
+                has_sky = world.has_sky
+                for key, chunk in world.chunks.items():
+                    record = self._records.get(key)
+                    if record and record[0] is chunk and record[1] == chunk.version:
+                        kept[key] = record
+                    else:
+                        changed.append((key, chunk, chunk.version, _copy(chunk)))
+
+        os.makedirs(self.path, exist_ok=True)
+        live = sum(record[3] for record in kept.values())
+        log = self._log
+        try:
+            size = os.path.getsize(self.chunks_path) if log is not None else 0
+        except OSError:
+            size = 0
+        written = 0
+        generation = self._generation
+        if size == 0 or size - live > live + 2**20:
+            generation = self._next_generation()
+            log = CHUNKS.format(generation)
+            kept, written = self._compact(kept, os.path.join(self.path, log))
+
+        with open(os.path.join(self.path, log), "ab") as chunks_file:
+            if chunks_file.tell() == 0:
+                written += chunks_file.write(MAGIC)
+            for key, chunk, version, copy in changed:
+                offset = chunks_file.tell()
+                length = chunks_file.write(encode_chunk(copy))
+                kept[key] = (chunk, version, offset, length)
+                written += length
+            chunks_file.flush()
+            os.fsync(chunks_file.fileno())
+
+        auth = bot.auth_token
+        state = {
+            "format": FORMAT,
+            "saved_at": time.time(),
+            "server": self._server(),
+            "username": auth.username if auth is not None else bot.options.username,
+            "uuid": auth.profile.id_ if auth is not None else None,
+            "position": list(bot.position),
+            "rotation": list(bot.rotation),
+            "dimension": dimension,
+            "has_sky": has_sky,
+            "log": log,
+            "generation": generation,
+            "players": [
+                [entry.uuid, entry.name, entry.gamemode, entry.ping, entry.display_name]
+                for entry in list(bot.players)
+            ],
+            "chunks": [
+                [key[0], key[1], offset, length]
+                for key, (_, _, offset, length) in kept.items()
+            ],
+        }
+        temporary = self.state_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file, separators=(",", ":"))
+            written += state_file.tell()
+        os.replace(temporary, self.state_path)
+        self._records = kept
+        if log != self._log:
+            self._log = log
+            self._generation = generation
+            self._remove_logs(keep=log)
+        self.saves += 1
+        self.written += written
+        return written
+
+    def _compact(self, kept, path):
+        """Copy the latest records of ``kept`` chunks to a new log at ``path``."""
+        compacted = {}
+        with open(path, "wb") as new:
+            new.write(MAGIC)
+            if kept:
+                with open(self.chunks_path, "rb") as old:
+                    for key, (chunk, version, offset, length) in kept.items():
+                        old.seek(offset)
+                        compacted[key] = (chunk, version, new.tell(), length)
+                        new.write(old.read(length))
+            written = new.tell()
+        return compacted, written
+
+    def _next_generation(self):
+        """A generation whose log is not on disk, it may be another state's."""
+        taken = set(os.listdir(self.path))
+        generation = self._generation + 1
+        while CHUNKS.format(generation) in taken:
+            generation += 1
+        return generation
+
+    def _remove_logs(self, keep):
+        for name in os.listdir(self.path):
+            if _LOG.match(name) and name != keep:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError as error:
+                    _logger.warning("Could not remove %s: %s", name, error)
+
+    # Background saves
+
+    def start(self, scheduler):
+        """Expire players and save every ``interval`` on the shared scheduler."""
+        if self._task is None:
+            scheduler.start()
+            self._next_save = self.clock() + self.interval
+            self._task = scheduler.call_every(min(1.0, self.interval), self.check)
+        return self
+
+    def check(self):
+        """Drop stale players, and save when ``interval`` has gone by."""
+        self.expire()
+        if self.clock() < self._next_save:
+            return
+        self._next_save = self.clock() + self.interval
+        try:
+            self.save()
+        except Exception:
+            _logger.exception("Saving %s failed", self.path)
+
+    def close(self):
+        """Stop saving in the background and save one last time."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            self.save()
+        except Exception:
+            _logger.exception("Saving %s failed", self.path)
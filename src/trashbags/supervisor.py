@@ -0,0 +1,215 @@
+"""
+Keep a bot connected.
+
+:class:`ConnectionSupervisor` watches a bot's connection for kicks and
+socket errors and reconnects it with jittered exponential backoff, reusing
+the bot's cached session token and registering its packet listeners on the
+new connection.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """Exponential backoff with jitter.
+
+    The n-th retry waits ``min(cap, base * factor ** n)`` seconds, less a
+    random share of up to ``jitter`` of it so bots kicked together do not
+    all come back at the same instant.
+    """
+
+    def __init__(self, base=1.0, factor=2.0, cap=120.0, jitter=0.5, rng=None):
+        self.base = base
+        self.factor = factor
+        self.cap = cap
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt):
+        delay = min(self.cap, self.base * self.factor**attempt)
+        return delay * (1 - self.jitter * self.rng.random())
+
+
+class SupervisorStats:
+    """Counters kept by a :class:`ConnectionSupervisor`."""
+
+    __slots__ = ("disconnects", "attempts", "failures", "reconnects", "latencies")
+
+    def __init__(self, history=100):
+        self.disconnects = 0
+        self.attempts = 0
+        self.failures = 0
+        self.reconnects = 0
+        # Seconds from losing the connection to joining the game again
+        self.latencies = deque(maxlen=history)
+
+    def as_dict(self):
+        latencies = self.latencies
+        return {
+            "disconnects": self.disconnects,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "reconnects": self.reconnects,
+            "last_latency": latencies[-1] if latencies else None,
+            "mean_latency": sum(latencies) / len(latencies) if latencies else None,
+        }
+
+
+def _pycraft_packets():
+    from minecraft.networking.packets import clientbound
+
+    return (
+        (clientbound.login.DisconnectPacket, clientbound.play.DisconnectPacket),
+        clientbound.play.JoinGamePacket,
+    )
+
+
+class ConnectionSupervisor:
+    """Reconnect a bot whenever its connection is lost.
+
+    Args:
+      bot (Trashbag): the bot to keep connected
+      scheduler (Scheduler): schedules the reconnect attempts
+      backoff (Backoff): delay policy between attempts
+      max_attempts (int): give up after this many failed attempts in a row,
+        ``None`` retries forever
+      on_connect (list): callables run with the bot after each (re)connect,
+        once its own listeners are registered
+    """
+
+    def __init__(
+        self,
+        bot,
+        scheduler,
+        backoff=None,
+        max_attempts=None,
+        on_connect=None,
+        disconnect_packets=None,
+        join_packet=None,
+    ):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.backoff = backoff or Backoff()
+        self.max_attempts = max_attempts
+        self.on_connect = list(on_connect or ())
+        self.stats = SupervisorStats()
+        if disconnect_packets is None or join_packet is None:
+            disconnect_packets, join_packet = _pycraft_packets()
+        self.disconnect_packets = disconnect_packets
+        self.join_packet = join_packet
+        self._lock = threading.Lock()
+        self._attempt = 0
+        self._lost_at = None
+        self._pending = None
+        self._reported = None
+        self._stopped = False
+
+    def start(self):
+        """Connect now; on failure keep retrying in the background.
+
+        Returns:
+          bool: whether the first attempt connected
+        """
+        self.scheduler.start()
+        self._stopped = False
+        return self._connect()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._pending is not None:
+                self._pending.cancel()
+                self._pending = None
+        if self.bot.connection is not None:
+            self.bot.connection.disconnect(immediate=True)
+
+    def _connect(self):
+        with self._lock:
+            self._pending = None
+            if self._stopped:
+                return False
+        self.stats.attempts += 1
+        bot = self.bot
+        try:
+            # With a token manager this only reads the cached token
+            if bot.auth_token is None or bot.tokens is not None:
+                bot.login()
+            if bot.connection is not None:
+                bot.connection.disconnect(immediate=True)
+            bot.connect()
+            bot.register_packet_listeners()
+            self._watch(bot.connection)
+            for callback in self.on_connect:
+                callback(bot)
+        except Exception as error:
+            self.stats.failures += 1
+            _logger.warning("Connecting %s failed: %r", self._name(), error)
+            self._lost(None)
+            return False
+        return True
+
+    def _watch(self, connection):
+        connection.register_packet_listener(
+            lambda packet: self._lost(connection, packet), *self.disconnect_packets
+        )
+        connection.register_packet_listener(self._joined, self.join_packet)
+        connection.register_exception_handler(
+            lambda exc, exc_info: self._lost(connection, exc)
+        )
+
+    def _joined(self, packet):
+        with self._lock:
+            lost_at, self._lost_at = self._lost_at, None
+            self._attempt = 0
+        if lost_at is not None:
+            self.stats.reconnects += 1
+            self.stats.latencies.append(time.monotonic() - lost_at)
+
+    def _lost(self, connection, reason=None):
+        with self._lock:
+            if self._stopped or self._pending is not None:
+                return
+            if connection is not None:
+                # Kicks are often followed by a socket error on the same
+                # connection, only the first report for the current one counts.
+                if (
+                    connection is self._reported
+                    or connection is not self.bot.connection
+                ):
+                    return
+                self._reported = connection
+            # Stops its physics and hands event recording to another bot
+            self.bot.spawned = False
+            if self._lost_at is None:
+                self._lost_at = time.monotonic()
+                self.stats.disconnects += 1
+            attempt = self._attempt
+            if self.max_attempts is not None and attempt >= self.max_attempts:
+                _logger.error(
+                    "Giving up on %s after %d attempts", self._name(), attempt
+                )
+                return
+            self._attempt += 1
+            delay = self.backoff.delay(attempt)
+            self._pending = self.scheduler.call_later(delay, self._connect)
+        if reason is not None:
+            _logger.info(
+                "%s disconnected (%s), reconnecting in %.1fs",
+                self._name(),
+                reason,
+                delay,
+            )
+
+    def _name(self):
+        options = self.bot.options
+        return getattr(options, "name", None) or getattr(options, "username", "bot")
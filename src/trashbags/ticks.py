@@ -0,0 +1,250 @@
+"""
+Game ticks on the client side.
+
+A :class:`TickLoop` runs every per-tick job of a process (movement, the
+chat outbox, entity moves, path checks) at the server's 20 Hz, one after
+the other on a scheduler thread of its own: the shared scheduler also runs
+logins and connects, which block for seconds. Ticks are numbered from the
+wall clock, so a late tick neither shifts the ones after it nor runs
+twice; skipped ticks are counted. When the jobs of a tick have used up
+``budget``, deferrable ones wait for the next tick and then run once for
+all the ticks they missed, which is why they must not assume one call per
+tick (an entity flush applies every queued move, a path check looks at
+the current state)::
+
+    ticks = TickLoop().start()
+    ticks.call_every(TICK, movement.flush)
+    ticks.call_every(0.25, navigator.check)  # deferrable
+
+A :class:`LagMonitor` follows how the server keeps up: its tick rate from
+the world age in time updates, the round trip it measures from our
+keep-alive answers and how late its keep-alives reach us.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from .metrics import Histogram
+from .movement import TICK
+from .scheduler import Scheduler
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+_logger = logging.getLogger(__name__)
+
+TICKS_PER_SECOND = round(1 / TICK)
+
+
+class TickTask:
+    """A job of a :class:`TickLoop`, as returned by :meth:`TickLoop.call_every`."""
+
+    __slots__ = ("func", "args", "every", "deferrable", "due", "cancelled")
+
+    def __init__(self, func, args, every, deferrable, due):
+        self.func = func
+        self.args = args
+        self.every = every
+        self.deferrable = deferrable
+        self.due = due
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TickStats:
+    """Counters kept by a :class:`TickLoop`."""
+
+    __slots__ = ("ticks", "skipped", "overruns", "deferred", "durations")
+
+    def __init__(self):
+        self.ticks = 0
+        # Ticks the loop was too late to run at all
+        self.skipped = 0
+        # Ticks whose jobs took longer than a tick
+        self.overruns = 0
+        # Deferrable jobs put off to a later tick
+        self.deferred = 0
+        self.durations = Histogram()
+
+    def as_dict(self):
+        return {
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "overruns": self.overruns,
+            "deferred": self.deferred,
+            "duration": self.durations.as_dict(),
+        }
+
+
+class TickLoop:
+    """Run jobs every game tick, or every few ticks, on a scheduler.
+
+    It offers the ``start`` and ``call_every`` methods of a
+    :class:`~trashbags.scheduler.Scheduler`, so a tick job's owner does not
+    need to know which of the two it runs on.
+
+    Args:
+      scheduler (Scheduler): its thread runs the ticks, by default one the
+        loop creates and runs nothing else on
+      budget (float): seconds of work per tick before deferrable jobs wait
+      clock: monotonic clock, in seconds
+    """
+
+    def __init__(self, scheduler=None, budget=TICK * 0.8, clock=time.perf_counter):
+        self._owns_scheduler = scheduler is None
+        if scheduler is None:
+            scheduler = Scheduler(name="trashbags-ticks")
+        self.scheduler = scheduler
+        self.budget = budget
+        self.clock = clock
+        self.stats = TickStats()
+        self.number = -1
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._origin = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.scheduler.start()
+            self._origin = self.clock()
+            self._task = self.scheduler.call_every(TICK, self.tick, delay=0)
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._owns_scheduler:
+            self.scheduler.stop()
+
+    def call_every(self, interval, func, *args, deferrable=None):
+        """Run ``func(*args)`` every ``interval`` seconds, rounded to ticks.
+
+        Args:
+          deferrable (bool): whether the job may wait for a later tick when
+            the loop is over budget; by default only jobs running less often
+            than every tick may
+
+        Returns:
+          TickTask: cancel it to stop the job
+        """
+        every = max(1, round(interval / TICK))
+        if deferrable is None:
+            deferrable = every > 1
+        task = TickTask(func, args, every, deferrable, self.number + 1)
+        with self._lock:
+            # Copied on write, the loop iterates without the lock; jobs that
+            # cannot wait run first
+            tasks = self._tasks + [task]
+            tasks.sort(key=lambda task: task.deferrable)
+            self._tasks = tasks
+        return task
+
+    def tick(self):
+        """Run the jobs due this tick; called by the scheduler."""
+        clock = self.clock
+        began = clock()
+        stats = self.stats
+        number = int((began - self._origin) / TICK + 0.5)
+        if number <= self.number:
+            number = self.number + 1
+        stats.skipped += number - self.number - 1
+        self.number = number
+        stats.ticks += 1
+
+        cancelled = False
+        for task in self._tasks:
+            if task.cancelled:
+                cancelled = True
+                continue
+            if task.due > number:
+                continue
+            if task.deferrable and clock() - began > self.budget:
+                stats.deferred += 1
+                continue
+            # Missed runs are merged into this one
+            task.due = number + task.every
+            try:
+                task.func(*task.args)
+            except Exception:
+                _logger.exception("Tick job %r failed", task.func)
+
+        if cancelled:
+            with self._lock:
+                self._tasks = [task for task in self._tasks if not task.cancelled]
+        duration = clock() - began
+        stats.durations.observe(duration)
+        if duration > TICK:
+            stats.overruns += 1
+
+
+class LagMonitor:
+    """How well the server keeps up, from the packets it sends every bot.
+
+    Attributes:
+      tps (float): server ticks per second, smoothed, ``None`` until two
+        time updates came in
+      rtt (float): round trip in seconds the server measured from our
+        keep-alive answers and reported in the tab list
+      keep_alive_delay (float): how much later than the earliest one
+        recently the last keep-alive reached us, in seconds
+    """
+
+    def __init__(self, smoothing=0.3, window=20, clock=time.monotonic):
+        self.smoothing = smoothing
+        self.clock = clock
+        self.tps = None
+        self.rtt = None
+        self.keep_alive_delay = None
+        self._last_update = None
+        self._offsets = deque(maxlen=window)
+
+    def time_update(self, world_age):
+        """Account for a time update packet's ``world_age``, in ticks."""
+        now = self.clock()
+        last = self._last_update
+        self._last_update = (now, world_age)
+        if last is None or now <= last[0] or world_age < last[1]:
+            return
+        tps = (world_age - last[1]) / (now - last[0])
+        if self.tps is None:
+            self.tps = tps
+        else:
+            self.tps += self.smoothing * (tps - self.tps)
+
+    def keep_alive(self, keep_alive_id):
+        """Account for a keep-alive.
+
+        The vanilla server uses its own millisecond clock as the keep-alive
+        id, so the gap between that clock and ours only grows when a
+        keep-alive is held up on the way or in the server.
+        """
+        offset = self.clock() * 1000 - keep_alive_id
+        self._offsets.append(offset)
+        self.keep_alive_delay = (offset - min(self._offsets)) / 1000
+
+    def latency(self, ping):
+        """Account for the ping, in ms, the tab list shows for the bot."""
+        if ping is not None:
+            self.rtt = ping / 1000
+
+    def reset(self):
+        """Forget the previous connection."""
+        self.tps = None
+        self.rtt = None
+        self.keep_alive_delay = None
+        self._last_update = None
+        self._offsets.clear()
+
+    def as_dict(self):
+        return {
+            "tps": self.tps,
+            "rtt": self.rtt,
+            "keep_alive_delay": self.keep_alive_delay,
+        }
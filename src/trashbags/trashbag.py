@@ -1,89 +1,289 @@
 #!/usr/bin/env python
 
-import json
+import os
 import sys
+from functools import lru_cache, partial
 
-from minecraft import authentication
-from minecraft.exceptions import YggdrasilError
-from minecraft.networking.connection import Connection
-from minecraft.networking.packets import Packet, clientbound, serverbound
+from .acl import NOBODY, AccessList
+from .auth import DEFAULT_ACCOUNT, microsoft_token, to_pycraft
+from .capture import PacketCapture
+from .chat import WHISPER, ChatMessage, decode_chat
+from .commands import CommandContext
+from .decoding import DecodingPolicy
+from .events import JOIN, LEAVE
+from .movement import TICK, CorrectionCounter, MovementQueue
+from .outbox import HIGH, NORMAL, Outbox
+from .players import PlayerRegistry
+from .protocol import VERSION, registry
+from .ticks import LagMonitor, TickLoop
 
 # from minecraft.operation.move import player_move
 
 
+# pyCraft's networking layer and NumPy are only imported once a bot needs
+# them, importing this module stays cheap
+@lru_cache(maxsize=None)
+def _world_updates():
+    from . import packets
+    from .world import WorldCache
+
+    return {
+        packets.ChunkDataPacket: WorldCache.load,
+        packets.UnloadChunkPacket: WorldCache.apply_unload,
+        packets.BlockChangePacket: WorldCache.apply_block_change,
+        packets.MultiBlockChangePacket: WorldCache.apply_multi_block_change,
+    }
+
+
+@lru_cache(maxsize=None)
+def _entity_updates():
+    from . import packets
+    from .entities import EntityTracker
+
+    return {
+        packets.SpawnObjectPacket: EntityTracker.apply_spawn_object,
+        packets.SpawnExperienceOrbPacket: EntityTracker.apply_spawn_orb,
+        packets.SpawnMobPacket: EntityTracker.apply_spawn_mob,
+        packets.SpawnPlayerPacket: EntityTracker.apply_spawn_player,
+        packets.EntityRelativeMovePacket: EntityTracker.apply_relative_move,
+        packets.EntityLookAndRelativeMovePacket: EntityTracker.apply_relative_move,
+        packets.DestroyEntitiesPacket: EntityTracker.apply_destroy,
+        packets.EntityTeleportPacket: EntityTracker.apply_teleport,
+    }
+
+
 class Trashbag:
-    def __init__(self, options: object, connection=None):
+    def __init__(
+        self,
+        options: object,
+        connection=None,
+        tokens=None,
+        scheduler=None,
+        runtime=None,
+        commands=None,
+        acl=None,
+        metrics=None,
+        profiler=None,
+        ticks=None,
+        events=None,
+    ):
         self.options = options
         self.connection = connection
+        self.tokens = tokens
+        self.runtime = runtime
+        self.commands = commands
+        self.metrics = metrics
+        self.profiler = profiler
+        self.events = events
+        if acl is None and options is not None:
+            acl = AccessList(uuids=getattr(options, "auth_list", None) or ())
+        self.acl = acl
         self.auth_token = None
         self.position = (0, 0, 0)
         self.rotation = (0, 0)
-        self.user_list = {}
+        # Whether the server placed the bot since it connected
+        self.spawned = False
+        self.players = PlayerRegistry()
+        self.lag = LagMonitor()
+        self.corrections = CorrectionCounter()
+        self.physics = None
+        self.ticks = None
+        self.movement = None
+        self.outbox = None
+        self.capture = None
+        self.world = None
+        self.entities = None
+        self.navigator = None
+        if options is not None and options.world_memory:
+            try:
+                from .world import WorldCache
+
+                self.world = WorldCache(
+                    options.world_memory * 2**20, center=lambda: self.position
+                )
+            except ImportError:
+                # Without NumPy the bot simply does not track the world
+                pass
+            try:
+                from .entities import EntityTracker
+
+                self.entities = EntityTracker()
+            except ImportError:
+                pass
+        if scheduler is not None:
+            # Bots of one process normally share a tick loop
+            self.ticks = ticks = ticks or TickLoop().start()
+            self.movement = MovementQueue(self, ticks)
+            self.outbox = Outbox(self, ticks).start()
+            if self.entities is not None:
+                # Relative moves are applied in one batch, a late flush
+                # applies those of the ticks it missed
+                ticks.call_every(TICK, self.entities.flush, deferrable=True)
+            if self.world is not None:
+                from .pathfinding import Navigator, Pathfinder
+                from .physics import engine_for
+
+                pathfinder = Pathfinder(self.world)
+                # Replans run on the runtime's workers, not in a tick
+                self.navigator = Navigator(
+                    self, pathfinder, ticks, executor=self.runtime
+                )
+                # Steps the bots of the tick loop together, movement included
+                self.physics = engine_for(ticks)
+                self.physics.add(self, pathfinder.walkability)
+            if self.physics is None:
+                self.movement.start()
+        self.snapshots = None
+        if options is not None and options.snapshots:
+            from .snapshots import Snapshotter
+
+            # Keyed as the token cache is, the account name is only known
+            # once logged in
+            name = (options.username or DEFAULT_ACCOUNT).replace(os.sep, "_")
+            self.snapshots = Snapshotter(os.path.join(options.snapshots, name), self)
+            self.snapshots.restore()
+            if scheduler is not None:
+                self.snapshots.start(scheduler)
+
+    def close(self):
+        """Finish what the bot writes in the background, on shutdown."""
+        if self.capture is not None:
+            self.capture.close()
+        if self.snapshots is not None:
+            # One last save, the next run starts from where the bot stopped
+            self.snapshots.close()
 
     def login(self):
-        try:
-            self.auth_token = authentication.Microsoft_AuthenticationToken()
-            if self.options.username:
-                if not self.auth_token.PersistenceLogoin_r(self.options.username):
-                    print("Login to {} failed".format(self.options.username))
-                    sys.exit(1)
-            else:
-                if not self.auth_token.authenticate():
-                    sys.exit(2)
-        except YggdrasilError as e:
-            print(e)
-            sys.exit()
+        if self.options.offline:
+            # Offline-mode servers only need a username
+            print(f"Playing offline as {self.options.username}...")
+            return
+        # Raises LoginError, with a token manager only when nothing is cached
+        if self.tokens is not None:
+            account = self.options.username or DEFAULT_ACCOUNT
+            self.auth_token = to_pycraft(self.tokens.token_for(account))
+        else:
+            self.auth_token = microsoft_token(self.options.username)
         print(f"Logged in as {self.auth_token.username}...")
 
     def connect(self):
-        try:
-            self.connection = Connection(
-                self.options.address, self.options.port, self.auth_token, None, "1.12.2"
-            )
-            self.connection.connect()
+        # Errors propagate so a ConnectionSupervisor can retry
+        from .connection import TrashbagConnection
 
-        except Exception as error:
-            print(f"Unable to connect, error: {error}")
-            sys.exit(1)
+        username = self.options.username if self.auth_token is None else None
+        self.connection = TrashbagConnection(
+            self.options.address, self.options.port, self.auth_token, username, VERSION
+        )
+        self.connection.connect()
 
     def print_postion(self, postion_packet):
         print(f"PositionPacket ({postion_packet}): {postion_packet}")
-        self.position = (postion_packet.x, postion_packet.y, postion_packet.z)
-        self.rotation = (postion_packet.yaw, postion_packet.pitch)
+        position = (postion_packet.x, postion_packet.y, postion_packet.z)
+        rotation = (postion_packet.yaw, postion_packet.pitch)
+        if self.movement is not None:
+            # Drops the moves the tick thread is computing from the old place
+            self.movement.placed(position, rotation)
+        else:
+            self.position = position
+            self.rotation = rotation
         print(self.rotation)
+        self.corrections.record()
+        if self.physics is not None:
+            self.physics.reset(self)
+        self.spawned = True
+
+    def listen(
+        self, handler, *packet_types, blocking=False, hot=False, sheddable=False
+    ):
+        name = handler.__name__
+        if self.profiler is not None:
+            handler = self.profiler.wrap(handler, name)
+        # Hot listeners run for most packets, only a sample of them is timed
+        if self.metrics is not None:
+            every = self.metrics.sample if hot else 1
+            handler = self.metrics.timed(handler, name, every)
+        # With a runtime, pyCraft's thread only queues the call and goes back
+        # to reading, so keep-alives are answered whatever the handler does
+        if self.runtime is not None:
+            handler = self.runtime.listener(
+                handler, blocking=blocking, sheddable=sheddable
+            )
+        self.connection.register_packet_listener(handler, *packet_types)
 
     def register_packet_listeners(self):
+        from .packets import ENTITY_PACKETS, WORLD_PACKETS, install
+
+        protocol = registry()
+        clientbound = protocol.clientbound
+        if self.metrics is not None:
+            self.metrics.attach(self.connection, self.options.username)
+        if self.profiler is not None:
+            self.profiler.wrap_writes(self.connection)
+
         # Joining the game
-        self.connection.register_packet_listener(
-            self.print_packet, clientbound.play.JoinGamePacket
-        )
+        self.listen(self.print_packet, clientbound.JoinGamePacket, sheddable=True)
 
-        self.connection.register_packet_listener(
-            self.chat_handler, clientbound.play.ChatMessagePacket
-        )
+        # Whispered commands may wait on the network, keep them off the loop
+        self.listen(self.chat_handler, clientbound.ChatMessagePacket, blocking=True)
 
-        self.connection.register_packet_listener(
-            self.print_postion, clientbound.play.PlayerPositionAndLookPacket
-        )
+        self.listen(self.print_postion, clientbound.PlayerPositionAndLookPacket)
+
+        self.listen(self.user_handler, clientbound.PlayerListItemPacket)
 
+        # Timed on pyCraft's thread, as the packets arrive
+        self.spawned = False
+        self.lag.reset()
+        self.corrections.connected()
+        if self.snapshots is not None:
+            self.snapshots.connected()
         self.connection.register_packet_listener(
-            self.user_handler, clientbound.play.PlayerListItemPacket
+            self.lag_handler,
+            clientbound.KeepAlivePacket,
+            clientbound.TimeUpdatePacket,
+            early=True,
         )
 
+        # Chunks, block changes and entities, read raw and decoded by the bot
+        if self.world is not None:
+            packets = WORLD_PACKETS
+            if self.entities is not None:
+                packets += ENTITY_PACKETS
+                self.listen(self.entity_handler, *ENTITY_PACKETS, hot=True)
+            self.connection.add_reactor_hook(partial(install, packets=packets))
+            self.listen(self.world_handler, *WORLD_PACKETS, hot=True)
+            self.listen(
+                self.dimension_handler,
+                clientbound.JoinGamePacket,
+                clientbound.RespawnPacket,
+            )
+
+        # Record packets to a capture file, off the network thread
+        if self.options.capture:
+            if self.capture is None:
+                path = self.options.capture.format(name=self.options.username)
+                self.capture = PacketCapture(path, compress=self.options.capture_gzip)
+            self.capture.attach(self.connection)
+
         # Enable debug listeners
         if self.options.dump_packets:
             self.connection.register_packet_listener(
-                self.print_debug_incoming, Packet, early=True
+                self.print_debug_incoming, protocol.Packet, early=True
             )
             self.connection.register_packet_listener(
-                self.print_debug_outgoing, Packet, outgoing=True
+                self.print_debug_outgoing, protocol.Packet, outgoing=True
             )
 
+        # Once every listener is known, packets none of them names are only
+        # decoded if something reads their fields
+        if not self.options.decode_all:
+            policy = DecodingPolicy(self.connection)
+            self.connection.add_reactor_hook(policy.install)
+
     def print_packet(self, packet):
         print(f"{type(packet)}: {packet}")
 
     def print_debug_incoming(self, packet):
-        if type(packet) is Packet:
+        if type(packet) is registry().Packet:
             # This is a direct instance of the base Packet type, meaning
             # that it is a packet of unknown type, so we do not print it
             # unless explicitly requested by the user.
@@ -95,49 +295,136 @@ class Trashbag:
     def print_debug_outgoing(self, packet):
         print("<-- %s" % packet, file=sys.stderr)
 
-    def get_msg_sender(self, packet):
-        json_data = json.loads(packet.json_data)
-        if "extra" in json_data:
-            for reponse_iter in json_data["extra"]:
-                if reponse_iter["color"] == "light_purple":
-                    return reponse_iter["text"]
-
-    def is_whisper(self, packet) -> bool:
-        json_data = json.loads(packet.json_data)
-        if "color" in json_data:
-            return True
-        else:
-            return False
+    def get_msg_sender(self, message: ChatMessage):
+        return message.sender
+
+    def is_whisper(self, message: ChatMessage) -> bool:
+        return message.kind == WHISPER
 
     def is_authorized(self, sender):
-        if sender in self.options.auth_list:
-            return True
-        else:
-            return False
+        return self.acl.is_authorized(sender)
+
+    def records_events(self):
+        """Whether this bot is the one recording the events of its server."""
+        return self.events is not None and self.events.records(self.server_key(), self)
+
+    def server_key(self):
+        return f"{self.options.address}:{self.options.port}"
 
     def user_handler(self, packet):
-        if packet.action_type.__name__ == "AddPlayerAction":
-            self.user_list[packet.actions[0].name] = packet.actions[0].uuid
-        if packet.action_type.__name__ == "RemovePlayerAction":
-            self.user_list = {
-                k: v for k, v in self.user_list.items() if v != packet.actions[0].uuid
-            }
+        # Servers list everyone already online before the bot spawns, they
+        # did not just join
+        if self.records_events():
+            self.record_presence(packet)
+        self.players.apply(packet)
+        if self.snapshots is not None:
+            self.snapshots.seen(packet)
+        name = self.options.username
+        if self.auth_token is not None:
+            name = self.auth_token.username
+        entry = self.players.by_name(name)
+        if entry is not None:
+            self.lag.latency(entry.ping)
+
+    def record_presence(self, packet):
+        """Log the players a tab list update adds or removes, by name."""
+        action = packet.action_type.__name__
+        if action == "AddPlayerAction":
+            kind = JOIN
+        elif action == "RemovePlayerAction":
+            kind = LEAVE
+        else:
+            return
+        players = self.players
+        bot = self.options.username or DEFAULT_ACCOUNT
+        server = self.server_key()
+        for entry in packet.actions:
+            known = entry.uuid in players
+            # Players restored from a snapshot, or listed twice, did not
+            # just join; players we never listed did not just leave
+            if (kind == JOIN) == known:
+                continue
+            name = entry.name if kind == JOIN else players.name_of(entry.uuid)
+            self.events.record(kind, bot, name or "", name, entry.uuid, server=server)
+
+    def lag_handler(self, packet):
+        if hasattr(packet, "keep_alive_id"):
+            self.lag.keep_alive(packet.keep_alive_id)
+        else:
+            self.lag.time_update(packet.world_age)
+
+    def world_handler(self, packet):
+        _world_updates()[type(packet)](self.world, packet.data)
+
+    def entity_handler(self, packet):
+        _entity_updates()[type(packet)](self.entities, packet.data)
+
+    def dimension_handler(self, packet):
+        # The first join after a restore keeps the chunks of the snapshot
+        resumes = self.snapshots is not None and self.snapshots.resumes(
+            packet.dimension
+        )
+        self.world.set_dimension(packet.dimension, keep=resumes)
+        if self.entities is not None:
+            self.entities.clear()
+
+    def nearby(self, radius, kind=None):
+        """Ids and distances of the entities within ``radius`` blocks."""
+        return self.entities.within(self.position, radius, kind)
 
     def chat_handler(self, packet):
-        if self.is_whisper(packet):
-            sender_name = self.get_msg_sender(packet)
-            sender_uuid = self.user_list[sender_name]
-            if not self.is_authorized(sender_uuid):
+        message = decode_chat(packet.json_data)
+        if self.records_events():
+            sender = message.sender
+            self.events.record(
+                message.kind,
+                self.options.username or DEFAULT_ACCOUNT,
+                message.text,
+                sender,
+                self.players.uuid_of(sender) if sender else None,
+                server=self.server_key(),
+            )
+        if self.is_whisper(message):
+            sender_name = self.get_msg_sender(message)
+            # Unknown and refused senders are NOBODY, remembered for a while
+            tier = self.acl.sender_tier(sender_name, self.players.uuid_of)
+            if tier == NOBODY:
                 return
             print(f"Received authorized whisper from {sender_name}")
+            if self.commands is not None:
+                reply = partial(self.whisper, sender_name)
+                context = CommandContext([self], sender_name, reply, tier)
+                self.commands.dispatch(message.body, context)
 
-    def send_chat(self: object, text: str):
-        packet = serverbound.play.ChatPacket()
+    def send_chat(self: object, text: str, priority=NORMAL):
+        if self.outbox is None:
+            self.write_chat(text)
+        else:
+            self.outbox.send(text, priority)
+
+    def whisper(self, name: str, text: str, priority=HIGH):
+        self.send_chat(f"/msg {name} {text}", priority)
+
+    def write_chat(self, text: str):
+        packet = registry().serverbound.ChatPacket()
         packet.message = text
         self.connection.write_packet(packet)
 
+    def walk_to(self, destination, rotation=None):
+        self.movement.move_to(destination, rotation)
+
+    def walk_path(self, waypoints, rotation=None):
+        self.movement.follow(waypoints, rotation)
+
+    def navigate(self, destination):
+        # Straight line when the world is not tracked
+        if self.navigator is None:
+            self.walk_to(destination)
+            return None
+        return self.navigator.go(destination)
+
     def player_move(self, destination, rotation, on_ground=True):
-        pos_packet = serverbound.play.PositionAndLookPacket()
+        pos_packet = registry().serverbound.PositionAndLookPacket()
         pos_packet.x = float(destination[0])
         pos_packet.feet_y = float(destination[1])
         pos_packet.z = float(destination[2])
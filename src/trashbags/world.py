@@ -0,0 +1,501 @@
+"""
+Loaded chunks of the world around the bot.
+
+``ChunkDataPacket`` payloads (1.12.2 format) are decoded with NumPy into
+:class:`ChunkSection` objects that keep a palette of block states and one
+small index per block, so a typical section costs 4 KiB instead of the
+8 KiB of raw state ids. :class:`WorldCache` holds the chunks, applies block
+changes and answers vectorized queries::
+
+    world.column_heights(chunk_x, chunk_z)   # 16x16 highest non-air y
+    world.find_blocks((56,), (x, y, z), 32)  # diamond ore within 32 blocks
+
+When over its memory cap it drops the chunks farthest from the bot first.
+Block states are pre-flattening ids, ``block_id << 4 | metadata``.
+"""
+
+import itertools
+import struct
+import threading
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .capture import decode_varint, encode_varint
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+AIR = 0
+SECTIONS = 16
+SECTION_VOLUME = 16 * 16 * 16
+LIGHT_BYTES = SECTION_VOLUME // 2
+BIOME_BYTES = 16 * 16
+
+# Above this, sections use the global palette: entries are states
+MAX_LOCAL_BITS = 8
+GLOBAL_BITS = 13
+
+# Python object overhead of a chunk and of a section, for the memory cap
+_CHUNK_OVERHEAD = 200
+_SECTION_OVERHEAD = 300
+
+_CHUNK_HEADER = struct.Struct(">ii?")
+_CHUNK_POSITION = struct.Struct(">ii")
+_POSITION = struct.Struct(">q")
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("the world cache needs NumPy: pip install trashbags[numpy]")
+
+
+@lru_cache(maxsize=64)
+def _layout(bits, count):
+    starts = np.arange(count, dtype=np.uint64) * np.uint64(bits)
+    offsets = starts & np.uint64(63)
+    return (starts >> np.uint64(6)).astype(np.intp), offsets, np.uint64(63) - offsets
+
+
+def unpack_entries(longs, bits, count=SECTION_VOLUME):
+    """Unpack ``count`` values of ``bits`` bits from big-endian longs.
+
+    1.12 packs values back to back from the low bit of the first long, a
+    value may straddle two longs.
+    """
+    index, low_shift, high_shift = _layout(bits, count)
+    raw = np.zeros(len(longs) + 1, dtype=np.uint64)
+    raw[:-1] = longs
+    # Shifting by 64 is undefined, take the high part in two shifts
+    high = (raw[index + 1] << np.uint64(1)) << high_shift
+    return ((raw[index] >> low_shift) | high) & np.uint64((1 << bits) - 1)
+
+
+def pack_entries(values, bits):
+    """Inverse of :func:`unpack_entries`, returns big-endian longs."""
+    values = np.asarray(values, dtype="<u4")
+    stream = np.unpackbits(
+        values.view(np.uint8).reshape(-1, 4), axis=1, bitorder="little"
+    )[:, :bits].ravel()
+    stream = np.concatenate((stream, np.zeros(-len(stream) % 64, dtype=np.uint8)))
+    return np.packbits(stream, bitorder="little").view("<u8").astype(">u8")
+
+
+class ChunkSection:
+    """16x16x16 blocks as a palette of states and per-block palette indices.
+
+    ``blocks`` is indexed ``[y, z, x]``.
+    """
+
+    __slots__ = ("palette", "blocks")
+
+    def __init__(self, palette, blocks):
+        self.palette = palette
+        self.blocks = blocks
+
+    @classmethod
+    def from_states(cls, states):
+        """Compress an array of 4096 state ids, in y, z, x order."""
+        palette, inverse = np.unique(np.asarray(states).ravel(), return_inverse=True)
+        dtype = np.uint8 if len(palette) <= 256 else np.uint16
+        return cls(palette.astype(np.uint32), inverse.astype(dtype).reshape(16, 16, 16))
+
+    @property
+    def nbytes(self):
+        return self.palette.nbytes + self.blocks.nbytes + _SECTION_OVERHEAD
+
+    def states(self):
+        return self.palette[self.blocks]
+
+    def get(self, x, y, z):
+        return int(self.palette[self.blocks[y, z, x]])
+
+    def set(self, x, y, z, state):
+        found = np.flatnonzero(self.palette == state)
+        if len(found):
+            index = found[0]
+        else:
+            index = len(self.palette)
+            self.palette = np.append(self.palette, np.uint32(state))
+            if index > np.iinfo(self.blocks.dtype).max:
+                self.blocks = self.blocks.astype(np.uint16)
+        self.blocks[y, z, x] = index
+
+    def matching(self, block_ids):
+        """Boolean [y, z, x] mask of blocks whose id is in ``block_ids``,
+        ``None`` when the palette holds none of them."""
+        hits = np.isin(self.palette >> 4, block_ids)
+        if not hits.any():
+            return None
+        return hits[self.blocks]
+
+
+def decode_section(data, offset, has_sky):
+    """Decode one chunk section of a chunk data payload.
+
+    Returns:
+      tuple: the :class:`ChunkSection` and the offset after it
+    """
+    bits = data[offset]
+    offset += 1
+    palette_length, offset = decode_varint(data, offset)
+    palette = []
+    for _ in range(palette_length):
+        state, offset = decode_varint(data, offset)
+        palette.append(state)
+    longs, offset = decode_varint(data, offset)
+    entries = unpack_entries(np.frombuffer(data, ">u8", longs, offset), bits)
+    offset += longs * 8 + LIGHT_BYTES + (LIGHT_BYTES if has_sky else 0)
+    if bits > MAX_LOCAL_BITS:
+        section = ChunkSection.from_states(entries)
+    else:
+        # Local palettes are already what we store, as sent
+        section = ChunkSection(
+            np.array(palette, dtype=np.uint32),
+            entries.astype(np.uint8).reshape(16, 16, 16),
+        )
+    return section, offset
+
+
+def decode_chunk(data, has_sky=True):
+    """Decode a 1.12.2 ``ChunkDataPacket`` payload.
+
+    Args:
+      data (bytes): the packet body after its id
+      has_sky (bool): sections carry sky light, true in the overworld
+
+    Returns:
+      tuple: chunk x, chunk z, whether the whole column was sent, and a
+      dict of section y to :class:`ChunkSection`
+    """
+    _require_numpy()
+    data = memoryview(data)
+    chunk_x, chunk_z, full = _CHUNK_HEADER.unpack_from(data)
+    mask, offset = decode_varint(data, _CHUNK_HEADER.size)
+    _, offset = decode_varint(data, offset)
+    sections = {}
+    for section_y in range(SECTIONS):
+        if mask & (1 << section_y):
+            sections[section_y], offset = decode_section(data, offset, has_sky)
+    return chunk_x, chunk_z, full, sections
+
+
+def encode_chunk(chunk_x, chunk_z, sections, has_sky=True, full=True):
+    """Build a ``ChunkDataPacket`` payload, for tests and the fake server.
+
+    Args:
+      sections: dict of section y to an array of 4096 states in y, z, x order
+
+    Returns:
+      bytes: the payload, without block entities' NBT
+    """
+    _require_numpy()
+    body = bytearray()
+    mask = 0
+    for section_y in sorted(sections):
+        mask |= 1 << section_y
+        palette, indices = np.unique(
+            np.asarray(sections[section_y]).ravel(), return_inverse=True
+        )
+        bits = max(4, int(len(palette) - 1).bit_length())
+        if bits > MAX_LOCAL_BITS:
+            bits, values, palette = GLOBAL_BITS, palette[indices], ()
+        else:
+            values = indices
+        longs = pack_entries(values, bits)
+        body.append(bits)
+        body += encode_varint(len(palette))
+        for state in palette:
+            body += encode_varint(int(state))
+        body += encode_varint(len(longs))
+        body += longs.tobytes()
+        body += b"\xff" * (LIGHT_BYTES * (2 if has_sky else 1))
+    if full:
+        body += bytes(BIOME_BYTES)
+    header = _CHUNK_HEADER.pack(chunk_x, chunk_z, full) + encode_varint(mask)
+    return header + encode_varint(len(body)) + bytes(body) + encode_varint(0)
+
+
+def decode_position(value):
+    """Split a packed 1.12 block position into (x, y, z)."""
+    x = value >> 38
+    y = (value >> 26) & 0xFFF
+    z = value & 0x3FFFFFF
+    if x >= 1 << 25:
+        x -= 1 << 26
+    if z >= 1 << 25:
+        z -= 1 << 26
+    return x, y, z
+
+
+def decode_block_change(data):
+    """Decode a ``BlockChangePacket`` payload into (x, y, z, state)."""
+    (position,) = _POSITION.unpack_from(data)
+    state, _ = decode_varint(data, _POSITION.size)
+    return (*decode_position(position), state)
+
+
+def decode_multi_block_change(data):
+    """Decode a ``MultiBlockChangePacket`` payload.
+
+    Returns:
+      tuple: chunk x, chunk z and a list of (x, y, z, state) relative to
+      the chunk
+    """
+    data = memoryview(data)
+    chunk_x, chunk_z = _CHUNK_POSITION.unpack_from(data)
+    count, offset = decode_varint(data, _CHUNK_POSITION.size)
+    changes = []
+    for _ in range(count):
+        horizontal, y = data[offset], data[offset + 1]
+        state, offset = decode_varint(data, offset + 2)
+        changes.append((horizontal >> 4, y, horizontal & 15, state))
+    return chunk_x, chunk_z, changes
+
+
+class Chunk:
+    """A 16x256x16 column of up to 16 sections, ``None`` where all air."""
+
+    __slots__ = ("x", "z", "sections", "version", "used")
+
+    def __init__(self, x, z, sections=None):
+        self.x = x
+        self.z = z
+        self.sections = [None] * SECTIONS
+        for section_y, section in (sections or {}).items():
+            self.sections[section_y] = section
+        # Bumped on every change, lets callers cache what they derive
+        self.version = 0
+        self.used = 0
+
+    @property
+    def nbytes(self):
+        return _CHUNK_OVERHEAD + sum(
+            section.nbytes for section in self.sections if section is not None
+        )
+
+    def get(self, x, y, z):
+        """State at chunk-relative ``x``, ``z`` and absolute ``y``."""
+        if not 0 <= y < 256:
+            return AIR
+        section = self.sections[y >> 4]
+        return AIR if section is None else section.get(x, y & 15, z)
+
+    def set(self, x, y, z, state):
+        if not 0 <= y < 256:
+            return
+        section = self.sections[y >> 4]
+        if section is None:
+            if state == AIR:
+                return
+            section = self.sections[y >> 4] = ChunkSection(
+                np.array([AIR], dtype=np.uint32),
+                np.zeros((16, 16, 16), dtype=np.uint8),
+            )
+        section.set(x, y & 15, z, state)
+        self.version += 1
+
+    def heights(self):
+        """Highest non-air y of each column, ``[z, x]``, -1 when empty."""
+        heights = np.full((16, 16), -1, dtype=np.int16)
+        remaining = np.ones((16, 16), dtype=bool)
+        for section_y in range(SECTIONS - 1, -1, -1):
+            section = self.sections[section_y]
+            if section is None:
+                continue
+            solid = (section.palette != AIR)[section.blocks]
+            filled = solid.any(axis=0)
+            top = 15 - np.argmax(solid[::-1], axis=0)
+            found = remaining & filled
+            heights[found] = section_y * 16 + top[found]
+            remaining &= ~filled
+            if not remaining.any():
+                break
+        return heights
+
+
+class WorldCache:
+    """Chunks the server sent, capped in memory.
+
+    Args:
+      max_bytes (int): memory the chunks may use before some are dropped
+      center: callable returning the bot's (x, y, z); chunks farthest from
+        it are dropped first, the least recently used among equals
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, center=None):
+        _require_numpy()
+        self.max_bytes = max_bytes
+        self.center = center or (lambda: (0, 0, 0))
+        self.has_sky = True
+        self.dimension = None
+        self.chunks = {}
+        self.nbytes = 0
+        self.evicted = 0
+        self._uses = itertools.count()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def set_dimension(self, dimension, keep=False):
+        """Forget every chunk, on joining or respawning in ``dimension``.
+
+        Args:
+          keep (bool): keep the chunks if already in ``dimension``, when
+            they were restored from a snapshot of it
+        """
+        with self._lock:
+            if keep and dimension == self.dimension:
+                return
+            self.dimension = dimension
+            # Only the overworld sends sky light
+            self.has_sky = dimension == 0
+            self.chunks.clear()
+            self.nbytes = 0
+
+    def chunk(self, chunk_x, chunk_z):
+        chunk = self.chunks.get((chunk_x, chunk_z))
+        if chunk is not None:
+            chunk.used = next(self._uses)
+        return chunk
+
+    def load(self, data):
+        """Apply a ``ChunkDataPacket`` payload.
+
+        Returns:
+          Chunk: the chunk it filled
+        """
+        chunk_x, chunk_z, full, sections = decode_chunk(data, self.has_sky)
+        with self._lock:
+            chunk = self.chunks.get((chunk_x, chunk_z))
+            if chunk is None or full:
+                if chunk is not None:
+                    self.nbytes -= chunk.nbytes
+                chunk = self.chunks[chunk_x, chunk_z] = Chunk(chunk_x, chunk_z)
+            else:
+                self.nbytes -= chunk.nbytes
+            for section_y, section in sections.items():
+                chunk.sections[section_y] = section
+            chunk.version += 1
+            chunk.used = next(self._uses)
+            self.nbytes += chunk.nbytes
+            if self.nbytes > self.max_bytes:
+                self._evict()
+        return chunk
+
+    def unload(self, chunk_x, chunk_z):
+        with self._lock:
+            chunk = self.chunks.pop((chunk_x, chunk_z), None)
+            if chunk is not None:
+                self.nbytes -= chunk.nbytes
+        return chunk
+
+    def _evict(self):
+        keys = list(self.chunks)
+        x, _, z = self.center()
+        coords = np.array(keys).reshape(-1, 2)
+        distance = np.abs(coords - (int(x) >> 4, int(z) >> 4)).max(axis=1)
+        used = np.array([self.chunks[key].used for key in keys])
+        for index in np.lexsort((used, -distance)):
+            if self.nbytes <= self.max_bytes:
+                break
+            self.nbytes -= self.chunks.pop(keys[index]).nbytes
+            self.evicted += 1
+
+    def block_at(self, x, y, z):
+        """State at a block position, ``None`` if its chunk is not loaded."""
+        chunk = self.chunk(x >> 4, z >> 4)
+        return None if chunk is None else chunk.get(x & 15, y, z & 15)
+
+    def set_block(self, x, y, z, state):
+        with self._lock:
+            chunk = self.chunks.get((x >> 4, z >> 4))
+            if chunk is None:
+                return
+            self.nbytes -= chunk.nbytes
+            chunk.set(x & 15, y, z & 15, state)
+            self.nbytes += chunk.nbytes
+
+    def apply_block_change(self, data):
+        """Apply a ``BlockChangePacket`` payload."""
+        self.set_block(*decode_block_change(data))
+
+    def apply_multi_block_change(self, data):
+        """Apply a ``MultiBlockChangePacket`` payload."""
+        chunk_x, chunk_z, changes = decode_multi_block_change(data)
+        with self._lock:
+            chunk = self.chunks.get((chunk_x, chunk_z))
+            if chunk is None:
+                return
+            self.nbytes -= chunk.nbytes
+            for x, y, z, state in changes:
+                chunk.set(x, y, z, state)
+            self.nbytes += chunk.nbytes
+
+    def apply_unload(self, data):
+        """Apply an ``UnloadChunkPacket`` payload."""
+        self.unload(*_CHUNK_POSITION.unpack_from(data))
+
+    def column_heights(self, chunk_x, chunk_z):
+        """Highest non-air y per column of a chunk, ``[z, x]``.
+
+        Returns ``None`` if the chunk is not loaded.
+        """
+        chunk = self.chunk(chunk_x, chunk_z)
+        return None if chunk is None else chunk.heights()
+
+    def find_blocks(self, block_ids, center, radius):
+        """Positions of the blocks of the given ids within ``radius``.
+
+        Sections whose palette has none of the ids are skipped without
+        looking at their blocks.
+
+        Args:
+          block_ids: block ids, without metadata
+          center (tuple): (x, y, z)
+          radius (float): distance in blocks
+
+        Returns:
+          ndarray: (n, 3) integer positions, nearest first
+        """
+        block_ids = np.asarray(block_ids, dtype=np.uint32)
+        cx, cy, cz = (int(value) for value in center)
+        low_section = max(0, (cy - int(radius)) >> 4)
+        high_section = min(SECTIONS - 1, (cy + int(radius)) >> 4)
+        span = int(radius) >> 4
+        found = []
+        with self._lock:
+            for chunk_x in range((cx >> 4) - span - 1, (cx >> 4) + span + 2):
+                for chunk_z in range((cz >> 4) - span - 1, (cz >> 4) + span + 2):
+                    chunk = self.chunks.get((chunk_x, chunk_z))
+                    if chunk is None:
+                        continue
+                    for section_y in range(low_section, high_section + 1):
+                        section = chunk.sections[section_y]
+                        if section is None:
+                            continue
+                        mask = section.matching(block_ids)
+                        if mask is None:
+                            continue
+                        ys, zs, xs = np.nonzero(mask)
+                        found.append(
+                            np.column_stack(
+                                (
+                                    xs + chunk_x * 16,
+                                    ys + section_y * 16,
+                                    zs + chunk_z * 16,
+                                )
+                            )
+                        )
+        if not found:
+            return np.empty((0, 3), dtype=np.int64)
+        positions = np.concatenate(found)
+        squared = ((positions - (cx, cy, cz)) ** 2).sum(axis=1)
+        inside = squared <= radius * radius
+        positions, squared = positions[inside], squared[inside]
+        return positions[np.argsort(squared, kind="stable")]
@@ -1,10 +1,49 @@
 """
-    Dummy conftest.py for trashbags.
+    Fixtures shared by the trashbags tests.
 
-    If you don't know what this is for, just leave it empty.
     Read more about conftest.py under:
     - https://docs.pytest.org/en/stable/fixture.html
     - https://docs.pytest.org/en/stable/writing_plugins.html
 """
 
-# import pytest
+import pytest
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+STONE = 1 << 4
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A clock that only moves when ``clock.now`` is set."""
+    return FakeClock()
+
+
+@pytest.fixture
+def flat_world():
+    """Build worlds of stone up to y = floor - 1 over chunks x chunks from (0, 0)."""
+    # NumPy is the optional numpy extra
+    np = pytest.importorskip("numpy")
+    from trashbags.world import Chunk, ChunkSection, WorldCache
+
+    def build(chunks=2, floor=3):
+        world = WorldCache()
+        states = np.zeros((16, 16, 16), dtype=np.uint32)
+        states[:floor] = STONE
+        for chunk_x in range(chunks):
+            for chunk_z in range(chunks):
+                section = ChunkSection.from_states(states)
+                world.chunks[chunk_x, chunk_z] = Chunk(chunk_x, chunk_z, {0: section})
+        return world
+
+    return build
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pytest
+
+from trashbags.acl import ADMIN, NOBODY, OPERATOR, USER, AccessList, read_acl
+from trashbags.scheduler import Scheduler
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+NOTCH = "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+JEB = "853c80ef-3c37-49fd-aa49-938b674adae6"
+DINNERBONE = "61699b2e-d327-4a01-9f1e-0ea8c3f06bc6"
+
+
+def write_acl(path, text, mtime=None):
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_roles_are_tiers(tmp_path):
+    path = tmp_path / "acl.ini"
+    write_acl(
+        path,
+        f"[admin]\n{NOTCH} = Notch\n[user]\n{JEB.replace('-', '').upper()}\n"
+        f"[operator]\n{NOTCH}\n",
+    )
+
+    assert read_acl(path) == {NOTCH: ADMIN, JEB: USER}
+    acl = AccessList(str(path), uuids=[DINNERBONE])
+    assert acl.is_authorized(JEB)
+    assert not acl.is_authorized(JEB, OPERATOR)
+    assert acl.is_authorized(DINNERBONE, ADMIN)
+    assert acl.tier_of(None) == NOBODY
+
+
+def test_unknown_role_is_an_error(tmp_path):
+    path = tmp_path / "acl.ini"
+    write_acl(path, f"[owner]\n{NOTCH}\n")
+
+    with pytest.raises(ValueError):
+        read_acl(path)
+
+
+def test_unknown_senders_are_refused_and_remembered(clock):
+    acl = AccessList(uuids=[NOTCH, "not-a-uuid"], negative_ttl=10, clock=clock)
+    players = {"Notch": NOTCH, "Jeb": JEB}
+    lookups = []
+
+    def resolve(name):
+        lookups.append(name)
+        return players.get(name)
+
+    assert acl.sender_tier("Notch", resolve) == ADMIN
+    for _ in range(3):
+        assert acl.sender_tier("Jeb", resolve) == NOBODY
+    assert acl.sender_tier("Herobrine", resolve) == NOBODY
+    assert acl.sender_tier(None, resolve) == NOBODY
+    assert lookups == ["Notch", "Jeb", "Herobrine"]
+    assert acl.refused == 5
+
+    clock.now = 11
+    acl.sender_tier("Jeb", resolve)
+    assert lookups[-1] == "Jeb"
+
+
+def test_senders_missing_from_the_tab_list_are_not_remembered(clock):
+    acl = AccessList(uuids=[NOTCH], clock=clock)
+    players = {}
+
+    # The whisper came in before the player's tab list entry
+    assert acl.sender_tier("Notch", players.get) == NOBODY
+    players["Notch"] = NOTCH
+    assert acl.sender_tier("Notch", players.get) == ADMIN
+
+
+def test_refusals_are_forgotten_oldest_first(clock):
+    acl = AccessList(uuids=[NOTCH], clock=clock)
+    acl.NEGATIVE_CACHE_SIZE = 2
+    players = {"Jeb": JEB, "Dinnerbone": "d", "Grumm": "g"}
+    lookups = []
+
+    def resolve(name):
+        lookups.append(name)
+        return players.get(name)
+
+    for name in ("Jeb", "Dinnerbone", "Grumm", "Grumm", "Dinnerbone", "Jeb"):
+        acl.sender_tier(name, resolve)
+    assert lookups == ["Jeb", "Dinnerbone", "Grumm", "Jeb"]
+
+
+def test_file_changes_are_picked_up(tmp_path):
+    path = tmp_path / "acl.ini"
+    write_acl(path, f"[user]\n{NOTCH}\n", mtime=1000)
+    acl = AccessList(str(path))
+    acl.sender_tier("Jeb", {"Jeb": JEB}.get)
+
+    assert not acl.reload_if_changed()
+    write_acl(path, f"[operator]\n{JEB}\n", mtime=2000)
+    assert acl.reload_if_changed()
+    assert not acl.is_authorized(NOTCH)
+    assert acl.sender_tier("Jeb", {"Jeb": JEB}.get) == OPERATOR
+
+    # A broken file keeps the last good list
+    write_acl(path, "[operator]\nnonsense\n", mtime=3000)
+    assert not acl.reload_if_changed()
+    assert acl.is_authorized(JEB, OPERATOR)
+
+
+def test_watched_on_the_scheduler(tmp_path):
+    path = tmp_path / "acl.ini"
+    write_acl(path, "", mtime=1000)
+    scheduler = Scheduler().start()
+    acl = AccessList(str(path)).start(scheduler, interval=0.01)
+    write_acl(path, f"[admin]\n{NOTCH}\n", mtime=2000)
+
+    deadline = time.monotonic() + 1
+    while not acl.is_authorized(NOTCH) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    acl.stop()
+    scheduler.stop()
+    assert acl.is_authorized(NOTCH, ADMIN)
@@ -0,0 +1,172 @@
+import base64
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from trashbags.auth import (
+    DEFAULT_ACCOUNT,
+    AuthRecord,
+    InteractiveLoginRequired,
+    LoginError,
+    TokenCache,
+    TokenManager,
+    microsoft_login,
+    token_expiry,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class StubAuthHandler(BaseHTTPRequestHandler):
+    """Hands out ``token-N`` access tokens, living ``lifetime`` seconds."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        server.logins += 1
+        if body["account"] in server.refused:
+            self.send_response(403)
+            self.end_headers()
+            return
+        payload = json.dumps(
+            {
+                "username": body["account"].split("@")[0],
+                "uuid": "uuid-" + body["account"],
+                "access_token": f"token-{server.logins}",
+                "expires_in": server.lifetime,
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def auth_server():
+    server = HTTPServer(("127.0.0.1", 0), StubAuthHandler)
+    server.logins = 0
+    server.lifetime = 3600
+    server.refused = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def stub_authenticator(server):
+    url = "http://127.0.0.1:%d/login" % server.server_port
+
+    def authenticate(account, cached, interactive=True):
+        request = urllib.request.Request(
+            url, data=json.dumps({"account": account}).encode(), method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = json.load(response)
+        return AuthRecord(
+            account,
+            body["username"],
+            body["uuid"],
+            body["access_token"],
+            time.time() + body["expires_in"],
+        )
+
+    return authenticate
+
+
+def test_cached_token_skips_network(tmp_path, auth_server):
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    first = TokenManager(cache, stub_authenticator(auth_server), refresh_ahead=60)
+    record = first.token_for("steve@example.org")
+    first.scheduler.stop()
+
+    second = TokenManager(cache, stub_authenticator(auth_server), refresh_ahead=60)
+    again = second.token_for("steve@example.org")
+    second.scheduler.stop()
+
+    assert record.username == "steve"
+    assert again == record
+    assert auth_server.logins == 1
+
+
+def test_token_is_refreshed_ahead_of_expiry(tmp_path, auth_server):
+    auth_server.lifetime = 0.2
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    manager = TokenManager(cache, stub_authenticator(auth_server), refresh_ahead=0.15)
+
+    record = manager.token_for("alex")
+    deadline = time.monotonic() + 2
+    while cache.get("alex") == record and time.monotonic() < deadline:
+        time.sleep(0.01)
+    manager.stop()
+    manager.scheduler.stop()
+
+    assert cache.get("alex").access_token != record.access_token
+
+
+def test_failed_login_raises(tmp_path, auth_server):
+    auth_server.refused.add("banned")
+    manager = TokenManager(
+        TokenCache(str(tmp_path / "tokens.json")), stub_authenticator(auth_server)
+    )
+
+    with pytest.raises(LoginError):
+        manager.token_for("banned")
+    manager.scheduler.stop()
+
+
+def test_background_refresh_never_prompts(tmp_path):
+    calls = []
+
+    def authenticate(account, cached, interactive=True):
+        calls.append(interactive)
+        if cached is not None and not interactive:
+            raise InteractiveLoginRequired("needs a prompt")
+        return AuthRecord(account, "steve", "uuid", "token", time.time() + 3600)
+
+    manager = TokenManager(
+        TokenCache(str(tmp_path / "tokens.json")),
+        authenticate,
+        refresh_ahead=3600,
+        retry=0.01,
+    )
+    manager.token_for(DEFAULT_ACCOUNT)
+    deadline = time.monotonic() + 2
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    manager.scheduler.stop()
+
+    # The refresh gave up without retrying, the next login may prompt
+    assert calls == [True, False]
+
+
+def test_default_account_cannot_prompt_in_the_background():
+    with pytest.raises(InteractiveLoginRequired):
+        microsoft_login(DEFAULT_ACCOUNT, interactive=False)
+
+
+def jwt(claims):
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=")
+
+    return b".".join([part({"alg": "HS256"}), part(claims), b"signature"]).decode()
+
+
+def test_tokens_expire_when_they_say():
+    # Restored hours after it was issued, it has less than a day left
+    token = jwt({"iat": 1000, "exp": 1000 + 86400})
+    assert token_expiry(token) == 87400.0
+
+    cached = AuthRecord("alice", "alice", "uuid", "opaque", 5000.0)
+    assert token_expiry("opaque", cached) == 5000.0
+    assert token_expiry("other", cached) == pytest.approx(time.time() + 86400, abs=5)
@@ -0,0 +1,86 @@
+import io
+import zlib
+from types import SimpleNamespace
+
+from trashbags.capture import (
+    PacketCapture,
+    decode_varint,
+    encode_varint,
+    main,
+    read_capture,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+def frame(packet_id, payload, compressed=False):
+    body = encode_varint(packet_id) + payload
+    if compressed:
+        body = encode_varint(len(body)) + zlib.compress(body)
+    return encode_varint(len(body)) + body
+
+
+class PlayingReactor:
+    """Reads one frame per call, like pyCraft's reactors."""
+
+    def __init__(self, compression):
+        self.connection = SimpleNamespace(
+            options=SimpleNamespace(compression_enabled=compression)
+        )
+
+    def read_packet(self, stream, timeout=0):
+        length, _ = decode_varint(stream.read(1))
+        body = stream.read(length)
+        if self.connection.options.compression_enabled:
+            size, offset = decode_varint(body)
+            body = zlib.decompress(body[offset:])
+        packet_id, _ = decode_varint(body)
+        return SimpleNamespace(id=packet_id)
+
+
+def test_varint_round_trip():
+    for value in (0, 1, 127, 128, 25565, 2**31 - 1, -1):
+        assert decode_varint(encode_varint(value)) == (value, len(encode_varint(value)))
+
+
+def test_reads_are_captured_and_read_back(tmp_path, capsys):
+    path = str(tmp_path / "bot.cap")
+    capture = PacketCapture(path, compress=True, flush_interval=0.01)
+    plain, compressed = PlayingReactor(False), PlayingReactor(True)
+    capture._hook_reactor(plain)
+    capture._hook_reactor(compressed)
+
+    assert plain.read_packet(io.BytesIO(frame(0x0F, b"hello"))).id == 0x0F
+    assert compressed.read_packet(io.BytesIO(frame(0x20, b"x" * 64, True))).id == 0x20
+    capture.close()
+
+    records = list(read_capture(path))
+    assert [(r.packet_id, r.payload) for r in records] == [
+        (0x0F, b"hello"),
+        (0x20, b"x" * 64),
+    ]
+    assert all(r.incoming and r.play for r in records)
+
+    main([path, "--raw", "--id", "0x20"])
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 1 and "0x20" in output[0]
+
+
+def test_truncated_captures_end_at_the_last_whole_record(tmp_path):
+    path = str(tmp_path / "bot.cap")
+    capture = PacketCapture(path, compress=True, flush_interval=0.01)
+    reactor = PlayingReactor(False)
+    capture._hook_reactor(reactor)
+    for packet_id in range(3):
+        reactor.read_packet(io.BytesIO(frame(packet_id, b"payload" * 10)))
+    capture.close()
+
+    with open(path, "rb") as complete:
+        data = complete.read()
+    for cut in (len(data) - 8, len(data) // 2):
+        with open(path, "wb") as truncated:
+            truncated.write(data[:cut])
+        ids = [record.packet_id for record in read_capture(path)]
+        assert ids == list(range(len(ids)))
@@ -0,0 +1,46 @@
+from trashbags.chat import CHAT, SYSTEM, WHISPER, decode_chat
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+WHISPER_JSON = (
+    '{"color":"gray","extra":[{"text":"["},'
+    '{"color":"light_purple","text":"Steve"},'
+    '{"text":" -> me] "},{"text":"come here"}],"text":""}'
+)
+
+
+def test_whisper_is_decoded_once_into_a_record():
+    message = decode_chat(WHISPER_JSON)
+
+    assert message.kind == WHISPER
+    assert message.sender == "Steve"
+    assert message.text == "[Steve -> me] come here"
+    assert message.body == "come here"
+    assert decode_chat(WHISPER_JSON) is message
+
+
+def test_components_without_color_do_not_raise():
+    message = decode_chat('{"extra":[{"text":"<"},{"text":"Alex"},{"text":"> hi"}]}')
+
+    assert message.kind == CHAT
+    assert message.sender is None
+
+
+def test_vanilla_translations():
+    whisper = decode_chat(
+        '{"translate":"commands.message.display.incoming",'
+        '"with":[{"text":"Alex"},{"text":"hi"}],"color":"gray"}'
+    )
+    joined = decode_chat(
+        '{"translate":"multiplayer.player.joined",'
+        '"with":[{"text":"Alex"}],"color":"yellow"}'
+    )
+
+    assert (whisper.kind, whisper.sender, whisper.body) == (WHISPER, "Alex", "hi")
+    assert joined.kind == SYSTEM
+
+
+def test_invalid_json_is_system_text():
+    assert decode_chat("not json").kind == SYSTEM
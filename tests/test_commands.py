@@ -0,0 +1,135 @@
+from trashbags.acl import ADMIN, OPERATOR, USER
+from trashbags.commands import (
+    CONSOLE,
+    CommandContext,
+    CommandRouter,
+    Histogram,
+    default_router,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class FakeBot:
+    def __init__(self):
+        self.targets = []
+        self.chat = []
+
+    def navigate(self, destination):
+        self.targets.append(destination)
+
+    def send_chat(self, text):
+        self.chat.append(text)
+
+
+def context(bots=(), sender=CONSOLE):
+    replies = []
+    return CommandContext(list(bots), sender, replies.append), replies
+
+
+def test_longest_multi_word_name_wins():
+    router = CommandRouter()
+    calls = []
+    router.add("stats", lambda context, *rest: calls.append(("stats", rest)))
+    router.add("stats outbox", lambda context: calls.append(("outbox",)))
+
+    ctx, _ = context()
+    assert router.dispatch("stats outbox", ctx)
+    assert router.dispatch('STATS "some thing" else', ctx)
+    assert calls == [("outbox",), ("stats", ("some thing", "else"))]
+
+
+def test_arguments_are_typed():
+    bot = FakeBot()
+    ctx, replies = context([bot])
+    router = default_router()
+
+    assert router.dispatch("goto 1 64 -2.5", ctx)
+    assert bot.targets == [(1.0, 64.0, -2.5)]
+    assert not router.dispatch("goto 1 up 3", ctx)
+    assert not router.dispatch("goto 1", ctx)
+    assert replies == [
+        "y must be a float, not 'up'",
+        "Usage: goto <x:float> <y:float> <z:float>",
+    ]
+
+
+def test_optional_and_boolean_arguments():
+    router = CommandRouter()
+    seen = []
+
+    @router.command("sprint")
+    def sprint(context, enabled: bool, speed: float = 5.6):
+        seen.append((enabled, speed))
+
+    ctx, replies = context()
+    router.dispatch("sprint on", ctx)
+    router.dispatch("sprint off 3", ctx)
+    router.dispatch("sprint maybe", ctx)
+    assert seen == [(True, 5.6), (False, 3.0)]
+    assert replies == ["enabled must be a bool, not 'maybe'"]
+
+
+def test_cooldown_is_per_sender(clock):
+    router = CommandRouter(clock)
+    router.add("ping", lambda context: context.reply("pong"), cooldown=5)
+    steve, steve_replies = context(sender="Steve")
+    alex, _ = context(sender="Alex")
+
+    assert router.dispatch("ping", steve)
+    assert not router.dispatch("ping", steve)
+    assert router.dispatch("ping", alex)
+    clock.now += 5
+    assert router.dispatch("ping", steve)
+    assert steve_replies == ["pong", "ping is cooling down, wait 5.0s", "pong"]
+
+
+def test_unknown_and_failing_commands_reply():
+    router = CommandRouter()
+    router.add("boom", lambda context: 1 / 0)
+    ctx, replies = context()
+
+    assert not router.dispatch("nope 1 2", ctx)
+    assert not router.dispatch("boom", ctx)
+    assert not router.dispatch("   ", ctx)
+    assert replies == ["Unknown command: nope", "boom failed"]
+    assert router.stats()["boom"]["count"] == 1
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for value in [0.00005] * 98 + [0.02, 2.0]:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 0.0001
+    assert histogram.quantile(0.99) == 0.05
+    assert histogram.quantile(1.0) == 5.0
+    assert histogram.as_dict()["count"] == 100
+
+
+def test_commands_above_the_caller_tier_are_refused():
+    bot = FakeBot()
+    router = default_router()
+    replies = []
+    player = CommandContext([bot], "Steve", replies.append, USER)
+
+    assert not router.dispatch("say hello", player)
+    assert router.dispatch("help", player)
+    assert replies == ["You may not use say", "help, nearby, where"]
+
+
+def test_only_admins_say_server_commands():
+    bot = FakeBot()
+    router = default_router()
+    replies = []
+    operator = CommandContext([bot], "Steve", replies.append, OPERATOR)
+    other = CommandContext([bot], "Notch", replies.append, OPERATOR)
+    admin = CommandContext([bot], "Alex", replies.append, ADMIN)
+
+    assert not router.dispatch('say "/op Steve"', operator)
+    assert router.dispatch("say hello", other)
+    assert router.dispatch("say /time set day", admin)
+    assert bot.chat == ["hello", "/time set day"]
+    assert replies == ["Only admins may send server commands"]
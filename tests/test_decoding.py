@@ -0,0 +1,152 @@
+import io
+import struct
+
+from trashbags.decoding import DecodingPolicy, LazyPacket, lazy_class
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class Packet:
+    id = None
+    reads = 0
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.__dict__})"
+
+
+class KeepAlivePacket(Packet):
+    id = 0x1F
+
+    def read(self, file_object):
+        KeepAlivePacket.reads += 1
+        (self.keep_alive_id,) = struct.unpack(">q", file_object.read(8))
+
+
+class ChunkDataPacket(Packet):
+    id = 0x20
+
+    def read(self, file_object):
+        ChunkDataPacket.reads += 1
+        self.x, self.z = struct.unpack(">ii", file_object.read(8))
+        self.data = file_object.read()
+
+
+class ChatMessagePacket(Packet):
+    id = 0x0F
+
+    def read(self, file_object):
+        self.json_data = file_object.read().decode()
+
+
+class PacketBuffer:
+    """Like pyCraft's, a ``BytesIO`` in ``bytes``."""
+
+    def __init__(self, data):
+        self.bytes = io.BytesIO(data)
+
+    def read(self, length=None):
+        return self.bytes.read(length)
+
+
+class Listener:
+    def __init__(self, *packets):
+        self.packets_to_listen = list(packets)
+
+
+class FakeConnection:
+    def __init__(self, *listened, early=()):
+        self.packet_listeners = [Listener(*listened)]
+        self.early_packet_listeners = [Listener(*early)]
+
+
+class PlayingReactor:
+    def __init__(self):
+        self.clientbound_packets = {
+            packet.id: packet for packet in (KeepAlivePacket, ChunkDataPacket)
+        }
+        self.clientbound_packets[ChatMessagePacket.id] = ChatMessagePacket
+
+
+def chunk_frame(x, z, size):
+    # The packet id has already been read from the frame
+    return b"\x20" + struct.pack(">ii", x, z) + bytes(size)
+
+
+def test_lazy_packets_decode_on_first_access():
+    ChunkDataPacket.reads = 0
+    buffer = PacketBuffer(chunk_frame(3, -4, 1000))
+    buffer.read(1)
+    packet = lazy_class(ChunkDataPacket)()
+    packet.read(buffer)
+
+    assert isinstance(packet, ChunkDataPacket) and isinstance(packet, LazyPacket)
+    assert type(packet).__name__ == "ChunkDataPacket"
+    assert ChunkDataPacket.reads == 0 and not packet.decoded
+    assert isinstance(packet.raw, memoryview) and len(packet.raw) == 1008
+    assert buffer.read() == b""
+
+    assert (packet.x, packet.z) == (3, -4)
+    assert len(packet.data) == 1000
+    assert ChunkDataPacket.reads == 1 and packet.decoded
+    assert packet.z == -4 and ChunkDataPacket.reads == 1
+
+
+def test_raw_view_is_zero_copy():
+    buffer = PacketBuffer(chunk_frame(0, 0, 16))
+    buffer.read(1)
+    packet = lazy_class(ChunkDataPacket)()
+    packet.read(buffer)
+    buffer.bytes.getbuffer()[9] = 7
+    assert packet.raw[8] == 7
+
+
+def test_repr_does_not_decode():
+    packet = lazy_class(KeepAlivePacket)()
+    packet.read(io.BytesIO(struct.pack(">q", 42)))
+
+    assert repr(packet) == "KeepAlivePacket(0x1F, 8 bytes, not decoded)"
+    assert str(packet) == repr(packet)
+    assert not packet.decoded
+    assert packet.keep_alive_id == 42
+    assert "keep_alive_id" in repr(packet)
+
+
+def test_missing_attributes_still_raise():
+    packet = lazy_class(KeepAlivePacket)()
+    packet.read(io.BytesIO(struct.pack(">q", 42)))
+    assert not hasattr(packet, "nothing_like_this")
+    assert packet.decoded
+    assert not hasattr(packet, "nothing_like_this")
+
+
+def test_policy_keeps_listened_classes_eager():
+    connection = FakeConnection(ChatMessagePacket, early=(Packet,))
+    policy = DecodingPolicy(connection, catch_all=(Packet,), eager=())
+    reactor = PlayingReactor()
+    policy.install(reactor)
+
+    packets = reactor.clientbound_packets
+    assert packets[ChatMessagePacket.id] is ChatMessagePacket
+    assert packets[KeepAlivePacket.id] is lazy_class(KeepAlivePacket)
+    assert packets[ChunkDataPacket.id] is lazy_class(ChunkDataPacket)
+    assert policy.lazy == {KeepAlivePacket, ChunkDataPacket}
+
+    # Applying twice leaves the lazy classes alone
+    policy.apply(packets)
+    assert packets[ChunkDataPacket.id] is lazy_class(ChunkDataPacket)
+
+
+def test_eager_classes_and_other_reactors_are_left_alone():
+    policy = DecodingPolicy(FakeConnection(), catch_all=(), eager=(ChunkDataPacket,))
+    reactor = PlayingReactor()
+    policy.apply(reactor.clientbound_packets)
+    assert reactor.clientbound_packets[ChunkDataPacket.id] is ChunkDataPacket
+
+    class LoginReactor(PlayingReactor):
+        pass
+
+    login = LoginReactor()
+    policy.install(login)
+    assert login.clientbound_packets[KeepAlivePacket.id] is KeepAlivePacket
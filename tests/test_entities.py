@@ -0,0 +1,125 @@
+import struct
+import uuid
+
+import pytest
+
+from trashbags.capture import encode_varint
+from trashbags.entities import MOB, OBJECT, PLAYER, EntityTracker
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# NumPy is the optional numpy extra
+np = pytest.importorskip("numpy")
+
+
+def spawn_mob(entity_id, type_id, x, y, z):
+    return (
+        encode_varint(entity_id)
+        + uuid.uuid4().bytes
+        + encode_varint(type_id)
+        + struct.pack(">ddd", x, y, z)
+    )
+
+
+def relative_move(entity_id, dx, dy, dz):
+    return encode_varint(entity_id) + struct.pack(">hhh?", dx, dy, dz, True)
+
+
+def test_spawn_packets_are_decoded():
+    tracker = EntityTracker()
+    tracker.apply_spawn_mob(spawn_mob(7, 54, 1.5, 64.0, -2.5))
+    tracker.apply_spawn_player(
+        encode_varint(8) + uuid.uuid4().bytes + struct.pack(">ddd", 3, 64, 3)
+    )
+    tracker.apply_spawn_object(
+        encode_varint(300) + uuid.uuid4().bytes + b"\x02" + struct.pack(">ddd", 0, 1, 2)
+    )
+
+    assert tracker.position_of(7) == (1.5, 64.0, -2.5)
+    assert tracker.position_of(300) == (0.0, 1.0, 2.0)
+    assert tracker.counts() == {OBJECT: 1, 1: 0, MOB: 1, PLAYER: 1}
+
+
+def test_relative_moves_wait_for_the_flush():
+    tracker = EntityTracker()
+    tracker.spawn(1, MOB, 54, 0.0, 64.0, 0.0)
+    tracker.apply_relative_move(relative_move(1, 4096, -2048, 0))
+    tracker.apply_relative_move(relative_move(1, 4096, 0, -1024))
+    # Moves of unknown entities are dropped
+    tracker.apply_relative_move(relative_move(2, 4096, 0, 0))
+
+    assert len(tracker._pending) == 2
+    tracker.flush()
+    assert tracker.position_of(1) == (2.0, 63.5, -0.25)
+
+
+def test_teleport_and_destroy():
+    tracker = EntityTracker()
+    tracker.spawn(1, MOB, 54, 0.0, 64.0, 0.0)
+    tracker.spawn(2, MOB, 54, 5.0, 64.0, 0.0)
+    tracker.apply_teleport(encode_varint(1) + struct.pack(">ddd", 10, 70, 10))
+    assert tracker.position_of(1) == (10.0, 70.0, 10.0)
+
+    tracker.apply_destroy(encode_varint(2) + encode_varint(1) + encode_varint(9))
+    assert len(tracker) == 1 and 2 in tracker
+    assert tracker.position_of(1) is None
+
+
+def test_slots_are_reused_and_storage_grows():
+    tracker = EntityTracker(capacity=4)
+    for entity_id in range(10):
+        tracker.spawn(entity_id, MOB, 0, entity_id, 0, 0)
+    assert len(tracker.ids) == 16
+
+    tracker.destroy(range(5))
+    for entity_id in range(10, 15):
+        tracker.spawn(entity_id, MOB, 0, entity_id, 0, 0)
+    assert len(tracker.ids) == 16
+    assert tracker.position_of(14) == (14.0, 0.0, 0.0)
+
+
+def brute_force(positions, center, radius):
+    distances = np.linalg.norm(positions - center, axis=1)
+    return set(np.flatnonzero(distances <= radius).tolist())
+
+
+@pytest.mark.parametrize("center", [(0, 64, 0), (-37.5, 64, 120.25), (300, 0, -300)])
+def test_range_queries_match_brute_force(center):
+    rng = np.random.default_rng(1)
+    positions = rng.uniform(-200, 200, (2000, 3))
+    tracker = EntityTracker(cell=8.0)
+    for entity_id, (x, y, z) in enumerate(positions):
+        tracker.spawn(entity_id, MOB if entity_id % 2 else PLAYER, 0, x, y, z)
+
+    for radius in (5.0, 40.0, 150.0):
+        ids, distances = tracker.within(center, radius)
+        assert set(ids.tolist()) == brute_force(positions, center, radius)
+        assert (np.diff(distances) >= 0).all()
+
+    ids, _ = tracker.within(center, 150.0, kind=PLAYER)
+    assert all(entity_id % 2 == 0 for entity_id in ids)
+
+
+def test_nearest_widens_the_search():
+    tracker = EntityTracker(cell=4.0)
+    tracker.spawn(1, MOB, 0, 100.0, 64.0, 0.0)
+    tracker.spawn(2, PLAYER, 0, 1.0, 64.0, 1.0)
+    tracker.spawn(3, MOB, 0, 60.0, 64.0, 0.0)
+
+    ids, distances = tracker.nearest((0, 64, 0), kind=MOB, count=2)
+    assert ids.tolist() == [3, 1]
+    assert distances.tolist() == [60.0, 100.0]
+    ids, _ = tracker.nearest((0, 64, 0), kind=MOB, max_radius=32.0)
+    assert len(ids) == 0
+
+
+def test_moves_reindex_the_grid():
+    tracker = EntityTracker(cell=4.0)
+    tracker.spawn(1, MOB, 0, 0.0, 64.0, 0.0)
+    assert tracker.within((0, 64, 0), 1)[0].tolist() == [1]
+
+    tracker.move(1, 40 * 4096, 0, 0)
+    assert len(tracker.within((0, 64, 0), 1)[0]) == 0
+    assert tracker.within((40, 64, 0), 1)[0].tolist() == [1]
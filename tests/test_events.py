@@ -0,0 +1,325 @@
+import json
+import sqlite3
+from optparse import Values
+
+import pytest
+
+from trashbags import events
+from trashbags.chat import CHAT, SYSTEM, WHISPER
+from trashbags.events import JOIN, LEAVE, EventStore, main, match_words, parse_time
+from trashbags.trashbag import Trashbag
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+ALICE = "8667ba71-b85a-4004-af54-457a9734eed7"
+BOB = "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
+
+
+def test_record_only_queues_until_flushed(store):
+    store.record(CHAT, "miner", "hello", "alice", ALICE, timestamp=100.0)
+
+    assert store.query() == []
+    assert store.flush() == 1
+    [event] = store.query()
+    assert event.time == 100.0
+    assert (event.bot, event.kind, event.sender, event.uuid, event.text) == (
+        "miner",
+        CHAT,
+        "alice",
+        ALICE,
+        "hello",
+    )
+    assert store.committed == 1 and store.commits == 1
+
+
+def test_one_commit_per_flush(store):
+    for index in range(1000):
+        store.record(CHAT, "miner", f"message {index}", "alice", ALICE)
+
+    assert store.flush() == 1000
+    assert store.commits == 1
+    assert len(store.query(limit=None)) == 1000
+
+
+def test_query_filters(store):
+    store.record(CHAT, "miner", "selling diamonds", "alice", ALICE, timestamp=10.0)
+    store.record(WHISPER, "miner", "where are you", "Bob", BOB, timestamp=20.0)
+    store.record(CHAT, "digger", "buying diamonds", "bob", BOB, timestamp=30.0)
+    store.record(SYSTEM, "miner", "Server restarting", timestamp=40.0)
+    store.flush()
+
+    assert [e.text for e in store.query(sender="BOB")] == [
+        "buying diamonds",
+        "where are you",
+    ]
+    assert [e.time for e in store.query(uuid=ALICE)] == [10.0]
+    assert [e.time for e in store.query(kind=WHISPER)] == [20.0]
+    assert [e.time for e in store.query(bot="digger")] == [30.0]
+    assert [e.time for e in store.query(since=20.0, until=40.0)] == [30.0, 20.0]
+    assert [e.time for e in store.query(text="diamonds")] == [30.0, 10.0]
+    assert [e.time for e in store.query(text="diamonds", uuid=BOB)] == [30.0]
+    assert [e.time for e in store.query(limit=2)] == [40.0, 30.0]
+
+
+def test_text_search_is_word_based(store):
+    store.record(CHAT, "miner", "Anyone selling Diamonds?", "alice", ALICE)
+    store.record(CHAT, "miner", "nope", "bob", BOB)
+    store.flush()
+
+    assert [e.sender for e in store.query(text="diamonds")] == ["alice"]
+    if store.full_text:
+        assert [e.sender for e in store.query(text="sell*")] == ["alice"]
+
+
+def test_text_search_takes_punctuation_literally(store):
+    store.record(CHAT, "miner", "don't break the anti-grief sign", "alice", ALICE)
+    store.record(CHAT, "miner", "do not", "bob", BOB)
+    store.flush()
+
+    for text in ("don't", "anti-grief", 'sign"', "AND", "NEAR(", "sign OR"):
+        store.query(text=text)
+    assert [e.sender for e in store.query(text="don't")] == ["alice"]
+    assert [e.sender for e in store.query(text="anti-grief sign")] == ["alice"]
+
+
+def test_match_words():
+    assert match_words("don't sell*") == '"don\'t" "sell"*'
+    assert match_words('say "hi"') == '"say" """hi"""'
+
+
+def test_background_writer_commits(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"), flush_interval=0.01).start()
+    try:
+        store.record(CHAT, "miner", "hello", "alice", ALICE)
+        for _ in range(200):
+            if store.committed:
+                break
+            store._closed.wait(0.01)
+        assert [e.text for e in store.query()] == ["hello"]
+    finally:
+        store.close()
+
+
+def test_close_writes_what_is_left(tmp_path):
+    path = str(tmp_path / "events.db")
+    store = EventStore(path, flush_interval=60).start()
+    store.record(CHAT, "miner", "last words", "alice", ALICE)
+    store.close()
+
+    reopened = EventStore(path)
+    try:
+        assert [e.text for e in reopened.query()] == ["last words"]
+    finally:
+        reopened.close()
+
+
+def test_full_buffer_drops_the_oldest(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"), buffer=2)
+    try:
+        for text in ("one", "two", "three"):
+            store.record(CHAT, "miner", text)
+        store.flush()
+        assert store.dropped == 1
+        assert [e.text for e in store.query()] == ["three", "two"]
+    finally:
+        store.close()
+
+
+def test_stores_share_a_database(tmp_path):
+    path = str(tmp_path / "events.db")
+    first, second = EventStore(path), EventStore(path)
+    try:
+        first.record(CHAT, "miner", "from the first", timestamp=1.0)
+        second.record(CHAT, "digger", "from the second", timestamp=2.0)
+        first.flush()
+        second.flush()
+        assert [e.bot for e in first.query()] == ["digger", "miner"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_each_server_is_recorded_by_one_store(tmp_path):
+    path = str(tmp_path / "events.db")
+    first, second = EventStore(path), EventStore(path)
+    try:
+        first.record(CHAT, "miner", "hello", server="a:25565", timestamp=1.0)
+        second.record(CHAT, "digger", "hello", server="a:25565", timestamp=1.0)
+        second.record(CHAT, "digger", "other", server="b:25565", timestamp=2.0)
+        assert first.flush() == 1
+        assert second.flush() == 1
+        assert second.skipped == 1
+        assert [(e.bot, e.server) for e in first.query()] == [
+            ("digger", "b:25565"),
+            ("miner", "a:25565"),
+        ]
+        assert [e.text for e in first.query(server="a:25565")] == ["hello"]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_lapsed_leases_are_taken_over(tmp_path):
+    path = str(tmp_path / "events.db")
+    first, second = EventStore(path), EventStore(path)
+    try:
+        first.record(CHAT, "miner", "first", server="a:25565")
+        first.flush()
+        first._connection.execute("UPDATE recorders SET expires = 0")
+        second.record(CHAT, "digger", "second", server="a:25565")
+        assert second.flush() == 1
+        first.record(CHAT, "miner", "again", server="a:25565")
+        assert first.flush() == 0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_parse_time():
+    assert parse_time("90s", now=1000.0) == 910.0
+    assert parse_time("2h", now=10000.0) == 2800.0
+    assert parse_time("1.5d", now=200000.0) == 200000.0 - 129600
+    assert parse_time("2024-01-02T03:04:05+00:00") == 1704164645.0
+    with pytest.raises(ValueError):
+        parse_time("yesterday")
+
+
+def test_cli_reports_failed_searches(tmp_path, monkeypatch):
+    path = str(tmp_path / "events.db")
+    EventStore(path).close()
+
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("fts5: syntax error")
+
+    monkeypatch.setattr(events, "query", broken)
+    with pytest.raises(SystemExit):
+        main([path, "--text", "hello"])
+
+
+def test_cli_prints_oldest_first(tmp_path, capsys):
+    path = str(tmp_path / "events.db")
+    store = EventStore(path)
+    store.record(CHAT, "miner", "first", "alice", ALICE, timestamp=10.0)
+    store.record(CHAT, "miner", "second", "alice", ALICE, timestamp=20.0)
+    store.record(CHAT, "miner", "other", "bob", BOB, timestamp=30.0)
+    store.close()
+
+    main([path, "--sender", "alice"])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith("miner chat <alice> first")
+    assert lines[1].endswith("miner chat <alice> second")
+
+
+class Action:
+    def __init__(self, uuid, name=None):
+        self.uuid = uuid
+        self.name = name
+
+
+class AddPlayerAction:
+    pass
+
+
+class RemovePlayerAction:
+    pass
+
+
+class PlayerListItemPacket:
+    def __init__(self, action_type, *actions):
+        self.action_type = action_type
+        self.actions = list(actions)
+
+
+class ChatPacket:
+    def __init__(self, sender, text):
+        self.json_data = json.dumps(
+            {"translate": "chat.type.text", "with": [{"text": sender}, text]}
+        )
+
+
+def make_bot(store, username="miner", spawned=True):
+    options = Values(
+        {
+            "username": username,
+            "address": "localhost",
+            "port": 25565,
+            "auth_list": None,
+            "world_memory": 0,
+            "snapshots": None,
+        }
+    )
+    bot = Trashbag(options, events=store)
+    bot.spawned = spawned
+    return bot
+
+
+def test_bot_records_joins_and_leaves(store):
+    bot = make_bot(store)
+    bot.players.add(BOB, "bob")
+
+    bot.user_handler(
+        PlayerListItemPacket(
+            AddPlayerAction, Action(ALICE, "alice"), Action(BOB, "bob")
+        )
+    )
+    bot.user_handler(PlayerListItemPacket(RemovePlayerAction, Action(ALICE)))
+    bot.user_handler(PlayerListItemPacket(RemovePlayerAction, Action(ALICE)))
+    store.flush()
+
+    events = store.query()
+    assert [(e.kind, e.sender, e.uuid) for e in events] == [
+        (LEAVE, "alice", ALICE),
+        (JOIN, "alice", ALICE),
+    ]
+    assert ALICE not in bot.players
+
+
+def test_bot_records_chat_with_the_sender_uuid(store):
+    bot = make_bot(store)
+    bot.players.add(ALICE, "alice")
+
+    bot.chat_handler(ChatPacket("alice", "hello"))
+    store.flush()
+
+    [event] = store.query()
+    assert (event.bot, event.kind) == ("miner", CHAT)
+    assert (event.sender, event.uuid) == ("alice", ALICE)
+    assert event.server == "localhost:25565"
+
+
+def test_one_bot_records_each_server(store):
+    miner, digger = make_bot(store), make_bot(store, "digger")
+
+    for bot in (miner, digger):
+        bot.chat_handler(ChatPacket("alice", "hello"))
+    miner.spawned = False
+    for bot in (miner, digger):
+        bot.chat_handler(ChatPacket("alice", "bye"))
+    store.flush()
+
+    bye, hello = store.query()
+    assert (bye.bot, hello.bot) == ("digger", "miner")
+    assert bye.text.endswith("bye") and hello.text.endswith("hello")
+
+
+def test_players_listed_before_spawning_did_not_join(store):
+    bot = make_bot(store, spawned=False)
+
+    bot.user_handler(PlayerListItemPacket(AddPlayerAction, Action(ALICE, "alice")))
+    bot.spawned = True
+    bot.user_handler(PlayerListItemPacket(AddPlayerAction, Action(BOB, "bob")))
+    store.flush()
+
+    assert [e.sender for e in store.query()] == ["bob"]
+    assert ALICE in bot.players
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import struct
+
+from trashbags.capture import encode_varint
+from trashbags.fakeserver import (
+    CHAT_MESSAGE,
+    JOIN_GAME,
+    KEEP_ALIVE,
+    LOGIN_SUCCESS,
+    PLAYER_LIST_ITEM,
+    PLAYER_POSITION_AND_LOOK,
+    SERVERBOUND_KEEP_ALIVE,
+    FakeServer,
+    frame,
+    offline_uuid,
+    pack_string,
+    read_frame,
+    unpack_string,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+def handshake(port, next_state):
+    return frame(
+        0x00,
+        encode_varint(340)
+        + pack_string("127.0.0.1")
+        + struct.pack(">H", port)
+        + encode_varint(next_state),
+    )
+
+
+async def login_and_listen(name, seconds):
+    server = await FakeServer(
+        port=0, chat_rate=50, correction_rate=20, keep_alive_interval=0.05
+    ).start()
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(handshake(server.port, 2) + frame(0x00, pack_string(name)))
+    seen = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    while loop.time() < deadline:
+        packet_id, payload = await read_frame(reader)
+        seen.append((packet_id, payload))
+        if packet_id == KEEP_ALIVE:
+            writer.write(frame(SERVERBOUND_KEEP_ALIVE, payload))
+    writer.close()
+    await server.stop()
+    return server, seen
+
+
+def test_offline_uuids_are_vanilla_ones():
+    assert str(offline_uuid("Notch")) == "b50ad385-829d-3141-a216-7e7d7539ba7f"
+
+
+def test_offline_login_and_load():
+    server, seen = asyncio.run(login_and_listen("bot", 0.3))
+    ids = [packet_id for packet_id, _ in seen]
+
+    assert ids[:4] == [
+        LOGIN_SUCCESS,
+        JOIN_GAME,
+        PLAYER_LIST_ITEM,
+        PLAYER_POSITION_AND_LOOK,
+    ]
+    player_uuid, offset = unpack_string(seen[0][1], 0)
+    assert player_uuid == str(offline_uuid("bot"))
+    assert unpack_string(seen[0][1], offset)[0] == "bot"
+
+    chats = [payload for packet_id, payload in seen if packet_id == CHAT_MESSAGE]
+    assert len(chats) > 5
+    assert "extra" in json.loads(unpack_string(chats[0], 0)[0])
+    assert ids.count(PLAYER_POSITION_AND_LOOK) > 2
+
+    stats = server.stats.as_dict()
+    assert stats["logins"] == 1 and stats["mean_setup_time"] is not None
+    assert stats["mean_keep_alive_rtt"] is not None
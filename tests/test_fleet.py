@@ -0,0 +1,101 @@
+import threading
+from functools import partial
+from optparse import Values
+
+import pytest
+
+from trashbags.fleet import Fleet, load_roster, parse_address
+from trashbags.supervisor import ConnectionSupervisor
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+ROSTER = """
+[DEFAULT]
+server = mc.example.org
+microsoft = yes
+
+[miner]
+username = miner@example.org
+
+[guard]
+server = [::1]:25566
+offline = yes
+"""
+
+
+class FakeConnection:
+    def __init__(self):
+        self.listeners = []
+        self.exception_handlers = []
+
+    def register_packet_listener(self, method, *packet_types, **kwargs):
+        self.listeners.append((method, packet_types))
+
+    def register_exception_handler(self, handler, *exc_types, **kwargs):
+        self.exception_handlers.append(handler)
+
+    def disconnect(self, immediate=False):
+        pass
+
+
+class FakeBot:
+    def __init__(self, options):
+        self.options = options
+        self.connection = None
+        self.tokens = None
+        self.auth_token = None
+
+    def login(self):
+        self.auth_token = object()
+
+    def connect(self):
+        self.connection = FakeConnection()
+
+    def register_packet_listeners(self):
+        pass
+
+
+def test_parse_address():
+    assert parse_address("example.org") == ("example.org", 25565)
+    assert parse_address("[::1]:1234") == ("::1", 1234)
+    with pytest.raises(ValueError):
+        parse_address("a:b:c")
+
+
+def test_roster_shares_auth_list(tmp_path):
+    path = tmp_path / "roster.ini"
+    path.write_text(ROSTER)
+    defaults = Values({"auth_list": ["uuid-1"], "offline": False, "server": None})
+
+    miner, guard = load_roster(str(path), defaults)
+
+    assert (miner.username, miner.address, miner.port) == (
+        "miner@example.org",
+        "mc.example.org",
+        25565,
+    )
+    assert (guard.username, guard.address, guard.port) == ("guard", "::1", 25566)
+    assert guard.offline and miner.microsoft
+    assert miner.auth_list is guard.auth_list is defaults.auth_list
+
+
+def test_fleet_starts_bots_and_shares_listeners():
+    roster = [Values({"name": f"bot{i}", "username": f"bot{i}"}) for i in range(3)]
+    supervisor = partial(ConnectionSupervisor, disconnect_packets=(), join_packet=str)
+    fleet = Fleet(
+        roster, stagger=0.001, bot_factory=FakeBot, supervisor_factory=supervisor
+    )
+    fleet.add_listener(lambda bot, packet: None, bytes)
+    started = threading.Event()
+    fleet.scheduler.call_later(0.05, started.set)
+
+    fleet.start()
+    assert started.wait(1)
+    fleet.scheduler.stop()
+
+    assert len(fleet.bots) == 3
+    for bot in fleet.bots:
+        assert [types for _, types in bot.connection.listeners][-1] == (bytes,)
+    assert set(fleet.memory_report()["startup"]) == {"bot0", "bot1", "bot2"}
@@ -0,0 +1,195 @@
+import io
+import logging
+import sys
+import threading
+import urllib.request
+
+from trashbags.metrics import (
+    LISTENER_CALLS,
+    LISTENER_SECONDS,
+    PACKET_BYTES,
+    PACKETS,
+    Metrics,
+)
+from trashbags.scheduler import Scheduler
+from trashbags.supervisor import SupervisorStats
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class KeepAlivePacket:
+    pass
+
+
+class FakeReactor:
+    def read_packet(self, stream, timeout=0):
+        length = stream.read(1)
+        if not length:
+            return None
+        stream.read(length[0])
+        return KeepAlivePacket()
+
+
+class FakeConnection:
+    def __init__(self):
+        self.reactor = FakeReactor()
+
+    def add_reactor_hook(self, hook):
+        hook(self.reactor)
+
+
+def test_packets_and_bytes_are_counted_per_type():
+    metrics = Metrics()
+    connection = FakeConnection()
+    metrics.attach(connection, "bot1")
+
+    stream = io.BytesIO(b"\x03abc\x01z")
+    assert isinstance(connection.reactor.read_packet(stream), KeepAlivePacket)
+    connection.reactor.read_packet(stream)
+    assert connection.reactor.read_packet(stream) is None
+
+    labels = (("bot", "bot1"), ("packet", "KeepAlivePacket"))
+    assert metrics.counters[PACKETS, labels] == 2
+    assert metrics.counters[PACKET_BYTES, labels] == 6
+
+
+def test_hot_listeners_are_sampled():
+    metrics = Metrics()
+    calls = []
+    handler = metrics.timed(calls.append, "world_handler", every=4)
+    for packet in range(10):
+        handler(packet)
+
+    labels = (("listener", "world_handler"),)
+    assert calls == list(range(10))
+    assert metrics.counters[LISTENER_CALLS, labels] == 10
+    assert metrics.histogram(LISTENER_SECONDS, labels).count == 2
+
+
+def test_counts_from_many_threads_add_up():
+    metrics = Metrics()
+    handler = metrics.timed(lambda packet: None, "chat_handler", every=2)
+    labels = (("bot", "bot1"), ("packet", "Chat"))
+
+    def count():
+        for _ in range(20000):
+            metrics.inc(PACKETS, labels)
+            handler(None)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    calls = (("listener", "chat_handler"),)
+    assert metrics.counters[PACKETS, labels] == 80000
+    assert metrics.counters[LISTENER_CALLS, calls] == 80000
+    assert metrics.histogram(LISTENER_SECONDS, calls).count == 40000
+
+
+def test_render_uses_the_text_format():
+    metrics = Metrics()
+    metrics.inc(PACKETS, (("bot", 'say "hi"'), ("packet", "Chat")), 3)
+    metrics.histogram(LISTENER_SECONDS, (("listener", "chat"),)).observe(0.002)
+    stats = SupervisorStats()
+    stats.reconnects = 2
+    metrics.watch_supervisors({"bot1": type("Supervisor", (), {"stats": stats})})
+
+    text = metrics.render()
+    assert "# TYPE trashbags_packets_received_total counter" in text
+    assert (
+        'trashbags_packets_received_total{bot="say \\"hi\\"",packet="Chat"} 3' in text
+    )
+    assert 'trashbags_listener_seconds_bucket{listener="chat",le="0.001"} 0' in text
+    assert 'trashbags_listener_seconds_bucket{listener="chat",le="0.005"} 1' in text
+    assert 'trashbags_listener_seconds_bucket{listener="chat",le="+Inf"} 1' in text
+    assert 'trashbags_listener_seconds_count{listener="chat"} 1' in text
+    assert 'trashbags_reconnects_total{bot="bot1"} 2' in text
+
+
+def test_failing_collectors_are_skipped(caplog):
+    metrics = Metrics()
+    metrics.inc("trashbags_test_total")
+    metrics.collect("trashbags_broken", "gauge", "Broken", lambda: 1 / 0)
+
+    with caplog.at_level(logging.ERROR):
+        text = metrics.render()
+    assert "trashbags_test_total 1" in text
+    assert "trashbags_broken" not in text
+    assert "Collecting trashbags_broken failed" in caplog.text
+
+
+def test_snapshot_and_log(caplog):
+    metrics = Metrics()
+    metrics.inc(PACKETS, (("bot", "bot1"), ("packet", "Chat")))
+    metrics.histogram(LISTENER_SECONDS, (("listener", "chat"),)).observe(0.002)
+
+    snapshot = metrics.snapshot()
+    assert snapshot[PACKETS] == {"bot=bot1,packet=Chat": 1}
+    assert snapshot[LISTENER_SECONDS]["listener=chat"]["p50"] == 0.005
+    with caplog.at_level(logging.INFO):
+        metrics.log()
+    assert '"bot=bot1,packet=Chat": 1' in caplog.text
+
+
+def test_http_endpoint():
+    metrics = Metrics().serve(0)
+    try:
+        metrics.inc("trashbags_test_total", value=5)
+        host, port = metrics.address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "trashbags_test_total 5" in response.read().decode()
+    finally:
+        metrics.close()
+
+
+def test_scheduler_lag_is_observed():
+    scheduler = Scheduler(clock=lambda: 1.5)
+    metrics = Metrics().watch_scheduler(scheduler)
+    scheduler.call_at(1.0, scheduler.stop, False)
+    scheduler._running = True
+    scheduler._run()
+
+    assert scheduler.lag == 0.5
+    assert scheduler.lag_histogram.count == 1
+    assert "trashbags_scheduler_lag_seconds_count 1" in metrics.render()
+
+
+def test_gathered_families_are_rendered():
+    worker = Metrics()
+    worker.inc(PACKETS, (("bot", "miner"),), 3)
+    worker.histogram(LISTENER_SECONDS).observe(0.002)
+    exported = worker.export()
+
+    metrics = Metrics().gather(
+        lambda: [
+            (name, kind, help, [((("worker", "0"),) + labels, value)])
+            for name, kind, help, samples in exported
+            for labels, value in samples
+        ]
+    )
+    text = metrics.render()
+    assert 'trashbags_packets_received_total{worker="0",bot="miner"} 3' in text
+    assert 'trashbags_listener_seconds_count{worker="0"} 1' in text
+    assert "# TYPE trashbags_listener_seconds histogram" in text
+
+
+def test_tick_loop_stats_are_collected():
+    from trashbags.ticks import TickLoop
+
+    ticks = TickLoop(Scheduler())
+    ticks.stats.overruns = 2
+    ticks.stats.durations.observe(0.003)
+    text = Metrics().watch_ticks(ticks).render()
+    assert "trashbags_ticks_overruns_total 2" in text
+    assert "trashbags_ticks_skipped_total 0" in text
+    assert "trashbags_tick_seconds_count 1" in text
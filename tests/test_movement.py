@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+from trashbags.movement import MovementQueue, plan_steps
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class RecordingBot:
+    def __init__(self):
+        self.connection = object()
+        self.position = (0.0, 0.0, 0.0)
+        self.rotation = (0.0, 0.0)
+        self.sent = []
+
+    def player_move(self, destination, rotation, on_ground=True):
+        self.sent.append(destination)
+
+
+def test_long_moves_are_split_into_legal_steps():
+    steps = plan_steps((0, 0, 0), [(1, 0, 0), (1, 0, 1)], 0.3)
+
+    assert steps[-1] == (1, 0, 1)
+    assert (1, 0, 0) in steps
+    positions = [(0, 0, 0)] + steps
+    assert max(math.dist(a, b) for a, b in zip(positions, positions[1:])) <= 0.3
+
+
+def test_numpy_paths_match_python_paths():
+    np = pytest.importorskip("numpy")
+    waypoints = [(1.0, 0.0, 0.0), (1.0, 2.0, 1.0)]
+
+    expected = plan_steps((0, 0, 0), waypoints, 0.25)
+    actual = plan_steps((0, 0, 0), np.array(waypoints), 0.25)
+
+    assert np.allclose(actual, expected)
+
+
+def test_superseded_targets_are_coalesced():
+    bot = RecordingBot()
+    queue = MovementQueue(bot, scheduler=None, speed=20)
+
+    queue.move_to((5, 0, 0))
+    queue.move_to((0.5, 0, 0))
+    queue.move_to((1, 0, 0))
+    while queue.flush():
+        pass
+
+    assert bot.sent == [(1, 0, 0)]
+    assert bot.position == (1, 0, 0)
+
+
+def test_steps_planned_before_a_correction_are_not_sent():
+    bot = RecordingBot()
+    queue = MovementQueue(bot, scheduler=None, speed=20)
+    queue.move_to((1, 0, 0))
+    teleports = queue.teleports
+
+    queue.placed((4, 0, 4), (0.0, 0.0))
+
+    assert not queue.send(teleports, (1, 0, 0), (0.0, 0.0))
+    assert bot.sent == [] and bot.position == (4, 0, 4)
@@ -0,0 +1,68 @@
+from trashbags.outbox import (
+    BROADCAST,
+    COMMAND,
+    HIGH,
+    LOW,
+    Outbox,
+    destination_of,
+    split_message,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ChatBot:
+    def __init__(self):
+        self.connection = object()
+        self.written = []
+
+    def write_chat(self, text):
+        self.written.append(text)
+
+
+def test_destinations():
+    assert destination_of("hello") == BROADCAST
+    assert destination_of("/msg Steve hi") == "steve"
+    assert destination_of("/tp 0 64 0") == COMMAND
+
+
+def test_long_whispers_keep_their_prefix():
+    chunks = split_message("/msg Steve " + "word " * 100)
+
+    assert (
+        " ".join(chunk[len("/msg Steve ") :] for chunk in chunks).split()
+        == ["word"] * 100
+    )
+    assert all(
+        len(chunk) <= 256 and chunk.startswith("/msg Steve ") for chunk in chunks
+    )
+
+
+def test_rate_limits_duplicates_and_priority():
+    clock = Clock()
+    bot = ChatBot()
+    outbox = Outbox(bot, None, rate=1, burst=2, destination_rate=1, clock=clock)
+
+    outbox.send("spam", LOW)
+    outbox.send("spam", LOW)
+    outbox.send("more spam", LOW)
+    outbox.send("/msg Steve done", HIGH)
+
+    assert outbox.dropped == 1
+    assert outbox.flush() == 2
+    assert bot.written == ["/msg Steve done", "spam"]
+
+    clock.now += 1
+    assert outbox.flush() == 1
+    assert outbox.depth == 0
+    assert outbox.stats()["sent"] == 3
@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from trashbags.pathfinding import Navigator, Pathfinder, Walkability
+from trashbags.world import Chunk
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# NumPy is the optional numpy extra
+np = pytest.importorskip("numpy")
+
+STONE = 1 << 4
+LAVA = 10 << 4
+
+
+def wall(world, x, z_range, height=2, y=3, state=STONE):
+    for z in z_range:
+        for dy in range(height):
+            world.set_block(x, y + dy, z, state)
+
+
+def test_straight_path_is_merged_into_waypoints(flat_world):
+    path = Pathfinder(flat_world()).find((1.5, 3, 1.5), (10, 3, 1))
+
+    assert path.complete
+    assert path.nodes[0] == (1, 3, 1) and path.nodes[-1] == (10, 3, 1)
+    assert len(path.nodes) == 10
+    assert path.waypoints == [(2.5, 3.0, 1.5), (10.5, 3.0, 1.5)]
+
+
+def test_walls_are_walked_around_and_steps_climbed(flat_world):
+    world = flat_world()
+    wall(world, 5, range(0, 12))
+    # One block high step at the far end of the wall
+    world.set_block(5, 3, 12, STONE)
+    wall(world, 5, range(13, 32))
+
+    path = Pathfinder(world).find((1, 3, 1), (9, 3, 1))
+    assert path.complete
+    assert (5, 4, 12) in path.nodes
+    assert all(node[0] != 5 or node == (5, 4, 12) for node in path.nodes)
+
+
+def test_lava_is_avoided_and_unreachable_goals_are_partial(flat_world):
+    world = flat_world()
+    for z in range(32):
+        world.set_block(5, 2, z, LAVA)
+
+    path = Pathfinder(world).find((1, 3, 1), (9, 3, 1))
+    assert not path.complete
+    assert path.nodes[-1][0] == 4
+
+
+def test_walkability_is_rebuilt_only_for_changed_chunks(flat_world):
+    world = flat_world()
+    pathfinder = Pathfinder(world)
+    pathfinder.find((1, 3, 1), (30, 3, 30))
+    built = pathfinder.walkability.built
+
+    pathfinder.find((1, 3, 1), (30, 3, 30))
+    assert pathfinder.walkability.built == built
+    world.set_block(20, 3, 20, STONE)
+    pathfinder.find((1, 3, 1), (30, 3, 30))
+    assert pathfinder.walkability.built == built + 1
+
+
+def test_walkability_forgets_chunks_the_world_dropped(flat_world):
+    world = flat_world(chunks=1)
+    walkability = Walkability(world)
+    chunk = world.chunks[0, 0]
+    # Chunks streaming past a moving bot, each unloaded after use
+    for chunk_x in range(1, 500):
+        world.chunks[chunk_x, 0] = Chunk(chunk_x, 0, {0: chunk.sections[0]})
+        assert walkability.grid(chunk_x, 0) is not None
+        world.unload(chunk_x, 0)
+
+    assert walkability.grid(0, 0) is not None
+    assert len(walkability._grids) <= 2 * len(world.chunks) + 64
+
+
+def test_time_budget_stops_the_search(flat_world):
+    world = flat_world(chunks=8)
+    wall(world, 64, range(0, 128), height=3)
+
+    path = Pathfinder(world).find((1, 3, 1), (120, 3, 1), budget=0)
+    assert not path.complete
+    assert path.expanded == 256
+
+
+class FakeMovement:
+    pending = 1
+
+
+class FakeBot:
+    def __init__(self):
+        self.position = (1.5, 3.0, 1.5)
+        self.movement = FakeMovement()
+        self.walked = []
+
+    def walk_path(self, waypoints, rotation=None):
+        self.walked.append(waypoints)
+
+
+class FakeTask:
+    def __init__(self, func):
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.tasks = []
+
+    def call_every(self, interval, func, *args):
+        task = FakeTask(func)
+        self.tasks.append(task)
+        return task
+
+    def tick(self):
+        for task in list(self.tasks):
+            if not task.cancelled:
+                task.func()
+
+
+def test_navigator_replans_when_the_way_is_blocked(flat_world):
+    world = flat_world()
+    bot = FakeBot()
+    navigator = Navigator(bot, Pathfinder(world), FakeScheduler())
+    navigator.go((12, 3, 1))
+    assert len(bot.walked) == 1
+
+    world.set_block(25, 3, 25, STONE)
+    navigator.check()
+    assert len(bot.walked) == 1
+
+    wall(world, 6, range(0, 4))
+    navigator.check()
+    assert navigator.replans == 1
+    assert (6, 3, 1) not in navigator.path.nodes
+
+    bot.movement.pending = 0
+    bot.position = (12.5, 3.0, 1.5)
+    navigator.check()
+    assert navigator.goal is None
+
+
+def test_replans_run_on_the_executor_and_keep_the_valid_prefix(flat_world):
+    world = flat_world()
+    bot = FakeBot()
+    scheduler = FakeScheduler()
+    with ThreadPoolExecutor(1) as executor:
+        navigator = Navigator(bot, Pathfinder(world), scheduler, executor=executor)
+        first = navigator.go((12, 3, 1))
+        bot.position = (3.5, 3.0, 1.5)
+
+        wall(world, 8, range(0, 4))
+        navigator.check()
+        assert navigator.path is first and len(bot.walked) == 1
+        search, _, prefix = navigator._search
+        assert prefix == first.nodes[first.nodes.index((3, 3, 1)) : 7]
+        search.result()
+        scheduler.tick()
+
+    path = navigator.path
+    assert navigator._search is None and navigator.replans == 1
+    assert path.nodes[: len(prefix)] == prefix
+    assert (8, 3, 1) not in path.nodes and path.nodes[-1] == (12, 3, 1)
+    # Walked on from where the bot is
+    assert path.nodes[0] == (3, 3, 1) and bot.walked[-1] == path.waypoints
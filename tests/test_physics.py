@@ -0,0 +1,194 @@
+import pytest
+
+from trashbags.movement import MovementQueue
+from trashbags.pathfinding import Walkability
+from trashbags.physics import STUCK_TICKS, PhysicsEngine
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# NumPy is the optional numpy extra
+np = pytest.importorskip("numpy")
+
+STONE = 1 << 4
+
+
+class Options:
+    username = "bot"
+
+
+class FakeBot:
+    def __init__(self, position):
+        self.connection = object()
+        self.spawned = True
+        self.options = Options()
+        self.position = position
+        self.rotation = (0.0, 0.0)
+        self.movement = MovementQueue(self, scheduler=None)
+        self.sent = []
+
+    def player_move(self, destination, rotation, on_ground=True):
+        self.sent.append((destination, on_ground))
+
+
+def engine_with(world, *positions):
+    engine = PhysicsEngine()
+    bots = [FakeBot(position) for position in positions]
+    walkability = Walkability(world)
+    for bot in bots:
+        engine.add(bot, walkability)
+    return engine, bots
+
+
+def run(engine, ticks):
+    for _ in range(ticks):
+        engine.tick()
+
+
+def test_bots_fall_and_land_on_the_floor(flat_world):
+    engine, (bot,) = engine_with(flat_world(), (5.5, 10.0, 5.5))
+    run(engine, 40)
+
+    assert bot.position == (5.5, 3.0, 5.5)
+    heights = [position[1] for position, _ in bot.sent]
+    assert heights == sorted(heights, reverse=True)
+    # Vanilla gravity: 0.08 a tick, less 2% drag
+    assert heights[0] == pytest.approx(10 - 0.0784)
+    assert [on_ground for _, on_ground in bot.sent[:-1]] == [False] * (
+        len(bot.sent) - 1
+    )
+    assert bot.sent[-1] == ((5.5, 3.0, 5.5), True)
+
+
+def test_bots_standing_still_send_nothing(flat_world):
+    engine, (bot,) = engine_with(flat_world(), (5.5, 3.0, 5.5))
+    run(engine, 5)
+    assert bot.sent == [((5.5, 3.0, 5.5), True)]
+    run(engine, 5)
+    assert len(bot.sent) == 1 and bot.position == (5.5, 3.0, 5.5)
+
+
+def test_bots_wait_for_the_server_to_place_them(flat_world):
+    engine, (bot,) = engine_with(flat_world(), (5.5, 10.0, 5.5))
+    bot.spawned = False
+    run(engine, 5)
+    assert bot.sent == [] and bot.position == (5.5, 10.0, 5.5)
+
+    bot.spawned = True
+    run(engine, 2)
+    assert len(bot.sent) == 1
+
+
+def test_a_failing_send_does_not_stop_the_other_bots(caplog, flat_world):
+    engine, (broken, bot) = engine_with(
+        flat_world(), (5.5, 10.0, 5.5), (8.5, 10.0, 8.5)
+    )
+
+    def player_move(destination, rotation, on_ground=True):
+        raise BrokenPipeError("connection lost")
+
+    broken.player_move = player_move
+    run(engine, 5)
+
+    # Nothing to send on the first tick, the fall starts on the second
+    assert len(bot.sent) == 4
+    assert broken.position == (5.5, 10.0, 5.5)
+    assert "Moving bot failed" in caplog.text
+
+
+def test_corrections_during_a_tick_win(monkeypatch, flat_world):
+    engine, (bot,) = engine_with(flat_world(), (5.5, 10.0, 5.5))
+    run(engine, 3)
+    sent = len(bot.sent)
+    step = engine.step
+
+    # The server's correction lands while the tick computes the fall
+    def corrected_step(*args):
+        bot.movement.placed((9.5, 3.0, 9.5), (0.0, 0.0))
+        engine.reset(bot)
+        return step(*args)
+
+    monkeypatch.setattr(engine, "step", corrected_step)
+    engine.tick()
+    monkeypatch.undo()
+
+    assert bot.position == (9.5, 3.0, 9.5) and len(bot.sent) == sent
+    run(engine, 2)
+    assert bot.sent[-1] == ((9.5, 3.0, 9.5), True)
+
+
+def test_walls_stop_walks(flat_world):
+    world = flat_world()
+    for y in range(3, 8):
+        for z in range(16):
+            world.set_block(8, y, z, STONE)
+    engine, (bot,) = engine_with(world, (5.5, 3.0, 5.5))
+    bot.movement.move_to((10.5, 3.0, 5.5))
+    run(engine, 30 + STUCK_TICKS)
+
+    assert bot.position[0] == pytest.approx(7.7, abs=0.22)
+    assert bot.position[0] <= 7.7
+    assert max(position[0] for position, _ in bot.sent) <= 7.7
+    assert bot.movement.pending == 0
+    assert engine.jumps > 0
+
+
+def test_steps_are_jumped_onto(flat_world):
+    world = flat_world()
+    for z in range(16):
+        world.set_block(8, 3, z, STONE)
+    engine, (bot,) = engine_with(world, (5.5, 3.0, 5.5))
+    bot.movement.move_to((8.5, 4.0, 5.5))
+    run(engine, 40)
+
+    assert bot.position == pytest.approx((8.5, 4.0, 5.5))
+    assert bot.sent[-1][1]
+    assert engine.jumps >= 1
+    # Never inside the step
+    assert all(y >= 4.0 for (x, y, _), _ in bot.sent if x + 0.3 > 8)
+
+
+def test_ceilings_stop_jumps(flat_world):
+    world = flat_world()
+    world.set_block(5, 5, 5, STONE)
+    engine, (bot,) = engine_with(world, (5.5, 3.0, 5.5))
+    run(engine, 1)
+    engine.velocity[0] = 0.42
+    run(engine, 1)
+    assert bot.position[1] == pytest.approx(5 - 1.8)
+    run(engine, 20)
+    assert bot.position[1] == 3.0
+
+
+def test_unloaded_chunks_hold_bots_in_place(flat_world):
+    engine, (bot,) = engine_with(flat_world(chunks=1), (40.5, 20.0, 40.5))
+    run(engine, 10)
+    assert bot.position == (40.5, 20.0, 40.5)
+
+
+def test_many_bots_step_in_one_batch(flat_world):
+    world = flat_world(chunks=4)
+    rng = np.random.default_rng(1)
+    starts = [
+        (float(x), float(y), float(z))
+        for x, y, z in zip(
+            rng.uniform(1, 63, 100), rng.uniform(4, 30, 100), rng.uniform(1, 63, 100)
+        )
+    ]
+    engine, bots = engine_with(world, *starts)
+    bots[0].connection = None
+    run(engine, 60)
+
+    assert bots[0].position == starts[0] and not bots[0].sent
+    assert all(bot.position[1] == 3.0 for bot in bots[1:])
+
+
+def test_resets_forget_the_speed(flat_world):
+    engine, (bot,) = engine_with(flat_world(), (5.5, 30.0, 5.5))
+    run(engine, 10)
+    assert engine.velocity[0] < -0.5
+    engine.reset(bot)
+    assert engine.velocity[0] == 0.0
+    engine.remove(bot)
+    assert engine.bots == [] and len(engine.velocity) == 0
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+from trashbags.players import PlayerRegistry
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+def packet(action_name, *actions):
+    return SimpleNamespace(
+        action_type=type(action_name, (), {}),
+        actions=[SimpleNamespace(**action) for action in actions],
+    )
+
+
+def test_batched_add_and_remove():
+    players = PlayerRegistry()
+    players.apply(
+        packet(
+            "AddPlayerAction",
+            {"uuid": "u1", "name": "Steve", "gamemode": 0, "ping": 10},
+            {"uuid": "u2", "name": "Alex", "gamemode": 1, "ping": 20},
+        )
+    )
+
+    assert len(players) == 2
+    assert players.uuid_of("Alex") == "u2"
+    assert players.name_of("u1") == "Steve"
+
+    players.apply(packet("RemovePlayerAction", {"uuid": "u1"}))
+
+    assert "u1" not in players
+    assert players.uuid_of("Steve") is None
+    assert players.uuid_of("Alex") == "u2"
+
+
+def test_updates_and_renames():
+    players = PlayerRegistry()
+    players.add("u1", "Steve")
+    players.apply(packet("UpdateLatencyAction", {"uuid": "u1", "ping": 99}))
+    players.apply(packet("UpdateGameModeAction", {"uuid": "u1", "gamemode": 3}))
+    players.apply(packet("UpdateLatencyAction", {"uuid": "missing", "ping": 1}))
+    players.add("u1", "Steve2", gamemode=3, ping=99)
+
+    entry = players.get("u1")
+    assert (entry.name, entry.ping, entry.gamemode) == ("Steve2", 99, 3)
+    assert players.by_name("Steve") is None
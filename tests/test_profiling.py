@@ -0,0 +1,95 @@
+import threading
+import time
+
+from trashbags.profiling import Profiler
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class ChatMessagePacket:
+    pass
+
+
+class PositionPacket:
+    pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.written = []
+
+    def write_packet(self, packet, force=False):
+        self.written.append((packet, force))
+
+
+def test_handlers_are_timed_per_packet_type():
+    ticks = iter(range(100))
+    profiler = Profiler(clock=lambda: next(ticks))
+    seen = []
+    handler = profiler.wrap(seen.append, "chat_handler")
+    handler(ChatMessagePacket())
+    handler(ChatMessagePacket())
+    handler(PositionPacket())
+
+    assert len(seen) == 3
+    stats = profiler.handlers["chat_handler", "ChatMessagePacket"]
+    assert (stats.calls, stats.total, stats.worst) == (2, 2, 1)
+    assert profiler.handlers["chat_handler", "PositionPacket"].calls == 1
+    assert profiler._tags == {}
+
+
+def test_writes_are_wrapped():
+    profiler = Profiler()
+    connection = FakeConnection()
+    profiler.wrap_writes(connection)
+    packet = PositionPacket()
+    connection.write_packet(packet, force=True)
+
+    assert connection.written == [(packet, True)]
+    assert profiler.handlers["write_packet", "PositionPacket"].calls == 1
+
+
+def test_samples_are_tagged_with_the_running_handler():
+    profiler = Profiler()
+    running = threading.Event()
+    done = threading.Event()
+
+    def slow_handler(packet):
+        running.set()
+        done.wait(5)
+
+    handler = profiler.wrap(slow_handler)
+    assert handler.__name__ == "slow_handler"
+    thread = threading.Thread(
+        target=handler, args=(ChatMessagePacket(),), name="pycraft-reader"
+    )
+    thread.start()
+    running.wait(5)
+    profiler.sample()
+    done.set()
+    thread.join()
+
+    (stack,) = [stack for stack in profiler.stacks if stack.startswith("pycraft")]
+    frames = stack.split(";")
+    assert frames[:2] == ["pycraft-reader", "[slow_handler ChatMessagePacket]"]
+    assert frames[-1].startswith("wait (threading.py")
+    assert any(frame.startswith("slow_handler (test_profiling.py") for frame in frames)
+
+
+def test_collapsed_stacks_and_report(tmp_path):
+    profiler = Profiler(interval=0.001).start()
+    handler = profiler.wrap(lambda packet: time.sleep(0.02), "user_handler")
+    handler(PositionPacket())
+    profiler.stop()
+
+    path = tmp_path / "bot.folded"
+    profiler.write_collapsed(path)
+    lines = path.read_text().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) >= profiler.samples
+
+    report = profiler.report().splitlines()
+    assert report[0].split()[:2] == ["handler", "packet"]
+    assert report[1].split()[:3] == ["user_handler", "PositionPacket", "1"]
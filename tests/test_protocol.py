@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+import pytest
+
+from trashbags import protocol
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+IMPORTS = """
+import sys
+import trashbags.trashbag
+heavy = ("minecraft", "numpy", "http.server", "importlib.metadata")
+print(",".join(name for name in heavy if name in sys.modules))
+"""
+
+
+def test_importing_the_bot_defers_heavy_modules():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORTS], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_version_is_looked_up_on_demand():
+    import trashbags
+
+    assert isinstance(trashbags.__version__, str)
+    with pytest.raises(AttributeError):
+        trashbags.no_such_thing
+
+
+def test_prebuild_does_not_fail_without_pycraft():
+    thread = protocol.prebuild()
+    thread.join(30)
+    assert not thread.is_alive()
+
+
+def test_registry_is_built_once():
+    pytest.importorskip("minecraft")
+    packets = protocol.registry()
+    assert protocol.registry() is packets
+    assert packets.clientbound_ids[0x0F] is packets.clientbound.ChatMessagePacket
+    assert packets.serverbound_ids[0x02] is packets.serverbound.ChatPacket
@@ -0,0 +1,37 @@
+from trashbags.replay import FakeConnection, ReplayEngine, replay_options
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class Chat:
+    pass
+
+
+class Position:
+    pass
+
+
+def test_replay_times_each_listener():
+    connection = FakeConnection()
+    seen = []
+    connection.register_packet_listener(seen.append, Chat)
+    connection.register_packet_listener(lambda packet: None, Position)
+    connection.register_packet_listener(lambda packet: None, object, early=True)
+    engine = ReplayEngine(connection, trace_allocations=True)
+
+    summary = engine.replay([(0.0, Chat()), (0.001, Position()), Chat()], realtime=True)
+
+    assert len(seen) == 2 and engine.packets == 3
+    assert summary["list.append"]["calls"] == 2
+    assert sum(stats["calls"] for stats in summary.values()) == 6
+    assert summary["list.append"]["p99_us"] is not None
+    assert "alloc_bytes_per_packet" in summary["list.append"]
+
+
+def test_replay_options_cover_what_the_bot_reads():
+    options = replay_options(username="steve")
+
+    assert options.username == "steve"
+    assert not options.dump_packets and options.capture is None
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+
+from trashbags.runtime import Runtime
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+def test_listeners_run_on_the_loop_in_order():
+    async def scenario():
+        runtime = await Runtime().start()
+        seen = []
+        listener = runtime.listener(
+            lambda packet: seen.append((packet, threading.get_ident()))
+        )
+        thread = threading.Thread(target=lambda: [listener(i) for i in range(5)])
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0.01)
+        runtime.close()
+        return seen, runtime.stats()
+
+    seen, stats = asyncio.run(scenario())
+    assert [packet for packet, _ in seen] == list(range(5))
+    assert {ident for _, ident in seen} == {threading.get_ident()}
+    assert stats["loop"] == {"pending": 0, "dispatched": 5, "dropped": 0, "waits": 0}
+
+
+def test_full_lane_drops_sheddable_packets():
+    async def scenario():
+        runtime = await Runtime(workers=1, max_pending=2).start()
+        release = threading.Event()
+        listener = runtime.listener(
+            lambda packet: release.wait(1), blocking=True, sheddable=True
+        )
+        for i in range(5):
+            listener(i)
+        dropped = runtime.worker_lane.dropped
+        release.set()
+        await runtime.run_blocking(lambda: None)
+        runtime.close()
+        return dropped
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_full_lane_holds_the_network_thread():
+    async def scenario():
+        runtime = await Runtime(workers=1, max_pending=2).start()
+        seen = []
+        release = threading.Event()
+
+        def handler(packet):
+            release.wait(1)
+            seen.append(packet)
+
+        listener = runtime.listener(handler, blocking=True)
+        network = threading.Thread(target=lambda: [listener(i) for i in range(5)])
+        network.start()
+        await asyncio.sleep(0.05)
+        # Two calls queued, the third waits for room on the network thread
+        held = network.is_alive()
+        release.set()
+        network.join()
+        await runtime.run_blocking(lambda: None)
+        runtime.close()
+        return held, seen, runtime.stats()["workers"]
+
+    held, seen, stats = asyncio.run(scenario())
+    assert held
+    assert seen == list(range(5))
+    assert stats["dropped"] == 0 and stats["waits"] >= 1
+
+
+def test_failing_listener_is_logged_and_released(caplog):
+    async def scenario():
+        runtime = await Runtime().start()
+        listener = runtime.listener(lambda packet: 1 / 0)
+        listener("packet")
+        await asyncio.sleep(0.01)
+        runtime.close()
+        return runtime.loop_lane.pending
+
+    assert asyncio.run(scenario()) == 0
+    assert "failed" in caplog.text
+
+
+def test_lines_are_read_from_a_pipe():
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"test\noutbox\r\n")
+    os.close(write_fd)
+
+    async def scenario():
+        runtime = await Runtime().start()
+        with os.fdopen(read_fd, "rb") as stream:
+            lines = [line async for line in runtime.lines(stream)]
+            # Left blocking, a terminal shares it with stdout
+            assert os.get_blocking(read_fd)
+        runtime.close()
+        return lines
+
+    assert asyncio.run(scenario()) == ["test", "outbox"]
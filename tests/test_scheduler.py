@@ -0,0 +1,30 @@
+import threading
+
+from trashbags.scheduler import Scheduler
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+def test_callbacks_run_in_time_order():
+    scheduler = Scheduler().start()
+    done = threading.Event()
+    order = []
+    scheduler.call_later(0.02, order.append, "late")
+    scheduler.call_later(0.01, order.append, "early")
+    scheduler.call_later(0.03, done.set)
+
+    assert done.wait(1)
+    scheduler.stop()
+    assert order == ["early", "late"]
+
+
+def test_periodic_task_can_be_cancelled():
+    scheduler = Scheduler().start()
+    ran = threading.Semaphore(0)
+    task = scheduler.call_every(0.005, ran.release)
+
+    assert ran.acquire(timeout=1) and ran.acquire(timeout=1)
+    task.cancel()
+    scheduler.stop()
@@ -0,0 +1,89 @@
+from optparse import Values
+
+import pytest
+
+from trashbags.commands import CommandRouter
+from trashbags.metrics import PACKETS, Metrics
+from trashbags.shards import ShardPool, ShardWorker, assign
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class FakeFleet:
+    def __init__(self, accounts):
+        self.bots = [options.name for options in accounts]
+
+    def add(self, options):
+        self.bots.append(options.name)
+
+
+def fake_shard(index, accounts, channel):
+    fleet = FakeFleet(accounts)
+    router = CommandRouter()
+
+    @router.command("who")
+    def who(context):
+        for bot in context.bots:
+            context.reply(bot)
+
+    metrics = Metrics()
+    metrics.inc(PACKETS, (("bot", fleet.bots[0]),))
+    ShardWorker(channel, fleet, router, metrics).serve()
+
+
+def roster(*names):
+    return [Values({"name": name, "username": name}) for name in names]
+
+
+@pytest.fixture
+def pool():
+    pool = ShardPool(roster("a", "b", "c"), fake_shard, processes=2).start()
+    yield pool
+    pool.stop()
+
+
+def who(pool):
+    lines = []
+    pool.dispatch("who", lines.append)
+    return sorted(lines)
+
+
+def test_assign_deals_round_robin():
+    assert assign(list("abcde"), 2) == [["a", "c", "e"], ["b", "d"]]
+    assert ShardPool(roster("a"), fake_shard, processes=8).processes == 1
+
+
+def test_commands_fan_out_to_every_worker(pool):
+    assert pool.status() == {0: ["a", "c"], 1: ["b"]}
+    assert who(pool) == ["[0] a", "[0] c", "[1] b"]
+
+    exported = pool.export()
+    samples = [sample for name, _, _, s in exported if name == PACKETS for sample in s]
+    assert sorted(samples) == [
+        ((("worker", "0"), ("bot", "a")), 1),
+        ((("worker", "1"), ("bot", "b")), 1),
+    ]
+
+
+def test_accounts_of_a_dead_worker_are_moved(pool):
+    dead = pool.shards[0]
+    dead.process.kill()
+    dead.process.join(5)
+    pool.check()
+
+    assert pool.deaths == 1
+    assert pool.status() == {1: ["b", "a", "c"]}
+    assert who(pool) == ["[1] a", "[1] b", "[1] c"]
+
+
+def test_a_new_worker_is_started_when_none_survive(pool):
+    for shard in pool.shards:
+        shard.process.kill()
+        shard.process.join(5)
+    pool.check()
+
+    assert pool.deaths == 2
+    assert pool.status() == {2: ["a", "c", "b"]}
+    assert who(pool) == ["[2] a", "[2] b", "[2] c"]
@@ -0,0 +1,284 @@
+import json
+import os
+from optparse import Values
+
+import pytest
+
+from trashbags.auth import DEFAULT_ACCOUNT
+from trashbags.players import PlayerRegistry
+from trashbags.scheduler import Scheduler
+from trashbags.snapshots import Snapshotter, decode_chunk, encode_chunk
+from trashbags.trashbag import Trashbag
+from trashbags.world import Chunk, ChunkSection, WorldCache
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# NumPy is the optional numpy extra
+np = pytest.importorskip("numpy")
+
+STONE = 1 << 4
+DIRT = 3 << 4
+
+
+class Action:
+    def __init__(self, uuid):
+        self.uuid = uuid
+
+
+class AddPlayerAction:
+    pass
+
+
+class PlayerListItemPacket:
+    action_type = AddPlayerAction
+
+    def __init__(self, *uuids):
+        self.actions = [Action(uuid) for uuid in uuids]
+
+
+class FakeBot:
+    def __init__(self, port=25565):
+        self.options = Values(
+            {"username": "miner", "address": "mc.example.org", "port": port}
+        )
+        self.auth_token = None
+        self.position = (0.0, 0.0, 0.0)
+        self.rotation = (0.0, 0.0)
+        self.players = PlayerRegistry()
+        self.world = WorldCache()
+
+
+def filled_world(world, chunks=3):
+    world.set_dimension(0)
+    states = np.zeros((16, 16, 16), dtype=np.uint32)
+    states[:4] = STONE
+    for chunk_x in range(chunks):
+        for chunk_z in range(chunks):
+            sections = {0: ChunkSection.from_states(states)}
+            if chunk_x == chunk_z:
+                sections[5] = ChunkSection.from_states(np.arange(4096) << 4)
+            world.chunks[chunk_x, chunk_z] = Chunk(chunk_x, chunk_z, sections)
+    return world
+
+
+def saved_bot(path):
+    bot = FakeBot()
+    filled_world(bot.world)
+    bot.position = (10.5, 4.0, -3.25)
+    bot.rotation = (90.0, 10.0)
+    bot.players.add("uuid-1", "alice", 0, 35)
+    bot.players.add("uuid-2", "bob", 1, 120)
+    snapshots = Snapshotter(str(path), bot)
+    snapshots.save()
+    return bot, snapshots
+
+
+def test_records_round_trip():
+    world = filled_world(WorldCache(), chunks=1)
+    chunk = world.chunks[0, 0]
+    record = encode_chunk(chunk)
+    decoded, length = decode_chunk(record)
+    assert length == len(record)
+    assert (decoded.x, decoded.z) == (0, 0)
+    assert decoded.get(3, 3, 3) == STONE and decoded.get(3, 4, 3) == 0
+    assert decoded.get(1, 80, 2) == ((0 * 256 + 2 * 16 + 1) << 4)
+    assert decoded.sections[5].blocks.dtype == np.uint16
+
+
+def test_state_is_restored_from_a_mapped_log(tmp_path):
+    saved_bot(tmp_path)
+    bot = FakeBot()
+    snapshots = Snapshotter(str(tmp_path), bot)
+    assert snapshots.restore()
+    log = snapshots.chunks_path
+
+    assert bot.position == (10.5, 4.0, -3.25) and bot.rotation == (90.0, 10.0)
+    assert bot.players.by_name("bob").ping == 120
+    assert len(bot.world) == 9 and bot.world.nbytes > 0
+    assert bot.world.block_at(20, 3, 20) == STONE
+    assert bot.world.block_at(33, 90, 35) == ((10 * 256 + 3 * 16 + 1) << 4)
+    section = bot.world.chunks[1, 1].sections[0]
+    assert not section.blocks.flags.owndata
+
+    # Mapped copy-on-write, the world changes without touching the file
+    size = os.path.getsize(log)
+    bot.world.set_block(20, 3, 20, DIRT)
+    assert bot.world.block_at(20, 3, 20) == DIRT
+    assert os.path.getsize(log) == size
+    assert Snapshotter(str(tmp_path), FakeBot()).restore()
+
+
+def test_snapshots_of_other_servers_are_ignored(tmp_path):
+    saved_bot(tmp_path)
+    bot = FakeBot(port=25566)
+    assert not Snapshotter(str(tmp_path), bot).restore()
+    assert bot.position == (0.0, 0.0, 0.0) and len(bot.world) == 0
+    assert not Snapshotter(str(tmp_path / "missing"), bot).restore()
+
+
+def test_saves_only_append_changed_chunks(tmp_path):
+    bot, snapshots = saved_bot(tmp_path)
+    log = snapshots.chunks_path
+    size = os.path.getsize(log)
+    snapshots.save()
+    assert os.path.getsize(log) == size
+
+    bot.world.set_block(16, 3, 0, DIRT)
+    record = len(encode_chunk(bot.world.chunks[1, 0]))
+    snapshots.save()
+    assert snapshots.chunks_path == log
+    assert os.path.getsize(log) == size + record
+
+    restored = FakeBot()
+    Snapshotter(str(tmp_path), restored).restore()
+    assert restored.world.block_at(16, 3, 0) == DIRT
+
+
+def test_superseded_records_are_compacted(tmp_path):
+    bot, snapshots = saved_bot(tmp_path)
+    first = snapshots.chunks_path
+    size = os.path.getsize(first)
+    for round in range(30):
+        for chunk in bot.world.chunks.values():
+            chunk.version += 1
+        snapshots.save()
+    assert snapshots.chunks_path != first and not os.path.exists(first)
+    assert os.path.getsize(snapshots.chunks_path) < 3 * size + 2**20
+    assert [name for name in os.listdir(tmp_path) if name.startswith("chunks")] == [
+        os.path.basename(snapshots.chunks_path)
+    ]
+
+    restored = FakeBot()
+    Snapshotter(str(tmp_path), restored).restore()
+    assert len(restored.world) == 9
+    assert restored.world.block_at(5, 1, 5) == STONE
+
+
+def test_a_crash_while_compacting_keeps_the_last_snapshot(tmp_path, monkeypatch):
+    bot, snapshots = saved_bot(tmp_path)
+    for chunk in bot.world.chunks.values():
+        chunk.version += 1
+    snapshots.save()
+    state = (tmp_path / "state.json").read_bytes()
+
+    # Compacts, then dies after writing the new log, before replacing state.json
+    compact = snapshots._compact
+    compacted = []
+
+    def compacting(kept, path):
+        compacted.append(path)
+        return compact(kept, path)
+
+    def crash(*args):
+        raise OSError("killed")
+
+    monkeypatch.setattr(os.path, "getsize", lambda path: 2**30)
+    monkeypatch.setattr(snapshots, "_compact", compacting)
+    monkeypatch.setattr(os, "replace", crash)
+    for chunk in bot.world.chunks.values():
+        chunk.version += 1
+    with pytest.raises(OSError, match="killed"):
+        snapshots.save()
+    monkeypatch.undo()
+    assert compacted and os.path.exists(compacted[0])
+
+    assert (tmp_path / "state.json").read_bytes() == state
+    restored = FakeBot()
+    assert Snapshotter(str(tmp_path), restored).restore()
+    assert len(restored.world) == 9
+    assert restored.world.block_at(5, 1, 5) == STONE
+
+
+def test_snapshots_not_matching_their_log_are_ignored(tmp_path, caplog):
+    _, snapshots = saved_bot(tmp_path)
+    state = json.loads((tmp_path / "state.json").read_text())
+    # Offsets of another chunk, and past the end of the log
+    state["chunks"][0][:2] = [7, 7]
+    (tmp_path / "state.json").write_text(json.dumps(state))
+
+    bot = FakeBot()
+    assert not Snapshotter(str(tmp_path), bot).restore()
+    assert "Ignoring the snapshot" in caplog.text
+    assert bot.position == (0.0, 0.0, 0.0) and len(bot.world) == 0
+    assert len(bot.players) == 0
+
+    state["chunks"][0][2] = os.path.getsize(snapshots.chunks_path)
+    (tmp_path / "state.json").write_text(json.dumps(state))
+    assert not Snapshotter(str(tmp_path), FakeBot()).restore()
+
+
+def test_stale_data_is_reconciled(tmp_path, clock):
+    saved_bot(tmp_path)
+    bot = FakeBot()
+    snapshots = Snapshotter(str(tmp_path), bot, grace=5.0, clock=clock)
+    snapshots.restore()
+    assert snapshots.stale() == {"players": 2, "chunks": 9}
+
+    # Joining the same dimension keeps the restored chunks
+    bot.world.set_dimension(0, keep=snapshots.resumes(0))
+    assert len(bot.world) == 9
+    assert not snapshots.resumes(0)
+
+    snapshots.connected()
+    snapshots.seen(PlayerListItemPacket("uuid-2"))
+    bot.world.chunks[0, 0] = Chunk(0, 0)
+    assert snapshots.expire() == 0
+    clock.now = 6.0
+    assert snapshots.expire() == 1
+
+    assert bot.players.by_name("alice") is None
+    assert bot.players.by_name("bob") is not None
+    assert snapshots.stale() == {"players": 0, "chunks": 8}
+
+
+def test_other_dimensions_drop_the_restored_world(tmp_path):
+    saved_bot(tmp_path)
+    bot = FakeBot()
+    snapshots = Snapshotter(str(tmp_path), bot)
+    snapshots.restore()
+    bot.world.set_dimension(-1, keep=snapshots.resumes(-1))
+    assert len(bot.world) == 0 and not bot.world.has_sky
+
+
+def test_close_saves_one_last_time(tmp_path):
+    bot = FakeBot()
+    scheduler = Scheduler()
+    snapshots = Snapshotter(str(tmp_path), bot, interval=3600).start(scheduler)
+    bot.position = (1.0, 2.0, 3.0)
+    snapshots.close()
+    scheduler.stop()
+
+    restored = FakeBot()
+    assert Snapshotter(str(tmp_path), restored).restore()
+    assert restored.position == (1.0, 2.0, 3.0)
+
+
+def test_checks_save_every_interval(tmp_path, clock):
+    bot = FakeBot()
+    snapshots = Snapshotter(str(tmp_path), bot, interval=30, clock=clock)
+    snapshots._next_save = clock() + snapshots.interval
+
+    snapshots.check()
+    assert snapshots.saves == 0
+    clock.now = 30
+    snapshots.check()
+    snapshots.check()
+    assert snapshots.saves == 1
+
+
+def test_bots_without_a_username_use_the_default_account(tmp_path):
+    options = Values(
+        {
+            "username": None,
+            "auth_list": None,
+            "world_memory": 0,
+            "snapshots": str(tmp_path),
+            "address": "mc.example.org",
+            "port": 25565,
+        }
+    )
+    bot = Trashbag(options)
+
+    assert bot.snapshots.path == os.path.join(str(tmp_path), DEFAULT_ACCOUNT)
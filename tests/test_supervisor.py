@@ -0,0 +1,116 @@
+import threading
+from types import SimpleNamespace
+
+from trashbags.scheduler import Scheduler
+from trashbags.supervisor import Backoff, ConnectionSupervisor
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class Kick:
+    pass
+
+
+class Join:
+    pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.listeners = []
+        self.exception_handlers = []
+
+    def register_packet_listener(self, method, *packet_types, **kwargs):
+        self.listeners.append((method, packet_types))
+
+    def register_exception_handler(self, handler, *exc_types, **kwargs):
+        self.exception_handlers.append(handler)
+
+    def disconnect(self, immediate=False):
+        pass
+
+    def receive(self, packet):
+        for method, packet_types in self.listeners:
+            if isinstance(packet, packet_types):
+                method(packet)
+
+
+class FlakyBot:
+    """Refuses the first ``failures`` connects, then joins straight away."""
+
+    def __init__(self, failures=0):
+        self.options = SimpleNamespace(username="flaky")
+        self.tokens = None
+        self.auth_token = "cached"
+        self.connection = None
+        self.failures = failures
+        self.logins = 0
+        self.registrations = 0
+        self.connected = threading.Event()
+
+    def login(self):
+        self.logins += 1
+
+    def connect(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError()
+        self.connection = FakeConnection()
+
+    def register_packet_listeners(self):
+        self.registrations += 1
+        self.connected.set()
+
+
+def supervise(bot):
+    return ConnectionSupervisor(
+        bot,
+        Scheduler(),
+        backoff=Backoff(base=0.001, cap=0.01),
+        disconnect_packets=(Kick,),
+        join_packet=Join,
+    )
+
+
+def test_backoff_grows_and_is_capped():
+    backoff = Backoff(base=1, cap=10, jitter=0)
+
+    assert [backoff.delay(n) for n in range(5)] == [1, 2, 4, 8, 10]
+    assert 5 <= Backoff(base=10, jitter=0.5).delay(0) <= 10
+
+
+def test_kick_reconnects_with_cached_token():
+    bot = FlakyBot()
+    supervisor = supervise(bot)
+    assert supervisor.start()
+    first = bot.connection
+    first.receive(Join())
+
+    bot.connected.clear()
+    first.receive(Kick())
+    first.exception_handlers[0](EOFError(), None)
+    assert bot.connected.wait(1)
+    bot.connection.receive(Join())
+    supervisor.stop()
+    supervisor.scheduler.stop()
+
+    assert bot.connection is not first
+    assert bot.logins == 0 and bot.registrations == 2
+    stats = supervisor.stats.as_dict()
+    assert (stats["disconnects"], stats["reconnects"]) == (1, 1)
+    assert stats["last_latency"] is not None
+
+
+def test_failed_connects_are_retried():
+    bot = FlakyBot(failures=3)
+    supervisor = supervise(bot)
+
+    assert not supervisor.start()
+    assert bot.connected.wait(1)
+    supervisor.stop()
+    supervisor.scheduler.stop()
+
+    assert supervisor.stats.attempts == 4
+    assert supervisor.stats.failures == 3
@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+
+from trashbags.movement import TICK
+from trashbags.scheduler import Task
+from trashbags.ticks import LagMonitor, TickLoop
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.tasks = []
+
+    def start(self):
+        return self
+
+    def call_every(self, interval, func, *args, delay=None):
+        self.tasks.append((interval, func))
+        return Task(0.0, len(self.tasks), func, args, interval)
+
+
+@pytest.fixture
+def loop(clock):
+    return TickLoop(FakeScheduler(), clock=clock).start()
+
+
+def run_ticks(loop, clock, count):
+    for _ in range(count):
+        loop.tick()
+        clock.now += TICK
+
+
+def test_runs_on_the_scheduler(loop):
+    assert loop.scheduler.tasks == [(TICK, loop.tick)]
+    assert loop.start() is loop and len(loop.scheduler.tasks) == 1
+
+
+def test_jobs_run_every_few_ticks(loop, clock):
+    calls = []
+    loop.call_every(TICK, calls.append, "move")
+    loop.call_every(0.25, calls.append, "check")
+    run_ticks(loop, clock, 10)
+
+    assert calls.count("move") == 10
+    assert calls.count("check") == 2
+    # Jobs that cannot wait run first
+    assert calls[:2] == ["move", "check"]
+
+
+def test_late_ticks_are_skipped_not_repeated(loop, clock):
+    calls = []
+    loop.call_every(TICK, calls.append, "move")
+    run_ticks(loop, clock, 2)
+    clock.now += 3 * TICK
+    run_ticks(loop, clock, 1)
+
+    assert len(calls) == 3
+    assert loop.number == 5
+    assert loop.stats.skipped == 3 and loop.stats.ticks == 3
+
+
+def test_deferrable_jobs_wait_when_over_budget(loop, clock):
+    calls = []
+    slow = [True]
+
+    def physics():
+        calls.append("physics")
+        if slow[0]:
+            clock.now += TICK * 1.5
+
+    loop.call_every(TICK, physics)
+    loop.call_every(TICK, calls.append, "entities", deferrable=True)
+    for _ in range(3):
+        loop.tick()
+        clock.now += TICK
+    slow[0] = False
+    clock.now = round(clock.now / TICK) * TICK
+    loop.tick()
+
+    assert calls == ["physics"] * 3 + ["physics", "entities"]
+    assert loop.stats.deferred == 3
+    assert loop.stats.overruns == 3
+    assert loop.stats.as_dict()["duration"]["count"] == 4
+
+
+def test_cancelled_jobs_are_dropped(loop, clock):
+    calls = []
+    task = loop.call_every(TICK, calls.append, "move")
+    run_ticks(loop, clock, 1)
+    task.cancel()
+    run_ticks(loop, clock, 2)
+    assert calls == ["move"]
+    assert loop._tasks == []
+
+
+def test_failing_jobs_do_not_stop_the_tick(loop, clock):
+    calls = []
+    loop.call_every(TICK, lambda: 1 / 0)
+    loop.call_every(TICK, calls.append, "move")
+    run_ticks(loop, clock, 1)
+    assert calls == ["move"]
+
+
+def test_lag_monitor(clock):
+    lag = LagMonitor(smoothing=0.5, clock=clock)
+    lag.time_update(1000)
+    assert lag.tps is None
+    clock.now = 1.0
+    lag.time_update(1020)
+    assert lag.tps == pytest.approx(20.0)
+    clock.now = 2.0
+    lag.time_update(1030)
+    assert lag.tps == pytest.approx(15.0)
+
+    lag.keep_alive(5000)
+    clock.now = 17.25
+    lag.keep_alive(20000)
+    assert lag.keep_alive_delay == pytest.approx(0.25)
+
+    lag.latency(42)
+    assert lag.as_dict() == {
+        "tps": pytest.approx(15.0),
+        "rtt": 0.042,
+        "keep_alive_delay": pytest.approx(0.25),
+    }
+
+    lag.reset()
+    assert lag.as_dict() == {"tps": None, "rtt": None, "keep_alive_delay": None}
+
+
+def test_ticks_run_on_their_own_thread():
+    loop = TickLoop().start()
+    ran = threading.Event()
+    names = []
+    loop.call_every(TICK, lambda: names.append(threading.current_thread().name))
+    loop.call_every(TICK, ran.set)
+    try:
+        assert ran.wait(2)
+    finally:
+        loop.stop()
+
+    assert names[0] == "trashbags-ticks"
+    assert not loop.scheduler.running
@@ -0,0 +1,124 @@
+import struct
+
+import pytest
+
+from trashbags.capture import encode_varint
+from trashbags.world import (
+    AIR,
+    WorldCache,
+    decode_chunk,
+    decode_position,
+    encode_chunk,
+    pack_entries,
+    unpack_entries,
+)
+
+__author__ = "Targeted Entropy"
+__copyright__ = "Targeted Entropy"
+__license__ = "MPL-2.0"
+
+# NumPy is the optional numpy extra
+np = pytest.importorskip("numpy")
+
+STONE = 1 << 4
+DIRT = 3 << 4
+GRASS = 2 << 4
+DIAMOND_ORE = 56 << 4
+
+
+def terrain(ore=None):
+    """A section of stone, dirt and grass, as states in y, z, x order."""
+    states = np.full((16, 16, 16), STONE, dtype=np.uint32)
+    states[13:15] = DIRT
+    states[15] = GRASS
+    if ore is not None:
+        x, y, z = ore
+        states[y, z, x] = DIAMOND_ORE
+    return states
+
+
+def encode_position(x, y, z):
+    return ((x & 0x3FFFFFF) << 38) | ((y & 0xFFF) << 26) | (z & 0x3FFFFFF)
+
+
+@pytest.mark.parametrize("bits", [4, 5, 13, 14])
+def test_entries_round_trip_across_long_boundaries(bits):
+    values = np.random.default_rng(bits).integers(0, 1 << bits, 4096)
+
+    assert (unpack_entries(pack_entries(values, bits), bits) == values).all()
+
+
+def test_local_and_global_palettes_decode():
+    noisy = np.arange(4096, dtype=np.uint32).reshape(16, 16, 16) % 300 << 4
+    payload = encode_chunk(-2, 5, {3: terrain(ore=(1, 2, 3)), 4: noisy})
+
+    chunk_x, chunk_z, full, sections = decode_chunk(payload)
+    assert (chunk_x, chunk_z, full) == (-2, 5, True)
+    assert sorted(sections) == [3, 4]
+    assert len(sections[3].palette) == 4
+    assert sections[3].blocks.dtype == np.uint8
+    assert sections[3].get(1, 2, 3) == DIAMOND_ORE
+    assert (sections[4].states() == noisy).all()
+    assert sections[4].blocks.dtype == np.uint16
+
+
+def test_world_queries():
+    world = WorldCache()
+    world.load(encode_chunk(0, 0, {0: terrain(), 1: terrain(ore=(4, 2, 4))}))
+    world.load(encode_chunk(1, 0, {0: terrain(ore=(0, 5, 0))}))
+
+    assert world.block_at(20, 1, 3) == STONE
+    assert world.block_at(3, 200, 3) == AIR
+    assert world.block_at(40, 1, 3) is None
+    heights = world.column_heights(1, 0)
+    assert heights.shape == (16, 16) and (heights == 15).all()
+    assert (world.column_heights(0, 0) == 31).all()
+
+    ores = world.find_blocks([56], (0, 10, 0), 20)
+    assert ores.tolist() == [[4, 18, 4], [16, 5, 0]]
+    assert world.find_blocks([56], (0, 10, 0), 5).tolist() == []
+
+
+def test_block_changes():
+    world = WorldCache()
+    world.load(encode_chunk(-1, 0, {0: terrain()}))
+
+    change = struct.pack(">Q", encode_position(-1, 40, 2)) + encode_varint(DIRT)
+    world.apply_block_change(change)
+    multi = struct.pack(">ii", -1, 0) + encode_varint(2)
+    multi += bytes((0xF2, 0)) + encode_varint(AIR)
+    multi += bytes((0x00, 15)) + encode_varint(DIAMOND_ORE)
+    world.apply_multi_block_change(multi)
+
+    assert decode_position(encode_position(-1, 40, 2)) == (-1, 40, 2)
+    assert world.block_at(-1, 40, 2) == DIRT
+    assert world.block_at(-1, 0, 2) == AIR
+    assert world.block_at(-16, 15, 0) == DIAMOND_ORE
+    assert world.chunk(-1, 0).version == 4
+
+    world.apply_unload(struct.pack(">ii", -1, 0))
+    assert world.block_at(-1, 0, 2) is None
+    assert world.nbytes == 0
+
+
+def test_farthest_chunks_are_evicted_first():
+    position = [0, 64, 0]
+    world = WorldCache(center=lambda: position)
+    payload = encode_chunk(0, 0, {0: terrain()})
+    world.max_bytes = world.load(payload).nbytes * 3
+
+    for chunk_x in (5, -1, 9):
+        world.load(encode_chunk(chunk_x, 0, {0: terrain()}))
+
+    assert sorted(world.chunks) == [(-1, 0), (0, 0), (5, 0)]
+    assert world.evicted == 1
+    assert world.nbytes <= world.max_bytes
+
+
+def test_partial_chunk_updates_sections():
+    world = WorldCache()
+    world.load(encode_chunk(0, 0, {0: terrain()}))
+    world.load(encode_chunk(0, 0, {2: terrain(ore=(0, 0, 0))}, full=False))
+
+    assert world.block_at(0, 1, 0) == STONE
+    assert world.block_at(0, 32, 0) == DIAMOND_ORE